@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from typing import Dict, Hashable, Set
+
+# Key of ``notify_all``: wakes every waiter of the loop
+_ALL = object()
+
+
+class LoopSignal:
+    """Wakes coroutines of one event loop from any thread.
+
+    The threaded parts of the backend (frame grabbers, the automation
+    engine) change state under a ``threading`` lock; coroutines waiting for
+    such a change register a future under that same lock with ``waiter``
+    after checking the state, so a change can not slip in between. Notifies
+    from other threads are coalesced: however many arrive before the loop
+    runs again, the loop is woken once.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self._lock = threading.Lock()
+        # Keys notified since the loop last woke up
+        self._pending: Set[Hashable] = set()
+        # Only touched on the loop's thread
+        self._waiters: Dict[Hashable, Set[asyncio.Future]] = {}
+
+    def waiter(self, key: Hashable = None) -> asyncio.Future:
+        """A future resolved by the next ``notify(key)``; call on the loop's thread."""
+        future = self.loop.create_future()
+        self._waiters.setdefault(key, set()).add(future)
+        return future
+
+    async def wait(self, future: asyncio.Future, timeout: float, key: Hashable = None) -> bool:
+        """Wait for a future from ``waiter``; returns False on timeout."""
+        try:
+            done, _ = await asyncio.wait((future,), timeout=max(timeout, 0.0))
+            return bool(done)
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[key]
+
+    def notify(self, key: Hashable = None):
+        """Resolve the waiters of ``key``; safe to call from any thread."""
+        with self._lock:
+            schedule = not self._pending
+            self._pending.add(key)
+        if schedule:
+            try:
+                self.loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass  # The loop was closed; nobody is waiting any more
+
+    def notify_all(self):
+        self.notify(_ALL)
+
+    def _wake(self):
+        with self._lock:
+            keys, self._pending = self._pending, set()
+        if _ALL in keys:
+            keys = list(self._waiters)
+        for key in keys:
+            for future in self._waiters.pop(key, ()):
+                if not future.done():
+                    future.set_result(None)
+
+
+def loop_signal(signals: Dict[asyncio.AbstractEventLoop, LoopSignal]) -> LoopSignal:
+    """The signal of the running loop in ``signals``, created on first use; call with the owner's lock held."""
+    loop = asyncio.get_running_loop()
+    signal = signals.get(loop)
+    if signal is None:
+        for closed in [other for other in signals if other.is_closed()]:
+            del signals[closed]
+        signal = signals[loop] = LoopSignal(loop)
+    return signal
@@ -1,18 +1,63 @@
+import json
 import os
-from datetime import datetime
-from flask import Flask, request, jsonify, Response
+import time
+from datetime import datetime, timezone
+from flask import Flask, g, request, jsonify, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from camera import camera_service
+from connection import IDLE, LIVE, CameraHealth
+from decode import CameraSource
+from streaming import StreamProfile
+from automation import AutomationEngine
+from occupancy import OccupancyEstimator
+from metrics import REGISTRY, SamplingProfiler, counter, histogram, time_commits
+from device_cache import DeviceStatusCache
+from device_events import DeviceEventHub, status_version
+from timeseries import TimeSeriesStore
+from device_bulk import parse_settings, update_matching, upsert_devices
+from summary import BuildingSummary
+from storage import database_url, engine_options, ensure_schema, install_pragmas
+from cluster import Cluster, ClusterState, create_lease_store, default_node_id
+from remote_camera import RemoteFrames
+from snapshots import SnapshotCache
+from zones import CameraZones, resolve_zone, split_zone
 
 app = Flask(__name__)
 CORS(app)
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'ai-hackathon.db')}"
+# SQLite file by default; set DATABASE_URL (e.g. postgresql://...) for a pooled server database
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url(os.path.join(basedir, 'ai-hackathon.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
+with app.app_context():
+    # WAL, busy timeout and cache pragmas on every SQLite connection
+    install_pragmas(db.engine)
+
+# Prometheus-style metrics on /metrics; the hot paths of the camera service record their own
+REQUESTS = counter('http_requests_total', 'Requests by route and status', ('method', 'endpoint', 'status'))
+REQUEST_SECONDS = histogram('http_request_seconds', 'Time to produce a response (headers, for streams)',
+                            ('method', 'endpoint'))
+time_commits(histogram('db_commit_seconds', 'Time of a database session commit, flush included'))
+# Samples where a thread (by default the inference thread) spends its time; off until started
+profiler = SamplingProfiler()
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    # Registered first, so it runs after every other after_request hook
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, endpoint=endpoint)
+        REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    return response
 
 # Admin model
 class Admin(db.Model):
@@ -28,7 +73,15 @@ class Room(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String, nullable=False)
     live_camera = db.Column(db.String, nullable=False, default='')
-    building_id = db.Column(db.Integer, db.ForeignKey('building.id'), nullable=False)
+    building_id = db.Column(db.Integer, db.ForeignKey('building.id'), nullable=False, index=True)
+    # Optional low-resolution sub-stream used for detection; live_camera is then only decoded for viewers
+    inference_camera = db.Column(db.String, nullable=True)
+    # JSON overrides of the decode options (reader, width, height, max_fps, keyframes_only, hwaccel)
+    camera_options = db.Column(db.Text, nullable=True)
+    # JSON list of further camera URLs covering the room; their counts are fused with live_camera's
+    extra_cameras = db.Column(db.Text, nullable=True)
+    # JSON list of named polygons on live_camera's picture (see zones.CameraZones), counted separately
+    camera_zones = db.Column(db.Text, nullable=True)
 
 # Device model
 class Device(db.Model):
@@ -38,26 +91,170 @@ class Device(db.Model):
     is_enabled = db.Column(db.Boolean, nullable=False, default=False)
     last_seen = db.Column(db.DateTime, nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)
-    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=True)
+    room_id = db.Column(db.Integer, db.ForeignKey('room.id'), nullable=True, index=True)
     persons_before_enabled = db.Column(db.Integer, nullable=True)
     delay_before_enabled = db.Column(db.Integer, nullable=True)
     # persons_before_disabled is kept for backward compatibility but not used in logic
     persons_before_disabled = db.Column(db.Integer, nullable=True)
     delay_before_disabled = db.Column(db.Integer, nullable=True)
     is_manual = db.Column(db.Boolean, nullable=False, default=False)
+    # Zone whose count drives the device instead of the room's: ``<room_id>:<zone>``, any room's camera
+    zone = db.Column(db.String(64), nullable=True)
 
-db_initialized = False
+# Cluster mode: who runs the scheduler and each camera (CLUSTER_MODE=db)
+class Lease(db.Model):
+    name = db.Column(db.String(128), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)
+
+# Cluster mode: each camera's latest count and frame ring, written by the worker that runs it
+class CameraState(db.Model):
+    camera_id = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    host = db.Column(db.String(255), nullable=False)
+    ring = db.Column(db.String(64), nullable=True)
+    person_count = db.Column(db.Integer, nullable=True)
+    last_update = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.Float, nullable=False)
+    state = db.Column(db.String(16), nullable=True)
+
+# Cluster mode: cameras viewers asked for, kept open by the cluster until ``until``
+class CameraDemand(db.Model):
+    camera_id = db.Column(db.String(64), primary_key=True)
+    until = db.Column(db.Float, nullable=False)
+
+# Cluster mode: device events relayed between workers, pruned after a few minutes
+class DeviceChange(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    origin = db.Column(db.String(128), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+
+# Multi-worker deployment (CLUSTER_MODE=db|file|local, default off): leases decide which worker
+# runs the scheduler and each camera, counts and device changes are shared through the database
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', 'off').lower()
+cluster = None
+cluster_state = None
+remote_frames = None
+# Person counts of every camera: this process's own, or in cluster mode also those of other workers
+camera_counts = camera_service
+
+def _camera_consumers():
+    """Cameras that must stay open: rooms with an automated device, in cluster mode also recently viewed ones."""
+    automated = (
+        Device.is_manual.is_(False),
+        Device.persons_before_enabled.isnot(None),
+        Device.delay_before_enabled.isnot(None),
+    )
+    wanted = Room.id.in_(db.select(Device.room_id).where(*automated))
+    if cluster_state is not None:
+        viewed = [int(camera_id) for camera_id in cluster_state.demanded_cameras() if camera_id.isdigit()]
+        wanted = db.or_(wanted, Room.id.in_(viewed))
+    with app.app_context():
+        # A device bound to a zone needs the camera of the zone's room, which may be another room
+        zoned = db.session.execute(
+            db.select(Device.zone).where(*automated, Device.zone.isnot(None)).distinct()
+        ).scalars()
+        wanted = db.or_(wanted, Room.id.in_({int(split_zone(key)[0]) for key in zoned}))
+        rows = db.session.execute(
+            db.select(Room.id, Room.live_camera, Room.inference_camera, Room.camera_options, Room.extra_cameras,
+                      Room.camera_zones)
+            .where(Room.live_camera != '', wanted)
+        ).all()
+    cameras = {}
+    for room_id, live_camera, inference_camera, camera_options, extra_cameras, camera_zones in rows:
+        cameras[str(room_id)] = _camera_source(live_camera, inference_camera, camera_options, camera_zones)
+        # Extra cameras are only counted, never viewed: ``<room>.<n>``, see OccupancyEstimator
+        for n, url in enumerate(json.loads(extra_cameras) if extra_cameras else [], start=1):
+            cameras[f"{room_id}.{n}"] = _camera_source(url, None, camera_options)
+    return cameras
+
+def _camera_source(live_camera, inference_camera=None, camera_options=None, camera_zones=None):
+    """A room's camera streams, with its decode overrides applied to the configured defaults."""
+    options = json.loads(camera_options) if camera_options else None
+    return CameraSource(live_camera, inference_camera or None, camera_service.decode_options.merged(options),
+                        CameraZones.parse(camera_zones))
+
+def _locate_ring(camera_id):
+    # Frame rings are shared memory, so only cameras run by a worker on this host can be viewed here
+    remote = cluster_state.remote_camera(camera_id)
+    if remote is None or remote.host != cluster_state.host:
+        return None
+    return remote.ring
+
+if CLUSTER_MODE != 'off':
+    node_id = default_node_id()
+    cluster = Cluster(
+        create_lease_store(CLUSTER_MODE, app, db, Lease), camera_service, _camera_consumers,
+        node_id=node_id,
+        role=os.environ.get('CLUSTER_ROLE', 'all').lower(),
+        ttl=float(os.environ.get('CLUSTER_LEASE_TTL', 15)),
+        max_cameras=int(os.environ.get('CLUSTER_MAX_CAMERAS', 0)),
+    )
+    cluster_state = ClusterState(app, db, CameraState, DeviceChange, CameraDemand, camera_service, node_id,
+                                 interval=float(os.environ.get('CLUSTER_SYNC_INTERVAL', 0.25)),
+                                 demand_ttl=camera_service.connection_policy.idle_grace,
+                                 live_nodes=lambda: cluster.live_nodes)
+    camera_counts = cluster_state
+    remote_frames = RemoteFrames(_locate_ring, camera_service.stream_profile)
+
+# Read-through status cache for the ESP32 polling endpoint
+device_cache = DeviceStatusCache(app, db, Device, flush_interval=float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', 10)))
+# Versioned state changes pushed to long-polling outlets and the dashboard's event stream
+device_events = DeviceEventHub()
+# Upper bound for ?wait= on the status endpoint, below typical proxy idle timeouts (served by asgi.py)
+STATUS_LONG_POLL_MAX = float(os.environ.get('STATUS_LONG_POLL_MAX', 30))
+# Upper bound under WSGI, where a waiting poll holds one of the server's threads
+STATUS_LONG_POLL_WSGI_MAX = float(os.environ.get('STATUS_LONG_POLL_WSGI_MAX', 1))
+# Stable per-room counts: tracked per camera, fused across a room's cameras and smoothed over time
+occupancy = OccupancyEstimator(camera_counts, camera_service.occupancy_policy, logger=app.logger)
+# Dashboard room/device counts, cached briefly and served with an ETag
+building_summary = BuildingSummary(db, Building, Room, Device, occupancy,
+                                   online_window=float(os.environ.get('DEVICE_ONLINE_WINDOW', 60)),
+                                   ttl=float(os.environ.get('SUMMARY_CACHE_TTL', 2)))
+# Small cached camera previews for overview pages, remade at most every SNAPSHOT_REFRESH seconds
+snapshots = SnapshotCache(width=int(os.environ.get('SNAPSHOT_WIDTH', 320)),
+                          quality=int(os.environ.get('SNAPSHOT_QUALITY', 70)),
+                          refresh=float(os.environ.get('SNAPSHOT_REFRESH', 5)),
+                          max_bytes=int(float(os.environ.get('SNAPSHOT_CACHE_MB', 8)) * 1024 * 1024))
+# Occupancy and device on/off history with 1m/15m/1h rollups
+timeseries = TimeSeriesStore(
+    os.environ.get('TIMESERIES_DIR', os.path.join(basedir, 'timeseries')),
+    raw_retention_days=float(os.environ.get('TIMESERIES_RAW_RETENTION_DAYS', 7)),
+    minute_retention_days=float(os.environ.get('TIMESERIES_MINUTE_RETENTION_DAYS', 30)),
+)
 
-@app.before_request
 def initialize_database():
-    global db_initialized
-    if not db_initialized:
-        db.create_all()
-        if not Admin.query.filter_by(username='admin').first():
-            new_admin = Admin(username='admin', password='admin')
-            db.session.add(new_admin)
-            db.session.commit()
-        db_initialized = True
+    """Create tables and indexes and the default admin; runs once at startup."""
+    ensure_schema(db)
+    if not Admin.query.filter_by(username='admin').first():
+        new_admin = Admin(username='admin', password='admin')
+        db.session.add(new_admin)
+        db.session.commit()
+
+with app.app_context():
+    initialize_database()
+
+@app.after_request
+def invalidate_summaries(response):
+    # Any successful write may change room/device counts shown by the summary endpoint
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        building_summary.invalidate()
+    return response
+
+def _open_automated_cameras():
+    """Keep exactly the cameras of rooms with automated devices open.
+
+    Called after every write that can change which cameras that is (rooms'
+    cameras, devices' automation settings, rooms or zones). In cluster mode
+    the workers' lease rounds do this instead.
+    """
+    if cluster is not None:
+        return
+    try:
+        camera_service.set_consumers('automation', _camera_consumers())
+    except Exception as e:
+        app.logger.error(f"Error updating camera consumers: {e}")
 
 # Device status check endpoint - used by ESP32 to check its status
 @app.route('/api/device/status', methods=['GET'])
@@ -67,39 +264,34 @@ def get_device_status():
         return jsonify([]), 200  # Return empty array if no hardware_id provided
     
     try:
-        # Convert hardware_id to string for comparison
-        hardware_id = str(hardware_id)
-        
-        # Find device by hardware_id
-        device = db.session.execute(
-            db.select(Device).filter_by(hardware_id=hardware_id)
-        ).scalar_one_or_none()
-        
-        if not device:
+        # Served from the in-memory cache; the database is only hit on a miss
+        device = device_cache.get(str(hardware_id))
+        if device is None:
             return jsonify([]), 200  # Return empty array if device not found
-            
-        # Update last seen timestamp
-        device.last_seen = datetime.utcnow()
-        
-        # Update IP address if available
-        if request.remote_addr:
-            device.ip_address = request.remote_addr
-            
-        db.session.commit()
-        
+
+        # last_seen/ip_address are batched and flushed to the database periodically
+        device_cache.heartbeat(device['id'], request.remote_addr)
+
+        # Long poll: with ?wait=<s>&version=<n>, hold the request while the state still has version n.
+        # Versions are hashes of the payload, so any worker can answer a poll started on another one.
+        # Each waiting poll holds a thread here, so only asgi.py waits for as long as asked
+        wait = request.args.get('wait', type=float)
+        known_version = request.args.get('version', type=int)
+        deadline = time.monotonic() + min(wait or 0, STATUS_LONG_POLL_WSGI_MAX)
+        while True:
+            # Take the tick before reading the state: a change in between ends the wait at once
+            tick = device_events.tick(device['id'])
+            device = device_cache.get(str(hardware_id))
+            if device is None:
+                return jsonify([]), 200  # Deleted while we were waiting
+            version = status_version(device)
+            remaining = deadline - time.monotonic()
+            if version != known_version or remaining <= 0:
+                break
+            device_events.wait_for_change(device['id'], tick, remaining)
+
         # Return device information in the expected format
-        return jsonify([{
-            'id': device.id,
-            'hardware_id': device.hardware_id,
-            'name': device.name,
-            'is_enabled': device.is_enabled,
-            'persons_before_enabled': device.persons_before_enabled or 0,
-            'delay_before_enabled': device.delay_before_enabled or 0,
-            'persons_before_disabled': device.persons_before_disabled or 0,
-            'delay_before_disabled': device.delay_before_disabled or 0,
-            'room_id': device.room_id,
-            'is_manual': device.is_manual
-        }])
+        return jsonify([dict(device, version=version)])
         
     except Exception as e:
         app.logger.error(f"Error in get_device_status: {str(e)}")
@@ -139,6 +331,27 @@ def get_buildings():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+@app.route('/api/buildings/summary', methods=['GET'])
+@app.route('/api/buildings/<int:building_id>/summary', methods=['GET'])
+def get_building_summary(building_id=None):
+    """Rooms with device, enabled, online and person counts for one or all buildings.
+
+    Supports conditional GET: clients sending the previous ETag in
+    If-None-Match get an empty 304 while nothing changed.
+    """
+    try:
+        payload, etag = building_summary.get(building_id)
+        if building_id is not None and not payload['buildings']:
+            return jsonify({'success': False, 'message': 'Building not found'}), 404
+        response = jsonify(payload)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        app.logger.error(f"Error building summary: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @app.route('/api/buildings', methods=['POST'])
 def add_building():
     try:
@@ -209,6 +422,7 @@ def handle_building(building_id):
             # Then delete the building
             db.session.delete(building)
             db.session.commit()
+            _open_automated_cameras()
             
             return jsonify({
                 'success': True,
@@ -232,6 +446,42 @@ def get_rooms(building_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
     
+def _camera_fields(data):
+    """Validated ``inference_camera`` / ``camera_options`` / ``extra_cameras`` / ``camera_zones`` of a room request, for the keys present."""
+    fields = {}
+    if 'inference_camera' in data:
+        fields['inference_camera'] = data['inference_camera'] or None
+    if 'camera_options' in data:
+        options = data['camera_options'] or None
+        if options is not None and not isinstance(options, dict):
+            raise ValueError('camera_options must be an object')
+        camera_service.decode_options.merged(options)
+        fields['camera_options'] = json.dumps(options) if options else None
+    if 'extra_cameras' in data:
+        extra = data['extra_cameras'] or None
+        if extra is not None and not (isinstance(extra, list) and all(isinstance(url, str) and url for url in extra)):
+            raise ValueError('extra_cameras must be a list of camera URLs')
+        fields['extra_cameras'] = json.dumps(extra) if extra else None
+    if 'camera_zones' in data:
+        zones = CameraZones.parse(data['camera_zones'] or None)
+        fields['camera_zones'] = json.dumps(zones.to_json()) if zones else None
+    return fields
+
+def _room_camera(room):
+    return {
+        'inference_camera': room.inference_camera,
+        'camera_options': json.loads(room.camera_options) if room.camera_options else None,
+        'extra_cameras': json.loads(room.extra_cameras) if room.extra_cameras else [],
+        'camera_zones': json.loads(room.camera_zones) if room.camera_zones else [],
+    }
+
+def _device_zone(value, room_id):
+    """The zone key a device request binds to: ``"desk"`` for its own room's camera, ``"12:desk"`` for room 12's."""
+    def zones_of(owner):
+        room = db.session.get(Room, int(owner))
+        return CameraZones.parse(room.camera_zones) if room is not None else None
+    return resolve_zone(value, room_id, zones_of)
+
 @app.route('/api/buildings/<int:building_id>/rooms', methods=['POST'])
 def add_room(building_id):
     try:
@@ -241,16 +491,20 @@ def add_room(building_id):
 
         if not name:
             return jsonify({'success': False, 'message': 'Room name is required'}), 400
+        try:
+            camera_fields = _camera_fields(data)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
         building = Building.query.get(building_id)
         if not building:
             return jsonify({'success': False, 'message': 'Building not found'}), 404
         
-        new_room = Room(name=name, live_camera=live_camera, building_id=building_id)
+        new_room = Room(name=name, live_camera=live_camera, building_id=building_id, **camera_fields)
         db.session.add(new_room)
         db.session.commit()
 
-        return jsonify({'success': True, 'message': 'Room added successfully', 'room': {'id': new_room.id, 'name': new_room.name, 'live_camera': new_room.live_camera}}), 201
+        return jsonify({'success': True, 'message': 'Room added successfully', 'room': {'id': new_room.id, 'name': new_room.name, 'live_camera': new_room.live_camera, **_room_camera(new_room)}}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -268,6 +522,10 @@ def handle_room(room_id):
 
         if not name:
             return jsonify({'error': 'Room name is required'}), 400
+        try:
+            camera_fields = _camera_fields(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         try:
             room = Room.query.get(room_id)
@@ -276,7 +534,10 @@ def handle_room(room_id):
 
             room.name = name
             room.live_camera = live_camera
+            for field, value in camera_fields.items():
+                setattr(room, field, value)
             db.session.commit()
+            _open_automated_cameras()
             
             return jsonify({
                 'success': True,
@@ -285,7 +546,8 @@ def handle_room(room_id):
                     'id': room.id,
                     'name': room.name,
                     'live_camera': room.live_camera,
-                    'building_id': room.building_id
+                    'building_id': room.building_id,
+                    **_room_camera(room)
                 }
             }), 200
         except Exception as e:
@@ -300,11 +562,16 @@ def handle_room(room_id):
                 return jsonify({'success': False, 'message': 'Room not found'}), 404
             
             # First delete all devices in the room
+            device_ids = [d.id for d in Device.query.filter_by(room_id=room_id).all()]
             Device.query.filter_by(room_id=room_id).delete()
             
             # Then delete the room
             db.session.delete(room)
             db.session.commit()
+            automation.refresh_room(room_id)
+            _open_automated_cameras()
+            device_cache.invalidate()
+            device_events.publish_room(room_id, device_ids)
             
             return jsonify({
                 'success': True,
@@ -333,6 +600,7 @@ def get_devices(room_id):
             'persons_before_disabled': d.persons_before_disabled,
             'delay_before_disabled': d.delay_before_disabled,
             'room_id': d.room_id,
+            'zone': d.zone,
             'is_manual': d.is_manual
         } for d in devices]
 
@@ -377,12 +645,17 @@ def add_device(room_id):
             persons_before_disabled=int(data.get('persons_before_disabled', 0)) if data.get('persons_before_disabled') is not None else None,
             delay_before_disabled=int(data.get('delay_before_disabled', 5)) if data.get('delay_before_disabled') is not None else None,
             room_id=room_id,
+            zone=_device_zone(data.get('zone'), room_id),
             last_seen=datetime.utcnow(),
             is_manual=bool(data.get('is_manual', False))
         )
         
         db.session.add(new_device)
         db.session.commit()
+        automation.refresh_device(new_device.id)
+        _open_automated_cameras()
+        device_cache.invalidate(hardware_id=new_device.hardware_id)
+        device_events.publish_room(room_id, [new_device.id])
         
         # Prepare response
         device_data = {
@@ -395,6 +668,7 @@ def add_device(room_id):
             'persons_before_disabled': new_device.persons_before_disabled,
             'delay_before_disabled': new_device.delay_before_disabled,
             'room_id': new_device.room_id,
+            'zone': new_device.zone,
             'last_seen': new_device.last_seen.isoformat() if new_device.last_seen else None,
             'ip_address': new_device.ip_address,
             'is_manual': new_device.is_manual
@@ -429,6 +703,8 @@ def update_device(device_id):
                 'message': 'Device not found'
             }), 404
         
+        previous_room_id = device.room_id
+
         # Check if room exists if room_id is being updated
         if 'room_id' in data and data['room_id'] is not None:
             room = db.session.get(Room, data['room_id'])
@@ -448,6 +724,8 @@ def update_device(device_id):
             device.is_enabled = bool(data['is_enabled'])
         if 'is_manual' in data:
             device.is_manual = bool(data['is_manual'])
+        if 'zone' in data:
+            device.zone = _device_zone(data['zone'], device.room_id)
         
         # Update optional fields if they exist in the request
         optional_fields = [
@@ -465,6 +743,13 @@ def update_device(device_id):
         device.last_seen = datetime.utcnow()
         
         db.session.commit()
+        automation.refresh_device(device.id)
+        _open_automated_cameras()
+        device_cache.invalidate(device_id=device.id, hardware_id=device.hardware_id)
+        if device.room_id != previous_room_id:
+            device_events.publish_room(previous_room_id, [])
+        device_events.publish(device.id, device.room_id, is_enabled=device.is_enabled,
+                              is_manual=device.is_manual)
         
         # Prepare the response
         updated_device = {
@@ -473,6 +758,7 @@ def update_device(device_id):
             'name': device.name,
             'is_enabled': device.is_enabled,
             'room_id': device.room_id,
+            'zone': device.zone,
             'persons_before_enabled': device.persons_before_enabled,
             'delay_before_enabled': device.delay_before_enabled,
             'persons_before_disabled': device.persons_before_disabled,
@@ -510,8 +796,13 @@ def delete_device(device_id):
         if not device:
             return jsonify({'success': False, 'message': 'Device not found'}), 404
         
+        room_id = device.room_id
         db.session.delete(device)
         db.session.commit()
+        automation.refresh_device(device_id)
+        _open_automated_cameras()
+        device_cache.invalidate(device_id=device_id)
+        device_events.publish_room(room_id, [device_id])
         
         return jsonify({'success': True, 'message': 'Device deleted successfully'}), 200
         
@@ -519,6 +810,110 @@ def delete_device(device_id):
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _propagate_bulk(result):
+    """Push a committed bulk write to the automation engine, status cache and event stream."""
+    device_ids = result.created_ids + result.updated_ids
+    if not device_ids:
+        return
+    automation.refresh_devices(device_ids)
+    _open_automated_cameras()
+    device_cache.invalidate()
+    created = set(result.created_ids)
+    created_by_room = {}
+    rows = []
+    for i in range(0, len(device_ids), 500):
+        rows.extend(db.session.execute(
+            db.select(Device.id, Device.room_id, Device.is_enabled, Device.is_manual)
+            .where(Device.id.in_(device_ids[i:i + 500]))
+        ).all())
+    for device_id, room_id, is_enabled, is_manual in rows:
+        if device_id in created:
+            created_by_room.setdefault(room_id, []).append(device_id)
+        else:
+            device_events.publish(device_id, room_id, is_enabled=is_enabled, is_manual=is_manual)
+    for room_id in result.room_ids:
+        device_events.publish_room(room_id, created_by_room.get(room_id, []))
+
+def _bulk_summary(report):
+    summary = {}
+    for entry in report:
+        summary[entry['status']] = summary.get(entry['status'], 0) + 1
+    return summary
+
+@app.route('/api/devices/bulk', methods=['POST'])
+def bulk_upsert_devices():
+    """Create or update many devices by hardware_id in one transaction.
+
+    Body: ``{"room_id": <default room>, "devices": [{"hardware_id": ..., "name": ..., ...}]}``.
+    Invalid items are reported and skipped; the rest are committed together.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('devices'), list):
+        return jsonify({'success': False, 'message': 'Body must contain a "devices" list'}), 400
+
+    try:
+        result = upsert_devices(db, Device, Room, data['devices'], default_room_id=data.get('room_id'))
+        db.session.commit()
+    except (TypeError, ValueError) as ve:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Invalid data format: {str(ve)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error in bulk device upsert: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to save devices: {str(e)}'}), 500
+
+    _propagate_bulk(result)
+    summary = _bulk_summary(result.report)
+    return jsonify({
+        'success': not summary.get('error'),
+        'summary': summary,
+        'results': result.report
+    }), 200
+
+@app.route('/api/devices/bulk', methods=['PUT'])
+def bulk_update_devices():
+    """Set state/automation fields on every device matching a filter with one UPDATE.
+
+    Body: ``{"filter": {"building_id" | "room_id" | "device_ids": ...}, "set": {"is_enabled": false, ...}}``.
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('filter'), dict) or not isinstance(data.get('set'), dict):
+        return jsonify({'success': False, 'message': 'Body must contain "filter" and "set" objects'}), 400
+
+    try:
+        values = parse_settings(data['set'])
+        result = update_matching(db, Device, Room, data['filter'], values)
+        db.session.commit()
+    except (TypeError, ValueError) as ve:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Invalid data format: {str(ve)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error in bulk device update: {str(e)}")
+        return jsonify({'success': False, 'message': f'Failed to update devices: {str(e)}'}), 500
+
+    _propagate_bulk(result)
+    return jsonify({
+        'success': True,
+        'summary': _bulk_summary(result.report),
+        'results': result.report
+    }), 200
+
+def _frame_source(room):
+    """Where this worker gets a room's frames: the camera service, the remote reader, or None.
+
+    Asking counts as a viewer: the camera is opened (in the background) if it is not yet.
+    """
+    camera_id = str(room.id)
+    if cluster is None:
+        source = _camera_source(room.live_camera, room.inference_camera, room.camera_options, room.camera_zones)
+        return camera_service if camera_service.add_camera(camera_id, source) else None
+    # In cluster mode cameras are opened by the worker holding their lease, once it sees the demand
+    cluster_state.request_camera(camera_id)
+    if cluster.owns_camera(camera_id):
+        return camera_service
+    return remote_frames if _locate_ring(camera_id) is not None else None
+
 @app.route('/api/camera/feed/<int:room_id>')
 def camera_feed(room_id):
     """Video streaming route. Put this in the src attribute of an img tag."""
@@ -526,14 +921,27 @@ def camera_feed(room_id):
     if not room or not room.live_camera:
         return jsonify({'error': 'Camera not found or not configured'}), 404
     
-    # Add camera if not already added
-    camera_service.add_camera(str(room_id), room.live_camera)
-    
+    source = _frame_source(room)
+    if source is None:
+        return jsonify({'error': 'Camera unavailable'}), 503
+
+    # Optional per-viewer encoding: ?quality=70&fps=10&width=640
+    defaults = camera_service.stream_profile
+    try:
+        profile = StreamProfile.clamped(
+            request.args.get('quality', defaults.quality),
+            request.args.get('fps', defaults.max_fps),
+            request.args.get('width', defaults.width),
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid stream parameters'}), 400
+
+    frames = source.stream_frames(str(room_id), profile)
+    if frames is None:
+        return jsonify({'error': 'Camera not found or not configured'}), 404
+
     def generate():
-        while True:
-            frame = camera_service.get_frame(str(room_id))
-            if frame is None:
-                break
+        for frame in frames:
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
     
@@ -542,87 +950,283 @@ def camera_feed(room_id):
 
 @app.route('/api/camera/status/<int:room_id>')
 def camera_status(room_id):
-    """Check if camera is available."""
+    """Check if camera is available, from the health its grab thread keeps; never opens the camera."""
     room = Room.query.get(room_id)
     if not room or not room.live_camera:
         return jsonify({'available': False, 'message': 'Camera not configured'})
     
-    camera_service.add_camera(str(room_id), room.live_camera)
-    frame = camera_service.get_frame(str(room_id))
-    
+    health = _camera_health(str(room_id))
     return jsonify({
-        'available': frame is not None,
+        'available': health is not None and health.state == LIVE,
+        'state': health.state if health is not None else IDLE,
         'has_camera': True,
         'camera_url': room.live_camera
     })
 
+@app.route('/api/camera/snapshot/<int:room_id>')
+def camera_snapshot(room_id):
+    """Small JPEG preview of a room's camera (SNAPSHOT_WIDTH), remade at most every SNAPSHOT_REFRESH seconds.
+
+    Supports conditional GET: clients sending the previous ETag in
+    If-None-Match get an empty 304 while the preview is unchanged. Made from
+    the newest grabbed frame of a camera that is already open; asking never
+    opens a camera or keeps one open, and gets an empty 204 while it is closed.
+    """
+    camera_id = str(room_id)
+    configured = True
+
+    def grab():
+        nonlocal configured
+        room = Room.query.get(room_id)
+        if not room or not room.live_camera:
+            configured = False
+            return None
+        frame = camera_service.get_raw_frame(camera_id)
+        if frame is None and remote_frames is not None:
+            frame = remote_frames.get_raw_frame(camera_id)
+        return frame
+
+    try:
+        snapshot = snapshots.get(camera_id, grab)
+    except Exception as e:
+        app.logger.error(f"Error making camera snapshot: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    if snapshot is None:
+        if not configured:
+            return jsonify({'error': 'Camera not found or not configured'}), 404
+        return Response(status=204)  # Closed, or no frame yet
+    response = Response(snapshot.data, mimetype='image/jpeg')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def _camera_health(camera_id):
+    """This worker's view of a camera's connection, or None if nobody runs it (yet)."""
+    health = camera_service.get_health(camera_id)
+    if health is None and cluster_state is not None:
+        remote = cluster_state.remote_camera(camera_id)
+        if remote is not None and remote.state is not None:
+            health = CameraHealth(remote.state, remote.updated_at, 0, remote.last_update, None)
+    return health
+
+@app.route('/api/camera/health', methods=['GET'])
+def camera_health():
+    """Connection state of every camera open in this worker."""
+    return jsonify({camera_id: health.to_dict() for camera_id, health in camera_service.get_camera_health().items()})
+
 # Person count API endpoint
 @app.route('/api/person_count/<camera_id>', methods=['GET'])
 def get_person_count(camera_id):
-    with camera_service.lock:
-        if camera_id not in camera_service.cameras:
-            return jsonify({"error": "Camera not found"}), 404
-        _, _, last_update, person_count = camera_service.cameras[camera_id]
+    state = camera_counts.get_camera_state(camera_id)
+    if state is None:
+        return jsonify({"error": "Camera not found"}), 404
+    person_count, last_update = state
+    return jsonify({
+        "camera_id": camera_id,
+        "person_count": person_count,
+        "last_update": last_update
+    })
+
+@app.route('/api/rooms/<int:room_id>/occupancy', methods=['GET'])
+def room_occupancy(room_id):
+    """Stable person count of a room, with its confidence and the count of each of its cameras."""
+    estimate = occupancy.get_occupancy(str(room_id))
+    if estimate is None:
+        return jsonify({'error': 'No count for this room yet'}), 404
+    return jsonify(estimate)
+
+@app.route('/api/camera/inference/stats', methods=['GET'])
+def inference_stats():
+    """Per-batch latency and frames/sec of the batched inference scheduler."""
+    return jsonify(camera_service.get_inference_stats())
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the API can serve requests; with ``?inference=1`` only once detection runs too."""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+    except Exception as e:
+        app.logger.error(f"Readiness check failed: {e}")
+        return jsonify({'ready': False, 'database': False}), 503
+    model = camera_service.get_model_status()
+    ready = model['ready'] or request.args.get('inference', '').lower() not in ('1', 'true', 'yes')
+    return jsonify({'ready': ready, 'database': True, 'inference': model}), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/profile', methods=['GET', 'POST', 'DELETE'])
+def sampling_profile():
+    """Sample a thread's stacks: POST ``{"thread", "interval", "seconds"}`` starts, GET reports, DELETE stops."""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.start(str(data.get('thread', 'camera-inference')), float(data.get('interval', 0.005)),
+                           float(data.get('seconds', 30)))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+    elif request.method == 'DELETE':
+        profiler.stop()
+    return jsonify(profiler.report(limit=request.args.get('limit', 50, type=int)))
+
+@app.route('/api/cluster/status', methods=['GET'])
+def cluster_status():
+    """This worker's role, leadership and cameras in cluster mode."""
+    if cluster is None:
+        return jsonify({'mode': 'off'})
+    return jsonify(dict(cluster.get_stats(), **cluster_state.get_stats(), mode=CLUSTER_MODE))
+
+@app.route('/api/events/devices', methods=['GET'])
+def device_event_stream():
+    """Server-sent events for device changes, optionally limited to ``?room_id=``."""
+    room_id = request.args.get('room_id', type=int)
+    return Response(device_events.subscribe(room_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/events/stats', methods=['GET'])
+def device_event_stats():
+    return jsonify(device_events.get_stats())
+
+def _parse_time(value, default: float) -> float:
+    """Accept epoch seconds or an ISO 8601 timestamp (UTC if no offset is given)."""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+def _time_range():
+    end = _parse_time(request.args.get('end'), time.time())
+    start = _parse_time(request.args.get('start'), end - 86400)
+    return start, end, request.args.get('resolution')
+
+@app.route('/api/timeseries/rooms/<int:room_id>/occupancy', methods=['GET'])
+def room_occupancy_history(room_id):
+    """Person count of a room over ``?start=&end=`` (default: last 24h)."""
+    try:
+        start, end, resolution = _time_range()
+        return jsonify(timeseries.query(f"room-{room_id}", start, end, resolution))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/timeseries/devices/<int:device_id>/state', methods=['GET'])
+def device_state_history(device_id):
+    """On/off history of a device; a bucket's ``mean`` is the fraction of time it was on."""
+    try:
+        start, end, resolution = _time_range()
+        return jsonify(timeseries.query(f"device-{device_id}", start, end, resolution))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/timeseries/buildings/<int:building_id>', methods=['GET'])
+def building_history(building_id):
+    """Total occupancy and device on-seconds per bucket across a building."""
+    try:
+        start, end, resolution = _time_range()
+        if resolution == 'raw':
+            return jsonify({'error': 'Building history is only available from rollups'}), 400
+        room_ids = [r.id for r in Room.query.filter_by(building_id=building_id).all()]
+        device_ids = [d.id for d in Device.query.filter(Device.room_id.in_(room_ids)).all()] if room_ids else []
+        occupancy = timeseries.aggregate([f"room-{i}" for i in room_ids], start, end, resolution)
+        devices = timeseries.aggregate([f"device-{i}" for i in device_ids], start, end, resolution)
         return jsonify({
-            "camera_id": camera_id,
-            "person_count": person_count,
-            "last_update": last_update
+            'building_id': building_id,
+            'resolution': occupancy['resolution'],
+            'occupancy': {'t': occupancy['t'], 'persons': occupancy['total']},
+            'devices': {'t': devices['t'], 'on_seconds': devices['integral']},
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 # Add cleanup on app exit
 import atexit
 atexit.register(camera_service.cleanup)
 
-import threading
-import time
+# Event-driven device automation: reacts to the stable room counts pushed by the occupancy estimator
+automation = AutomationEngine(app, db, Device, occupancy)
+automation.add_change_listener(device_cache.apply_states)
+automation.add_change_listener(device_events.publish_states)
+automation.add_change_listener(lambda changes: building_summary.invalidate())
+
+def _record_history(event):
+    """Device event listener writing on/off history; deleted devices are recorded as off."""
+    if event['type'] == 'device':
+        if 'is_enabled' in event:
+            timeseries.record(f"device-{event['id']}", event['is_enabled'])
+        return
+    device_ids = event['device_ids']
+    if not device_ids:
+        return
+    with app.app_context():
+        states = dict(db.session.execute(
+            db.select(Device.id, Device.is_enabled).where(Device.id.in_(device_ids))
+        ).all())
+    for device_id in device_ids:
+        timeseries.record(f"device-{device_id}", states.get(device_id, False))
+
+def _start_leader_services():
+    """Automation and history recording run in exactly one process: the scheduler leader."""
+    with app.app_context():
+        # Devices keep their state across restarts; start their history from it
+        timeseries.seed({f"device-{d.id}": d.is_enabled for d in Device.query.all()})
+    device_events.add_listener(_record_history)
+    occupancy.add_count_listener(timeseries.on_count)
+    timeseries.start()
+    automation.start()
+    if cluster_state is not None:
+        cluster_state.prune_log = True
+
+def _stop_leader_services():
+    if cluster_state is not None:
+        cluster_state.prune_log = False
+    automation.stop()
+    occupancy.remove_count_listener(timeseries.on_count)
+    device_events.remove_listener(_record_history)
+    timeseries.stop()
+
+def _apply_remote_event(event):
+    """Another worker changed devices: drop our cached copies and wake our long-polls and streams."""
+    if event['type'] == 'device':
+        device_ids = [event['id']]
+        device_cache.invalidate(device_id=event['id'])
+    else:
+        device_ids = event['device_ids']
+        device_cache.invalidate()
+    building_summary.invalidate()
+    device_events.deliver(event)
+    if cluster.is_leader:
+        automation.refresh_devices(device_ids)
+
+# The model loads in the background so the API is up in well under a second; with MODEL_WARMUP=lazy
+# it only loads when the first camera opens. API-only cluster workers never run cameras
+if os.environ.get('MODEL_WARMUP', 'background').lower() != 'lazy' and (cluster is None or cluster.role == 'all'):
+    camera_service.warm_up()
 
-def ai_device_scheduler():
-    # Track state for delay logic
-    last_enable_time = {}
-    last_disable_time = {}
-    while True:
-        with app.app_context():
-            devices = Device.query.filter_by(is_manual=False).all()
-            for device in devices:
-                room_id = str(device.room_id)
-                person_count = camera_service.get_person_count(room_id)
-                now = time.time()
-                # Enable/Disable logic
-                if person_count is not None and device.persons_before_enabled is not None and device.delay_before_enabled is not None:
-                    # Enable when person count is greater than or equal to threshold
-                    if person_count >= device.persons_before_enabled:
-                        # Start/continue enable timer
-                        if device.id not in last_enable_time:
-                            last_enable_time[device.id] = now
-                        # Reset disable timer since we're enabling
-                        if device.id in last_disable_time:
-                            last_disable_time[device.id] = now
-                        # Check if delay has passed
-                        if now - last_enable_time[device.id] >= device.delay_before_enabled:
-                            if not device.is_enabled:
-                                device.is_enabled = True
-                                db.session.commit()
-                    # Disable when person count is less than enable threshold
-                    else:
-                        # Start/continue disable timer
-                        if device.id not in last_disable_time:
-                            last_disable_time[device.id] = now
-                        # Reset enable timer since we're disabling
-                        if device.id in last_enable_time:
-                            last_enable_time[device.id] = now
-                        # Use delay_before_disabled if set, otherwise use delay_before_enabled
-                        disable_delay = device.delay_before_disabled if device.delay_before_disabled is not None else device.delay_before_enabled
-                        # Check if delay has passed
-                        if now - last_disable_time[device.id] >= disable_delay:
-                            if device.is_enabled:
-                                device.is_enabled = False
-                                db.session.commit()
-                        # Update last enable time to prevent immediate re-enable
-                        last_enable_time[device.id] = now
-        time.sleep(2)
-
-# Start the AI device automation thread
-threading.Thread(target=ai_device_scheduler, daemon=True).start()
+occupancy.start()
+atexit.register(occupancy.stop)
+device_cache.start()
+atexit.register(device_cache.stop)
+atexit.register(device_events.close)
+if cluster is None:
+    _start_leader_services()
+    atexit.register(_stop_leader_services)
+    _open_automated_cameras()
+else:
+    device_events.add_listener(cluster_state.on_event, local_only=True)
+    cluster_state.on_remote_event = _apply_remote_event
+    cluster.on_leadership(_start_leader_services, _stop_leader_services)
+    cluster_state.start()
+    cluster.start()
+    atexit.register(remote_frames.close)
+    # atexit runs in reverse: leases are released (and leader services stopped) before the last sync
+    atexit.register(cluster_state.stop)
+    atexit.register(cluster.stop)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
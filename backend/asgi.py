@@ -0,0 +1,260 @@
+"""ASGI entry point: long-lived requests as coroutines, everything else through Flask.
+
+Under the threaded WSGI server every MJPEG viewer, SSE client and
+long-polling outlet holds a thread for as long as it is connected. Here
+``GET /api/device/status``, ``GET /api/camera/feed/<room_id>`` and
+``GET /api/events/devices`` are served by coroutines on the event loop, so
+thousands of idle connections cost thousands of coroutines, not threads.
+Only the short blocking parts (a database lookup on a cache miss, a JPEG
+encode) borrow a thread of the loop's pool. All other routes run the Flask
+app unchanged, on the same models, caches and ``CameraService``::
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --timeout-graceful-shutdown 5
+
+Feeds and event streams never end on their own, so without a graceful
+shutdown timeout the server waits for every viewer to leave before it exits.
+Like ``app:app`` under a WSGI server, one process serves the API; set
+``CLUSTER_MODE`` to run several (``uvicorn --workers``).
+"""
+import asyncio
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgiInstance
+
+import app as backend
+from app import REQUEST_SECONDS, REQUESTS, Room, app as flask_app
+from device_events import status_version
+from streaming import StreamProfile
+
+# Threads for the Flask routes and the blocking steps of the async ones
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+_FEED = re.compile(r'/api/camera/feed/(\d+)')
+# Matches what Flask-CORS adds to the Flask routes with its default settings
+_CORS = (b'access-control-allow-origin', b'*')
+
+
+def _args(scope) -> dict:
+    return {name: values[0] for name, values in parse_qs(scope['query_string'].decode('latin-1')).items()}
+
+
+def _arg(args: dict, name: str, type: Callable):
+    """``request.args.get(name, type=type)``: None when missing or malformed."""
+    try:
+        return type(args[name])
+    except (KeyError, ValueError):
+        return None
+
+
+async def _start(send, status: int, content_type: bytes, endpoint: str, started: float,
+                 headers: List[Tuple[bytes, bytes]] = ()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type), _CORS, *headers]})
+    REQUEST_SECONDS.observe(time.perf_counter() - started, method='GET', endpoint=endpoint)
+    REQUESTS.inc(method='GET', endpoint=endpoint, status=status)
+
+
+async def _json(send, payload, status: int, endpoint: str, started: float):
+    body = flask_app.json.dumps(payload).encode()
+    await _start(send, status, b'application/json', endpoint, started,
+                 [(b'content-length', str(len(body)).encode())])
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stream(receive, send, items: AsyncIterator, encode: Callable[[object], bytes]):
+    """Send ``encode(item)`` for each item until they run out or the client goes away."""
+    gone = asyncio.ensure_future(_disconnected(receive))
+    try:
+        async for item in items:
+            if gone.done():
+                break
+            await send({'type': 'http.response.body', 'body': encode(item), 'more_body': True})
+        else:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        gone.cancel()
+        # Ends the subscription now rather than whenever the generator is collected
+        await items.aclose()
+
+
+async def _in_thread(function, *args):
+    """Run a blocking step (database access) on the loop's pool, inside the Flask app context."""
+    def run():
+        with flask_app.app_context():
+            return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, run)
+
+
+async def device_status(scope, receive, send):
+    """``get_device_status`` of app.py, with the long poll waiting on the event loop."""
+    endpoint, started = '/api/device/status', time.perf_counter()
+    args = _args(scope)
+    hardware_id = args.get('hardware_id')
+    if not hardware_id:
+        return await _json(send, [], 200, endpoint, started)
+
+    async def lookup() -> Optional[dict]:
+        known, device = backend.device_cache.peek(hardware_id)
+        if not known:
+            device = await _in_thread(backend.device_cache.get, hardware_id)
+        return device
+
+    try:
+        device = await lookup()
+        if device is None:
+            return await _json(send, [], 200, endpoint, started)
+        client = scope.get('client')
+        backend.device_cache.heartbeat(device['id'], client[0] if client else None)
+
+        wait = _arg(args, 'wait', float)
+        known_version = _arg(args, 'version', int)
+        deadline = time.monotonic() + min(wait or 0, backend.STATUS_LONG_POLL_MAX)
+        while True:
+            tick = backend.device_events.tick(device['id'])
+            device = await lookup()
+            if device is None:
+                return await _json(send, [], 200, endpoint, started)
+            version = status_version(device)
+            remaining = deadline - time.monotonic()
+            if version != known_version or remaining <= 0:
+                break
+            await backend.device_events.wait_for_change_async(device['id'], tick, remaining)
+        await _json(send, [dict(device, version=version)], 200, endpoint, started)
+    except Exception as e:
+        flask_app.logger.error(f"Error in get_device_status: {str(e)}")
+        await _json(send, {'error': str(e)}, 500, endpoint, started)
+
+
+async def camera_feed(scope, receive, send, room_id: int):
+    """``camera_feed`` of app.py; a viewer waiting for the next frame holds no thread."""
+    endpoint, started = '/api/camera/feed/<int:room_id>', time.perf_counter()
+
+    def open_source():
+        room = Room.query.get(room_id)
+        if not room or not room.live_camera:
+            return False, None
+        return True, backend._frame_source(room)
+
+    configured, source = await _in_thread(open_source)
+    if not configured:
+        return await _json(send, {'error': 'Camera not found or not configured'}, 404, endpoint, started)
+    if source is None:
+        return await _json(send, {'error': 'Camera unavailable'}, 503, endpoint, started)
+
+    args = _args(scope)
+    defaults = backend.camera_service.stream_profile
+    try:
+        profile = StreamProfile.clamped(
+            args.get('quality', defaults.quality),
+            args.get('fps', defaults.max_fps),
+            args.get('width', defaults.width),
+        )
+    except ValueError:
+        return await _json(send, {'error': 'Invalid stream parameters'}, 400, endpoint, started)
+
+    frames = source.stream_frames_async(str(room_id), profile)
+    if frames is None:
+        return await _json(send, {'error': 'Camera not found or not configured'}, 404, endpoint, started)
+
+    def part(frame: bytes) -> bytes:
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+
+    await _start(send, 200, b'multipart/x-mixed-replace; boundary=frame', endpoint, started)
+    await _stream(receive, send, frames, part)
+
+
+async def device_event_stream(scope, receive, send):
+    """``device_event_stream`` of app.py."""
+    endpoint, started = '/api/events/devices', time.perf_counter()
+    room_id = _arg(_args(scope), 'room_id', int)
+    await _start(send, 200, b'text/event-stream; charset=utf-8', endpoint, started,
+                 [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')])
+    await _stream(receive, send, backend.device_events.subscribe_async(room_id), str.encode)
+
+
+class _WsgiRequest(WsgiToAsgiInstance):
+    """One request to the Flask app, run on the loop's thread pool.
+
+    asgiref's ``WsgiToAsgi`` runs every request on one shared thread, which
+    would serialize all Flask routes; this keeps its environ and
+    ``start_response`` handling but runs requests side by side. The routes
+    left to Flask answer at once, so their bodies are sent in one piece.
+    """
+
+    async def __call__(self, scope, receive, send):
+        self.scope = scope
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] != 'http.request':
+                    return  # The client went away
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            try:
+                environ = self.build_environ(scope, body)
+            except ValueError:  # Too many duplicate headers
+                await send({'type': 'http.response.start', 'status': 400,
+                            'headers': [(b'content-type', b'text/plain')]})
+                await send({'type': 'http.response.body', 'body': b'Bad Request'})
+                return
+            output = await asyncio.get_running_loop().run_in_executor(None, self._run, environ)
+        await send(self.response_start)
+        await send({'type': 'http.response.body', 'body': output})
+
+    def _run(self, environ) -> bytes:
+        result = self.wsgi_application(environ, self.start_response)
+        try:
+            return b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+class Application:
+    """Routes the long-lived GETs to their coroutines and the rest to the Flask app."""
+
+    def __init__(self, wsgi_app, threads: int = ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            path = scope['path']
+            if path == '/api/device/status':
+                return await device_status(scope, receive, send)
+            if path == '/api/events/devices':
+                return await device_event_stream(scope, receive, send)
+            feed = _FEED.fullmatch(path)
+            if feed:
+                return await camera_feed(scope, receive, send, int(feed.group(1)))
+        await _WsgiRequest(self.wsgi_app)(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                executor = ThreadPoolExecutor(self.threads, thread_name_prefix='asgi')
+                asyncio.get_running_loop().set_default_executor(executor)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = Application(flask_app)
@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, select, update
+
+
+class DeviceRule:
+    """In-memory copy of the automation fields of one non-manual device."""
+
+    __slots__ = ('id', 'room_id', 'source', 'is_enabled', 'threshold', 'enable_delay', 'disable_delay',
+                 'above', 'generation')
+
+    def __init__(self, device):
+        self.id = device.id
+        # As in the database: an int, or None for a device not in any room
+        self.room_id: Optional[int] = device.room_id
+        # Whose count drives the device: its room's, or that of a camera zone it is bound to (``<room>:<zone>``);
+        # None for a device with neither, which then never changes on its own
+        self.source: Optional[str] = device.zone or (str(device.room_id) if device.room_id is not None else None)
+        self.is_enabled = bool(device.is_enabled)
+        self.threshold = device.persons_before_enabled
+        self.enable_delay = device.delay_before_enabled
+        # Use delay_before_disabled if set, otherwise use delay_before_enabled
+        self.disable_delay = device.delay_before_disabled if device.delay_before_disabled is not None else device.delay_before_enabled
+        # Whether the last count was at/above the threshold (None until the first count)
+        self.above: Optional[bool] = None
+        # Bumped whenever the pending timer is superseded
+        self.generation = 0
+
+    @property
+    def automated(self) -> bool:
+        return self.threshold is not None and self.enable_delay is not None
+
+
+class AutomationEngine:
+    """Turns automated devices on/off in reaction to person-count changes.
+
+    Replaces the old 2-second polling loop. ``OccupancyEstimator`` pushes
+    stable count changes per room and zone; only devices indexed under that
+    room or zone are re-evaluated.
+    A device whose count crosses its threshold gets a timer on a heap for
+    ``delay_before_enabled`` / ``delay_before_disabled``; the timer is
+    invalidated if the count crosses back before it fires, which keeps the
+    old "condition must hold for the whole delay" semantics. All state
+    changes from one wake-up are committed in a single batch.
+    """
+
+    RELOAD_RETRY = 5.0
+
+    def __init__(self, app, db, device_model, occupancy):
+        self.app = app
+        self.db = db
+        self.Device = device_model
+        self.occupancy = occupancy
+        self.rules: Dict[int, DeviceRule] = {}
+        # room_id (or zone key) -> ids of automated devices counting on it
+        self.rooms: Dict[str, Set[int]] = {}
+        self.counts: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._events: List[Tuple] = []
+        # (deadline, tiebreak, device_id, generation, target_state)
+        self._timers: List[Tuple[float, int, int, int, bool]] = []
+        self._tiebreak = itertools.count()
+        self._loaded = False
+        self._change_listeners: List[Callable[[List[Tuple[int, bool, int]]], None]] = []
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.running = True
+        # Leadership may have moved away and back; start over from the database
+        self._loaded = False
+        self.occupancy.add_count_listener(self.on_count)
+        self.thread = threading.Thread(target=self._run, name="automation", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.occupancy.remove_count_listener(self.on_count)
+        with self._cond:
+            self._cond.notify()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+
+    def add_change_listener(self, listener: Callable[[List[Tuple[int, bool, int]]], None]):
+        """Call ``listener([(device_id, is_enabled, room_id), ...])`` after each committed batch."""
+        self._change_listeners.append(listener)
+
+    # Event producers; all cheap and safe to call from any thread
+
+    def on_count(self, room_id: str, person_count: int):
+        self._push(('count', room_id, person_count, time.time()))
+
+    def refresh_device(self, device_id: int):
+        """Reload one device's rule after it was added, edited or deleted."""
+        self._push(('device', device_id))
+
+    def refresh_devices(self, device_ids: List[int]):
+        """Reload the rules of many devices at once, e.g. after a bulk update."""
+        self._push(('devices', list(device_ids)))
+
+    def refresh_room(self, room_id: int):
+        """Reload every rule of a room, e.g. after the room was deleted."""
+        self._push(('room', room_id))
+
+    def refresh_all(self):
+        self._push(('all',))
+
+    def _push(self, event: Tuple):
+        if not self.running:
+            return  # Not the scheduler (any more); the next start reloads everything
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify()
+
+    # Worker thread
+
+    def _run(self):
+        while self.running:
+            with self._cond:
+                if self._loaded and not self._events and not self._timer_due():
+                    self._cond.wait(self._wait_timeout())
+                events, self._events = self._events, []
+            if not self.running:
+                break
+            try:
+                with self.app.app_context():
+                    self._process(events)
+            except Exception as e:
+                self.app.logger.error(f"Automation engine error: {e}")
+                time.sleep(self.RELOAD_RETRY)
+
+    def _timer_due(self) -> bool:
+        return bool(self._timers) and self._timers[0][0] <= time.time()
+
+    def _wait_timeout(self) -> Optional[float]:
+        if not self._timers:
+            return None
+        return max(self._timers[0][0] - time.time(), 0.0)
+
+    def _process(self, events: List[Tuple]):
+        if not self._loaded:
+            self._reload_all()
+        for event in events:
+            kind = event[0]
+            if kind == 'count':
+                _, room_id, person_count, now = event
+                self.counts[room_id] = person_count
+                for device_id in self.rooms.get(room_id, ()):
+                    self._evaluate(self.rules[device_id], now)
+            elif kind == 'device':
+                self._reload_devices([event[1]])
+            elif kind == 'devices':
+                self._reload_devices(event[1])
+            elif kind == 'room':
+                self._reload_room(event[1])
+            elif kind == 'all':
+                self._reload_all()
+
+        changes = self._fire_timers()
+        if changes:
+            self._commit(changes)
+
+    def _evaluate(self, rule: DeviceRule, now: float):
+        """React to the count of the rule's room (or zone) crossing (or not) its threshold."""
+        person_count = self.counts.get(rule.source)
+        if person_count is None or not rule.automated:
+            return
+        above = person_count >= rule.threshold
+        if above == rule.above:
+            return  # Still on the same side: the running timer (if any) stays valid
+        rule.above = above
+        rule.generation += 1
+        if above == rule.is_enabled:
+            return  # Already in the target state
+        delay = rule.enable_delay if above else rule.disable_delay
+        heapq.heappush(self._timers, (now + (delay or 0), next(self._tiebreak), rule.id, rule.generation, above))
+
+    def _fire_timers(self) -> Dict[int, bool]:
+        changes: Dict[int, bool] = {}
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, device_id, generation, target = heapq.heappop(self._timers)
+            rule = self.rules.get(device_id)
+            if rule is None or rule.generation != generation or rule.is_enabled == target:
+                continue  # Superseded, deleted, or already there
+            rule.is_enabled = target
+            changes[device_id] = target
+        return changes
+
+    def _commit(self, changes: Dict[int, bool]):
+        """Write every state change from this wake-up in one transaction."""
+        table = self.Device.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'), table.c.is_manual.is_(False))
+            .values(is_enabled=bindparam('b_enabled'))
+        )
+        ids = list(changes)
+        try:
+            self.db.session.execute(stmt, [{'b_id': i, 'b_enabled': v} for i, v in changes.items()])
+            # Devices switched to manual in the meantime were skipped by the guard; only report
+            # what was written. Read inside the transaction, which still holds the rows we updated
+            written = set()
+            for i in range(0, len(ids), 500):
+                written.update(self.db.session.execute(
+                    select(table.c.id).where(table.c.id.in_(ids[i:i + 500]), table.c.is_manual.is_(False))
+                ).scalars())
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            # Our view may now be out of sync with the database; start over from it
+            self._loaded = False
+            raise
+        applied = [(i, v, self.rules[i].room_id) for i, v in changes.items() if i in written]
+        if not applied:
+            return
+        for listener in self._change_listeners:
+            try:
+                listener(applied)
+            except Exception as e:
+                self.app.logger.error(f"Automation change listener failed: {e}")
+
+    # Rule index maintenance
+
+    def _index(self, device):
+        self._add(DeviceRule(device))
+
+    def _add(self, rule: DeviceRule):
+        self.rules[rule.id] = rule
+        if rule.source is None:
+            return
+        self.rooms.setdefault(rule.source, set()).add(rule.id)
+        self._evaluate(rule, time.time())
+
+    def _unindex(self, device_id: int):
+        rule = self.rules.pop(device_id, None)
+        if rule is None:
+            return
+        rule.generation += 1  # Cancels its pending timer
+        devices = self.rooms.get(rule.source)
+        if devices is not None:
+            devices.discard(device_id)
+            if not devices:
+                del self.rooms[rule.source]
+
+    def _reload_all(self):
+        devices = self.Device.query.filter_by(is_manual=False).all()
+        for device_id in list(self.rules):
+            self._unindex(device_id)
+        self._index_all(devices)
+        self._loaded = True
+
+    def _reload_devices(self, device_ids: List[int]):
+        for device_id in device_ids:
+            self._unindex(device_id)
+        devices = []
+        for i in range(0, len(device_ids), 500):
+            devices.extend(self.Device.query.filter(
+                self.Device.id.in_(device_ids[i:i + 500]), self.Device.is_manual.is_(False)
+            ).all())
+        self._index_all(devices)
+
+    def _reload_room(self, room_id: int):
+        # Devices bound to a zone are indexed under the zone, not the room
+        for device_id in [rule.id for rule in self.rules.values() if rule.room_id == room_id]:
+            self._unindex(device_id)
+        devices = self.Device.query.filter_by(room_id=room_id, is_manual=False).all()
+        self._index_all(devices)
+
+    def _index_all(self, devices: list):
+        rules = [DeviceRule(device) for device in devices]
+        self._seed_counts({rule.source for rule in rules if rule.source is not None})
+        for rule in rules:
+            self._add(rule)
+
+    def _seed_counts(self, room_ids: Set[str]):
+        """Pick up the current count of rooms (and zones) we have not heard from yet."""
+        for room_id in room_ids:
+            if room_id not in self.counts:
+                person_count = self.occupancy.get_person_count(room_id)
+                if person_count is not None:
+                    self.counts[room_id] = person_count
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            pending = len(self._events)
+        return {
+            'devices': len(self.rules),
+            'rooms': len(self.rooms),
+            'pending_events': pending,
+            'pending_timers': len(self._timers),
+        }
@@ -0,0 +1,296 @@
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import framering
+from inference import Detections
+from models import ModelSpec
+
+DEFAULT_MODEL = "yolo11s.pt"
+
+
+def _load_model(model_path: str):
+    from ultralytics import YOLO
+    # Exported models (ONNX, OpenVINO) do not carry their task the way .pt weights do
+    return YOLO(model_path, task='detect')
+
+
+class InferenceBackend:
+    """Runs detection on a batch of frames and returns one ``Detections`` per frame."""
+
+    names: Optional[Dict[int, str]] = None
+
+    def predict(self, frames: List[np.ndarray], predict_kwargs: dict) -> List[Detections]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBackend(InferenceBackend):
+    """Runs the model in the calling thread of the Flask process."""
+
+    def __init__(self, model_path: str = DEFAULT_MODEL):
+        self.model = _load_model(model_path)
+        self.names = getattr(self.model, 'names', None)
+
+    def predict(self, frames: List[np.ndarray], predict_kwargs: dict) -> List[Detections]:
+        results = self.model.predict(source=frames, **predict_kwargs)
+        detections = [Detections.from_result(result) for result in results]
+        detections.extend(Detections.empty() for _ in range(len(frames) - len(detections)))
+        return detections
+
+
+def _worker_main(conn, model_path: str):
+    """Worker process loop: read frames from shared memory, reply with detections."""
+    try:
+        model = _load_model(model_path)
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', getattr(model, 'names', None)))
+    shm: Optional[SharedMemory] = None
+    # Camera frame rings attached by name, so ring-resident frames need no copy at all
+    rings: Dict[str, SharedMemory] = {}
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            kind, payload = message
+            if kind == 'shm':
+                if shm is not None:
+                    shm.close()
+                shm = framering.attach_shm(payload)
+                continue
+            if kind == 'detach':
+                ring = rings.pop(payload, None)
+                if ring is not None:
+                    ring.close()
+                continue
+            layout, predict_kwargs = payload
+            # Views into the shared blocks; nothing is copied or unpickled
+            frames = []
+            for name, offset, shape in layout:
+                if name is None:
+                    block = shm
+                else:
+                    block = rings.get(name)
+                    if block is None:
+                        block = rings[name] = framering.attach_shm(name)
+                frames.append(np.ndarray(shape, dtype=np.uint8, buffer=block.buf, offset=offset))
+            try:
+                results = model.predict(source=frames, **predict_kwargs)
+                reply = [tuple(Detections.from_result(result)) for result in results]
+            except Exception as e:
+                reply = e
+            del frames
+            conn.send(('result', reply))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if shm is not None:
+            shm.close()
+        for ring in rings.values():
+            ring.close()
+
+
+class _Worker:
+    """Parent-side handle for one inference process and its shared frame block.
+
+    Workers are started as ``python backends.py --worker`` rather than with
+    multiprocessing's spawn so the child never re-imports app.py (and with it
+    the camera service and scheduler threads).
+    """
+
+    # Seconds a worker gets to exit after being asked to, then after SIGTERM, before it is killed
+    CLOSE_TIMEOUT = 5.0
+    TERMINATE_TIMEOUT = 2.0
+
+    def __init__(self, model_path: str, index: int):
+        self.model_path = model_path
+        parent_sock, child_sock = socket.socketpair()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', str(child_sock.fileno()), model_path],
+            pass_fds=(child_sock.fileno(),),
+        )
+        child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.index = index
+        self.shm: Optional[SharedMemory] = None
+        self.names = None
+
+    def wait_ready(self):
+        """Wait until the worker has loaded its model; raises RuntimeError (and closes it) if it could not."""
+        try:
+            kind, payload = self.conn.recv()
+        except (EOFError, OSError):
+            kind, payload = 'error', f"exited with code {self.process.wait()}"
+        if kind != 'ready':
+            self.close()
+            raise RuntimeError(f"Inference worker {self.index} could not load {self.model_path}: {payload}")
+        self.names = payload
+
+    def _ensure_capacity(self, size: int):
+        if self.shm is not None and self.shm.size >= size:
+            return
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+        # Leave headroom so a slightly larger batch does not reallocate again
+        self.shm = SharedMemory(create=True, size=int(size * 1.5))
+        self.conn.send(('shm', self.shm.name))
+
+    def predict(self, frames: List[np.ndarray], predict_kwargs: dict) -> List[Detections]:
+        # Frames that already live in a camera's shared ring are passed by reference
+        located = [framering.locate(frame) for frame in frames]
+        copies = [np.ascontiguousarray(frame, dtype=np.uint8) for frame, ref in zip(frames, located) if ref is None]
+        if copies:
+            self._ensure_capacity(sum(frame.nbytes for frame in copies))
+        layout: List[Tuple[Optional[str], int, Tuple[int, ...]]] = []
+        offset = 0
+        copies_iter = iter(copies)
+        for frame, ref in zip(frames, located):
+            if ref is not None:
+                layout.append((ref[0], ref[1], frame.shape))
+                continue
+            frame = next(copies_iter)
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)[...] = frame
+            layout.append((None, offset, frame.shape))
+            offset += frame.nbytes
+        self.conn.send(('predict', (layout, predict_kwargs)))
+        _, reply = self.conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        detections = [Detections(*fields) for fields in reply]
+        detections.extend(Detections.empty() for _ in range(len(frames) - len(detections)))
+        return detections
+
+    def detach(self, name: str):
+        try:
+            self.conn.send(('detach', name))
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.process.wait(timeout=self.CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=self.TERMINATE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.conn.close()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class ProcessPoolBackend(InferenceBackend):
+    """Runs detection in worker processes so inference never holds the Flask process's GIL.
+
+    A batch is split into chunks of ``cameras_per_worker`` frames and each
+    chunk goes to its own worker. Frames are copied once into the worker's
+    shared-memory block, or not copied at all when they are views into a
+    camera's ``FrameRing``; only a small layout description crosses the pipe
+    and the detections coming back are a few small arrays per frame.
+    """
+
+    def __init__(self, model_path: str = DEFAULT_MODEL, workers: int = 2, cameras_per_worker: int = 4):
+        self.cameras_per_worker = max(1, cameras_per_worker)
+        self._model_path = model_path
+        self._workers: List[_Worker] = []
+        try:
+            for i in range(max(1, workers)):
+                self._workers.append(_Worker(model_path, i))
+            for worker in self._workers:
+                worker.wait_ready()
+        except Exception:
+            # Don't leave the workers that did start (and their shared memory) behind
+            for worker in self._workers:
+                worker.close()
+            raise
+        self.names = self._workers[0].names
+        self._pool = ThreadPoolExecutor(max_workers=len(self._workers), thread_name_prefix="inference-dispatch")
+        self._lock = threading.Lock()
+        framering.add_release_listener(self._forget_ring)
+
+    def _forget_ring(self, name: str):
+        """Tell workers to drop their mapping of a camera ring that was closed."""
+        with self._lock:
+            for worker in self._workers:
+                worker.detach(name)
+
+    def predict(self, frames: List[np.ndarray], predict_kwargs: dict) -> List[Detections]:
+        if not frames:
+            return []
+        chunks = min(len(self._workers), math.ceil(len(frames) / self.cameras_per_worker))
+        size = math.ceil(len(frames) / chunks)
+        chunks = math.ceil(len(frames) / size)
+        with self._lock:
+            futures = [
+                self._pool.submit(self._run_chunk, i, frames[i * size:(i + 1) * size], predict_kwargs)
+                for i in range(chunks)
+            ]
+            detections: List[Detections] = []
+            for future in futures:
+                detections.extend(future.result())
+        return detections
+
+    def _run_chunk(self, index: int, frames: List[np.ndarray], predict_kwargs: dict) -> List[Detections]:
+        worker = self._workers[index]
+        try:
+            return worker.predict(frames, predict_kwargs)
+        except (EOFError, OSError) as e:
+            print(f"Inference worker {index} died ({e}), restarting")
+            worker.close()
+            replacement = _Worker(self._model_path, index)
+            replacement.wait_ready()
+            self._workers[index] = replacement
+            return [Detections.empty() for _ in frames]
+
+    def close(self):
+        framering.remove_release_listener(self._forget_ring)
+        self._pool.shutdown(wait=True)
+        for worker in self._workers:
+            worker.close()
+
+
+def create_backend(model_path: Optional[str] = None) -> InferenceBackend:
+    """Build the inference backend selected by INFERENCE_BACKEND (``thread`` or ``process``).
+
+    Without ``model_path`` the model comes from ``ModelSpec.from_env()``,
+    exported (once, then cached) for the configured runtime.
+    """
+    if model_path is None:
+        model_path = ModelSpec.from_env().prepare()
+    kind = os.environ.get('INFERENCE_BACKEND', 'thread')
+    if kind == 'process':
+        return ProcessPoolBackend(
+            model_path,
+            workers=int(os.environ.get('INFERENCE_WORKERS', 2)),
+            cameras_per_worker=int(os.environ.get('INFERENCE_CAMERAS_PER_WORKER', 4)),
+        )
+    if kind != 'thread':
+        raise ValueError(f"Unknown INFERENCE_BACKEND: {kind}")
+    return LocalBackend(model_path)
+
+
+if __name__ == '__main__' and len(sys.argv) == 4 and sys.argv[1] == '--worker':
+    _worker_main(Connection(int(sys.argv[2])), sys.argv[3])
@@ -0,0 +1,188 @@
+"""Heartbeat write throughput against SQLite, before and after the storage tuning.
+
+Simulates outlets checking in concurrently while the automation engine
+commits state changes, and reports heartbeats/sec, latency percentiles and
+"database is locked" failures for three setups:
+
+- ``before``: default engine, one UPDATE + commit per heartbeat (the old status endpoint)
+- ``tuned``: WAL/busy_timeout/cache pragmas, still one commit per heartbeat
+- ``batched``: tuned pragmas with heartbeats buffered and flushed by one executemany
+
+Run from the backend directory::
+
+    python benchmarks/heartbeats.py --threads 16 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, Integer, MetaData, String, Table, bindparam,
+                        create_engine, select, update)
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import SqliteSettings, engine_options, install_pragmas  # noqa: E402
+
+metadata = MetaData()
+device = Table(
+    'device', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('hardware_id', String(64), unique=True, nullable=False),
+    Column('is_enabled', Boolean, nullable=False, default=False),
+    Column('last_seen', DateTime),
+    Column('ip_address', String(45)),
+    Column('room_id', Integer, index=True),
+    Column('is_manual', Boolean, nullable=False, default=False),
+)
+
+
+def make_engine(path: str, tuned: bool):
+    url = f"sqlite:///{path}"
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url, SqliteSettings()))
+    install_pragmas(engine, SqliteSettings())
+    return engine
+
+
+def seed(engine, devices: int):
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(device.insert(), [
+            {'id': i, 'hardware_id': f'hw{i}', 'room_id': i % 20, 'is_enabled': False, 'is_manual': False}
+            for i in range(1, devices + 1)
+        ])
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(mode: str, threads: int, seconds: float, devices: int, flush_interval: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix='heartbeat-bench-') as directory:
+        return _run(os.path.join(directory, 'bench.db'), mode, threads, seconds, devices, flush_interval)
+
+
+def _run(path: str, mode: str, threads: int, seconds: float, devices: int, flush_interval: float) -> dict:
+    engine = make_engine(path, tuned=mode != 'before')
+    seed(engine, devices)
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    errors = [0]
+    pending = {}
+
+    heartbeat_stmt = (
+        update(device).where(device.c.id == bindparam('b_id'))
+        .values(last_seen=bindparam('b_last_seen'), ip_address=bindparam('b_ip'))
+    )
+
+    def outlet():
+        rng = random.Random()
+        local = []
+        while not stop.is_set():
+            device_id = rng.randint(1, devices)
+            start = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    # Status lookup, as the endpoint did before the in-memory cache
+                    conn.execute(select(device).where(device.c.hardware_id == f'hw{device_id}')).first()
+                    if mode == 'batched':
+                        with lock:
+                            pending[device_id] = (datetime.utcnow(), '10.0.0.1')
+                    else:
+                        conn.execute(heartbeat_stmt, {'b_id': device_id, 'b_last_seen': datetime.utcnow(),
+                                                      'b_ip': '10.0.0.1'})
+                        conn.commit()
+                local.append(time.perf_counter() - start)
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    def automation():
+        # Periodic batch of state flips, like the automation engine's commits
+        rng = random.Random(1)
+        while not stop.wait(0.2):
+            rows = [{'b_id': rng.randint(1, devices), 'b_enabled': rng.random() < 0.5} for _ in range(20)]
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(device).where(device.c.id == bindparam('b_id')).values(is_enabled=bindparam('b_enabled')),
+                        rows,
+                    )
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+
+    def flusher():
+        while not stop.wait(flush_interval):
+            flush()
+
+    def flush():
+        with lock:
+            batch = dict(pending)
+            pending.clear()
+        if batch:
+            with engine.begin() as conn:
+                conn.execute(heartbeat_stmt, [
+                    {'b_id': i, 'b_last_seen': seen, 'b_ip': ip} for i, (seen, ip) in batch.items()
+                ])
+
+    workers = [threading.Thread(target=outlet) for _ in range(threads)]
+    workers.append(threading.Thread(target=automation))
+    if mode == 'batched':
+        workers.append(threading.Thread(target=flusher))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    if mode == 'batched':
+        flush()
+    engine.dispose()
+
+    return {
+        'mode': mode,
+        'threads': threads,
+        'heartbeats_per_sec': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'locked_errors': errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16, help='concurrent outlets')
+    parser.add_argument('--seconds', type=float, default=10.0, help='duration of each run')
+    parser.add_argument('--devices', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='batched mode flush period')
+    parser.add_argument('--modes', default='before,tuned,batched')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per run')
+    args = parser.parse_args()
+
+    for mode in args.modes.split(','):
+        result = run(mode, args.threads, args.seconds, args.devices, args.flush_interval)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{mode:>8}: {result['heartbeats_per_sec']:>9} heartbeats/s  "
+                  f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  "
+                  f"locked errors {result['locked_errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,546 @@
+"""Load test of the whole backend: an outlet fleet, replayed cameras and dashboard edits.
+
+Starts the app in a fresh process on a temporary database (or targets a
+running one with ``--url``), seeds a building, then for ``--seconds`` runs:
+
+- an outlet fleet: ``--outlets`` simulated ESP32 outlets, each polling
+  ``/api/device/status`` every ``--poll-interval`` seconds (the firmware's
+  5 s), spread evenly over the interval
+- cameras: ``--cameras`` rooms whose cameras are MJPEG streams served by
+  this script at ``--camera-fps``, like IP cameras, replaying ``--clip`` in
+  a loop or synthetic frames. Each room has an outlet automated at one
+  person without delay
+- a dashboard client creating, editing, listing and deleting rooms and
+  devices at ``--crud-rate`` operations per second
+- end-to-end trials: camera 0 switches to ``--person-clip`` (a recording of
+  someone in view) and the time until its outlet's relay flips on, then off
+  again after switching back, is measured through the outlet's long poll.
+  Synthetic frames contain nobody a detector would find, so this needs a
+  person clip (and a real model)
+
+Prints p50/p99 latency and requests/sec per endpoint, inference frames/sec
+per camera and the end-to-end times as JSON. ``--save-baseline NAME``
+stores the result under ``benchmarks/baselines``; ``--compare NAME`` checks
+against it and exits with 1 on regressions beyond ``--tolerance``. The load
+generator shares the CPU with the backend it starts; for numbers of the
+backend alone, run it from another machine with ``--url``. Run from the
+backend directory::
+
+    python benchmarks/loadtest.py --outlets 2000 --cameras 4 --clip empty.mp4 \\
+        --person-clip person.mp4 --seconds 60 --compare default
+"""
+import argparse
+import heapq
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+SERVE = ("import sys; import app; from werkzeug.serving import make_server; "
+         "make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True).serve_forever()")
+SERVE_ASGI = ("import sys, uvicorn; "
+              "uvicorn.run('asgi:application', host='127.0.0.1', port=int(sys.argv[1]), log_level='warning', "
+              "timeout_graceful_shutdown=1)")
+# Baseline keys ending in these are compared: latencies must not grow, rates must not shrink
+LOWER_IS_BETTER = ('_ms', '_s')
+HIGHER_IS_BETTER = ('rps', 'fps')
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Recorder:
+    """Latencies and errors per endpoint label, from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, label: str, seconds: float, ok: bool):
+        with self.lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, seconds: float) -> dict:
+        with self.lock:
+            return {label: {
+                'requests': len(values),
+                'errors': self.errors.get(label, 0),
+                'rps': round(len(values) / seconds, 1),
+                'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            } for label, values in sorted(self.latencies.items())}
+
+
+class Client:
+    """One HTTP connection, reopened after errors; one per thread like one outlet or browser."""
+
+    def __init__(self, base: str, timeout: float = 30.0):
+        url = urllib.parse.urlsplit(base)
+        self.host, self.port, self.timeout = url.hostname, url.port or 80, timeout
+        self.conn: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body=None) -> Tuple[int, object]:
+        reused = self.conn is not None
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            self.conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            self.conn = None
+            if reused and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+                # The server closed the idle keep-alive connection (uvicorn does after 5 s); reconnect once
+                return self.request(method, path, body)
+            return 0, None
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def timed(self, recorder: Recorder, label: str, method: str, path: str, body=None) -> Tuple[int, object]:
+        start = time.perf_counter()
+        status, data = self.request(method, path, body)
+        recorder.record(label, time.perf_counter() - start, 0 < status < 400)
+        return status, data
+
+
+# Cameras
+
+def load_clip(path: str, width: int, max_frames: int) -> List[bytes]:
+    """The clip's frames as JPEGs, scaled to ``width``."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame.shape[1] > width:
+            frame = cv2.resize(frame, (width, frame.shape[0] * width // frame.shape[1]))
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    cap.release()
+    if not frames:
+        sys.exit(f"No frames read from {path}")
+    return frames
+
+
+def synthetic_frames(width: int, height: int, count: int) -> List[bytes]:
+    """A noisy gradient with a moving bar, so motion gating lets frames through."""
+    rng = np.random.default_rng(0)
+    base = np.tile(np.linspace(40, 200, width, dtype=np.uint8), (height, 1))
+    frames = []
+    for i in range(count):
+        frame = cv2.cvtColor(base, cv2.COLOR_GRAY2BGR)
+        frame = cv2.add(frame, rng.integers(0, 12, frame.shape, dtype=np.uint8))
+        x = i * width // count
+        cv2.rectangle(frame, (x, height // 3), (x + width // 10, 2 * height // 3), (30, 30, 220), -1)
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return frames
+
+
+class CameraServer:
+    """MJPEG streams at ``/cam/<n>.mjpg`` paced at ``fps``; each camera loops the empty or the person clip."""
+
+    def __init__(self, empty: List[bytes], person: Optional[List[bytes]], fps: float):
+        self.clips = {'empty': empty, 'person': person or empty}
+        self.fps = fps
+        self.showing: Dict[int, str] = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    camera = int(self.path.split('/')[-1].split('.')[0])
+                except ValueError:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                server._stream(self.wfile, camera)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+
+    def url(self, camera: int) -> str:
+        return f"http://127.0.0.1:{self.port}/cam/{camera}.mjpg"
+
+    def show(self, camera: int, clip: str):
+        self.showing[camera] = clip
+
+    def _stream(self, out, camera: int):
+        index, next_at = 0, time.monotonic()
+        try:
+            while True:
+                clip = self.clips[self.showing.get(camera, 'empty')]
+                jpeg = clip[index % len(clip)]
+                out.write(b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(jpeg)
+                          + jpeg + b'\r\n')
+                index += 1
+                next_at += 1.0 / self.fps
+                time.sleep(max(next_at - time.monotonic(), 0.0))
+        except OSError:
+            pass  # The backend closed the camera
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="camera-server", daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Backend
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_backend(directory: str, env: Dict[str, str], server: str = 'wsgi') -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'loadtest.db')}",
+               TIMESERIES_DIR=os.path.join(directory, 'timeseries'), **env)
+    serve = SERVE_ASGI if server == 'asgi' else SERVE
+    process = subprocess.Popen([sys.executable, '-c', serve, str(port)], cwd=BACKEND, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_ready(base: str, inference: bool, timeout: float):
+    client = Client(base, timeout=2.0)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, _ = client.request('GET', f"/api/ready{'?inference=1' if inference else ''}")
+        if status == 200:
+            return
+        time.sleep(0.1)
+    sys.exit(f"Backend at {base} not ready after {timeout:.0f} s")
+
+
+def seed(base: str, outlets: int, rooms: int, cameras: CameraServer, camera_count: int) -> Tuple[int, List[str], List[str]]:
+    """A building with ``rooms`` rooms, the fleet's outlets spread over them and one automated outlet per camera."""
+    client = Client(base)
+    client.request('POST', '/api/buildings', {'name': 'Load test', 'description': 'benchmarks/loadtest.py'})
+    _, buildings = client.request('GET', '/api/buildings')
+    building_id = max(building['id'] for building in buildings)
+    room_ids = []
+    for n in range(max(rooms, camera_count)):
+        body = {'name': f'room-{n}'}
+        if n < camera_count:
+            body['live_camera'] = cameras.url(n)
+        _, data = client.request('POST', f'/api/buildings/{building_id}/rooms', body)
+        room_ids.append(data['room']['id'])
+    hardware_ids = [f'outlet-{i}' for i in range(outlets)]
+    for start in range(0, outlets, 1000):
+        devices = [{'hardware_id': hardware_id, 'name': hardware_id, 'room_id': room_ids[i % len(room_ids)],
+                    'is_manual': True} for i, hardware_id in enumerate(hardware_ids[start:start + 1000], start)]
+        status, _ = client.request('POST', '/api/devices/bulk', {'devices': devices})
+        if status != 200:
+            sys.exit(f"Seeding outlets failed with HTTP {status}")
+    relays = []
+    for n in range(camera_count):
+        relay = f'relay-{n}'
+        client.request('POST', f'/api/rooms/{room_ids[n]}/devices', {
+            'hardware_id': relay, 'name': relay, 'persons_before_enabled': 1,
+            'delay_before_enabled': 0, 'delay_before_disabled': 0})
+        relays.append(relay)
+    return building_id, hardware_ids, relays
+
+
+# Load generators
+
+def run_fleet(base: str, hardware_ids: List[str], interval: float, workers: int, stop: threading.Event,
+              recorder: Recorder, lateness: List[float]):
+    """Each worker polls its share of the outlets, each outlet once per ``interval``."""
+
+    def worker(mine: List[str]):
+        client = Client(base)
+        start = time.monotonic()
+        # Outlets boot at random moments: spread their first polls over one interval
+        due = [(start + interval * i / len(mine), hardware_id) for i, hardware_id in enumerate(mine)]
+        heapq.heapify(due)
+        late = []
+        while not stop.is_set():
+            at, hardware_id = heapq.heappop(due)
+            delay = at - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                break
+            late.append(max(-delay, 0.0))
+            client.timed(recorder, 'GET /api/device/status', 'GET', f'/api/device/status?hardware_id={hardware_id}')
+            heapq.heappush(due, (at + interval, hardware_id))
+        with recorder.lock:
+            lateness.extend(late)
+
+    threads = [threading.Thread(target=worker, args=(hardware_ids[w::workers],), daemon=True)
+               for w in range(min(workers, len(hardware_ids)))]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_crud(base: str, building_id: int, rate: float, stop: threading.Event, recorder: Recorder):
+    """A dashboard user adding a room and a device, editing, listing and deleting them again."""
+    client = Client(base)
+    n = 0
+    while not stop.wait(8 / rate):  # Eight requests per round
+        n += 1
+        _, data = client.timed(recorder, 'POST /api/buildings/<id>/rooms', 'POST',
+                               f'/api/buildings/{building_id}/rooms', {'name': f'crud-{n}'})
+        if not data or 'room' not in data:
+            continue
+        room_id = data['room']['id']
+        _, data = client.timed(recorder, 'POST /api/rooms/<id>/devices', 'POST', f'/api/rooms/{room_id}/devices',
+                               {'hardware_id': f'crud-{n}-{time.time_ns()}', 'name': 'Load test outlet'})
+        device_id = data['device']['id'] if data and 'device' in data else None
+        if device_id is not None:
+            client.timed(recorder, 'PUT /api/devices/<id>', 'PUT', f'/api/devices/{device_id}',
+                         {'is_manual': True, 'is_enabled': n % 2 == 0})
+        client.timed(recorder, 'GET /api/rooms/<id>/devices', 'GET', f'/api/rooms/{room_id}/devices')
+        client.timed(recorder, 'GET /api/buildings/<id>/rooms', 'GET', f'/api/buildings/{building_id}/rooms')
+        client.timed(recorder, 'GET /api/buildings/summary', 'GET', '/api/buildings/summary')
+        if device_id is not None:
+            client.timed(recorder, 'DELETE /api/devices/<id>', 'DELETE', f'/api/devices/{device_id}')
+        client.timed(recorder, 'DELETE /api/rooms/<id>', 'DELETE', f'/api/rooms/{room_id}')
+
+
+def _wait_for_relay(client: Client, relay: str, enabled: bool, timeout: float) -> Optional[float]:
+    """Seconds until the relay's state is ``enabled``, following the outlet long poll."""
+    start = time.monotonic()
+    version = None
+    while time.monotonic() - start < timeout:
+        query = f'/api/device/status?hardware_id={relay}&wait=5' + (f'&version={version}' if version is not None else '')
+        status, data = client.request('GET', query)
+        if status != 200 or not data:
+            time.sleep(0.1)
+            continue
+        if data[0]['is_enabled'] == enabled:
+            return time.monotonic() - start
+        version = data[0]['version']
+    return None
+
+
+def run_e2e(base: str, cameras: CameraServer, relay: str, trials: int, timeout: float, settle: float) -> dict:
+    """Person appears -> relay on, person leaves -> relay off, for camera 0."""
+    client = Client(base)
+    on, off = [], []
+    for _ in range(trials):
+        if _wait_for_relay(client, relay, False, timeout) is None:
+            break
+        time.sleep(settle)
+        cameras.show(0, 'person')
+        on_s = _wait_for_relay(client, relay, True, timeout)
+        cameras.show(0, 'empty')
+        if on_s is None:
+            break
+        on.append(on_s)
+        off_s = _wait_for_relay(client, relay, False, timeout)
+        if off_s is not None:
+            off.append(off_s)
+    return {
+        'trials': len(on),
+        'on_p50_s': round(statistics.median(on), 2) if on else None,
+        'on_max_s': round(max(on), 2) if on else None,
+        'off_p50_s': round(statistics.median(off), 2) if off else None,
+    }
+
+
+def camera_fps(before: dict, after: dict, seconds: float) -> Dict[str, float]:
+    """Inference frames/sec per camera between two reads of the inference stats."""
+    start = before.get('inferred_frames', {})
+    return {camera_id: round((frames - start.get(camera_id, 0)) / seconds, 2)
+            for camera_id, frames in sorted(after.get('inferred_frames', {}).items())}
+
+
+def run(args, base: str) -> dict:
+    empty = load_clip(args.clip, args.camera_width, args.max_clip_frames) if args.clip else \
+        synthetic_frames(args.camera_width, args.camera_width * 9 // 16, int(args.camera_fps * 4))
+    person = load_clip(args.person_clip, args.camera_width, args.max_clip_frames) if args.person_clip else None
+    cameras = CameraServer(empty, person, args.camera_fps)
+    cameras.start()
+    try:
+        building_id, hardware_ids, relays = seed(base, args.outlets, args.rooms, cameras, args.cameras)
+        client = Client(base)
+        time.sleep(args.warmup)
+
+        recorder, lateness, stop = Recorder(), [], threading.Event()
+        _, stats_before = client.request('GET', '/api/camera/inference/stats')
+        started = time.monotonic()
+        threads = run_fleet(base, hardware_ids, args.poll_interval, args.workers, stop, recorder, lateness)
+        if args.crud_rate > 0:
+            threads.append(threading.Thread(target=run_crud, args=(base, building_id, args.crud_rate, stop, recorder),
+                                            daemon=True))
+            threads[-1].start()
+        e2e = None
+        if args.person_clip and relays:
+            e2e = run_e2e(base, cameras, relays[0], args.e2e_trials, args.e2e_timeout, settle=2.0)
+        stop.wait(max(args.seconds - (time.monotonic() - started), 0.0))
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=35)
+        seconds = time.monotonic() - started
+        _, stats_after = client.request('GET', '/api/camera/inference/stats')
+    finally:
+        cameras.stop()
+
+    endpoints = recorder.summary(seconds)
+    status = endpoints.get('GET /api/device/status', {})
+    stats_after = stats_after or {}
+    return {
+        'seconds': round(seconds, 1),
+        'endpoints': endpoints,
+        'fleet': {
+            'outlets': len(hardware_ids),
+            'offered_rps': round(len(hardware_ids) / args.poll_interval, 1),
+            'achieved_rps': status.get('rps', 0.0),
+            # How far behind schedule polls went out: the fleet outran the load generator or the server
+            'late_p99_ms': round(percentile(lateness, 0.99) * 1000, 1) if lateness else None,
+        },
+        'inference': {
+            'camera_fps': camera_fps(stats_before or {}, stats_after, seconds),
+            'total_fps': round(stats_after.get('frames_per_second', 0.0), 2),
+            'p95_batch_ms': round(stats_after.get('p95_batch_latency', 0.0) * 1000, 1),
+            'model': stats_after.get('model'),
+        },
+        'e2e': e2e,
+    }
+
+
+# Baselines
+
+def flatten(result: dict, prefix: str = '') -> Dict[str, float]:
+    values = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(result: dict, baseline: dict, tolerance: float, floor_ms: float = 1.0) -> List[str]:
+    """Regressions of ``result`` against ``baseline``: latencies up or rates down by more than ``tolerance``.
+
+    Latencies within ``floor_ms`` of the baseline never count, so sub-millisecond noise is not a regression.
+    """
+    current, before = flatten(result), flatten(baseline)
+    regressions = []
+    for key, old in sorted(before.items()):
+        new = current.get(key)
+        if new is None or old is None:
+            continue
+        # Per-camera values are keyed by camera id under the metric's name
+        name = next(part for part in reversed(key.split('.')) if not part.isdigit())
+        if name.endswith(LOWER_IS_BETTER):
+            floor = floor_ms if name.endswith('_ms') else floor_ms / 1000
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{key}: {old} -> {new}")
+        elif name.endswith(HIGHER_IS_BETTER) and new < old * (1 - tolerance):
+            regressions.append(f"{key}: {old} -> {new}")
+    return regressions
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINES, f"{name}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='load an already running backend instead of starting one')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='serve the started backend threaded (werkzeug) or with uvicorn (asgi.py)')
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds between seeding and measuring')
+    parser.add_argument('--outlets', type=int, default=1000)
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='seconds between polls of one outlet')
+    parser.add_argument('--workers', type=int, default=64, help='threads sharing the outlet fleet')
+    parser.add_argument('--rooms', type=int, default=50)
+    parser.add_argument('--crud-rate', type=float, default=5.0, help='dashboard requests/sec, 0 for none')
+    parser.add_argument('--cameras', type=int, default=0)
+    parser.add_argument('--camera-fps', type=float, default=10.0)
+    parser.add_argument('--camera-width', type=int, default=640)
+    parser.add_argument('--clip', help='video replayed by every camera (default: synthetic frames)')
+    parser.add_argument('--person-clip', help='video with a person in view, for the end-to-end trials')
+    parser.add_argument('--max-clip-frames', type=int, default=300)
+    parser.add_argument('--e2e-trials', type=int, default=3)
+    parser.add_argument('--e2e-timeout', type=float, default=30.0)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='environment of the started backend, e.g. OCCUPANCY_WINDOW=2')
+    parser.add_argument('--save-baseline', metavar='NAME', help='store the result as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare with benchmarks/baselines/NAME.json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    args = parser.parse_args()
+
+    env = dict(item.split('=', 1) for item in args.env)
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as directory:
+        process = None
+        base = args.url
+        if base is None:
+            process, base = start_backend(directory, env, args.server)
+        try:
+            wait_ready(base, inference=args.cameras > 0, timeout=300.0)
+            result = run(args, base)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    config = {key: getattr(args, key) for key in ('seconds', 'outlets', 'poll_interval', 'workers', 'rooms',
+                                                   'crud_rate', 'cameras', 'camera_fps', 'camera_width')}
+    config.update(clip=bool(args.clip), person_clip=bool(args.person_clip), env=env)
+    report = {
+        'config': config,
+        'host': {'cpus': os.cpu_count(), 'python': platform.python_version(), 'platform': platform.platform()},
+        'result': result,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(baseline_path(args.save_baseline), 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"Note: baseline {args.compare} was measured with a different configuration", file=sys.stderr)
+        regressions = compare(result, baseline['result'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
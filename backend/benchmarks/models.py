@@ -0,0 +1,125 @@
+"""Person-count accuracy against inference latency for detector models and runtimes.
+
+Samples frames from recorded clips, counts persons in each with every
+candidate model and reports per-frame latency percentiles next to how far
+the counts are from the truth: hand labels when given (``--labels``),
+otherwise the counts of a reference model (``yolo11s`` on PyTorch at full
+size by default). Pick the cheapest model whose counts still match.
+
+Models are ``name[:runtime[:int8]]`` as in ``DETECTION_MODEL`` /
+``DETECTION_RUNTIME`` / ``DETECTION_INT8``; exports are cached in
+``backend/models`` like the service does. Run from the backend directory::
+
+    python benchmarks/models.py --clips recordings/*.mp4 --imgsz 320 \\
+        --models yolo11s,yolo11n,yolo11n:onnx,yolo11n:openvino,yolo11n:openvino:int8
+
+``--labels`` is a JSON file ``{"clip.mp4": {"<frame index>": <persons>, ...}}``
+and limits the benchmark to the labelled frames.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backends import _load_model  # noqa: E402
+from inference import PERSON_CLASS, Detections  # noqa: E402
+from models import ModelSpec  # noqa: E402
+
+WARMUP_FRAMES = 3
+
+
+def sample_frames(clips: List[str], every: int, max_frames: int,
+                  labels: Optional[Dict[str, Dict[str, int]]]) -> List[Tuple[str, int, np.ndarray]]:
+    """``(clip, frame index, frame)`` of every ``every``-th (or every labelled) frame."""
+    frames = []
+    for clip in clips:
+        wanted = None
+        if labels is not None:
+            wanted = {int(index) for index in labels.get(os.path.basename(clip), {})}
+        cap = cv2.VideoCapture(clip)
+        index = 0
+        while len(frames) < max_frames and cap.grab():
+            if (index in wanted) if wanted is not None else index % every == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    frames.append((clip, index, frame))
+            index += 1
+        cap.release()
+    return frames
+
+
+def count_persons(spec: ModelSpec, frames: List[np.ndarray], conf: float) -> Tuple[List[int], List[float]]:
+    """Person count and latency (seconds) per frame, one frame per predict call like a single camera."""
+    model = _load_model(spec.prepare())
+    kwargs = {'conf': conf, 'classes': [PERSON_CLASS], 'imgsz': spec.imgsz, 'verbose': False}
+    for frame in frames[:WARMUP_FRAMES]:
+        model.predict(source=[frame], **kwargs)
+    counts, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        results = model.predict(source=[frame], **kwargs)
+        latencies.append(time.perf_counter() - start)
+        counts.append(Detections.from_result(results[0] if results else None).count())
+    return counts, latencies
+
+
+def score(counts: List[int], truth: List[int], latencies: List[float]) -> dict:
+    errors = np.abs(np.array(counts) - np.array(truth))
+    ms = np.array(latencies) * 1000
+    return {
+        'frames': len(counts),
+        'p50_ms': round(float(np.percentile(ms, 50)), 1),
+        'p95_ms': round(float(np.percentile(ms, 95)), 1),
+        'count_mae': round(float(errors.mean()), 3),
+        'exact': round(float(np.mean(errors == 0)), 3),
+        'within_one': round(float(np.mean(errors <= 1)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clips', nargs='+', required=True, help='recorded video files')
+    parser.add_argument('--models', default='yolo11s,yolo11n,yolo11n:onnx,yolo11n:openvino,yolo11n:openvino:int8')
+    parser.add_argument('--reference', default='yolo11s', help='model whose counts are the truth without --labels')
+    parser.add_argument('--labels', help='JSON file of hand-counted persons per clip and frame')
+    parser.add_argument('--imgsz', type=int, default=640, help='inference (and export) size of the candidates')
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--every', type=int, default=15, help='sample every Nth frame')
+    parser.add_argument('--max-frames', type=int, default=300)
+    parser.add_argument('--json', action='store_true', help='print one JSON object per model')
+    args = parser.parse_args()
+
+    labels = None
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+    samples = sample_frames(args.clips, args.every, args.max_frames, labels)
+    if not samples:
+        sys.exit("No frames read from the clips")
+    frames = [frame for _, _, frame in samples]
+
+    if labels is not None:
+        truth = [labels[os.path.basename(clip)][str(index)] for clip, index, _ in samples]
+    else:
+        truth, _ = count_persons(ModelSpec.parse(args.reference), frames, args.conf)
+
+    for text in args.models.split(','):
+        spec = ModelSpec.parse(text, args.imgsz)
+        counts, latencies = count_persons(spec, frames, args.conf)
+        result = score(counts, truth, latencies)
+        if args.json:
+            print(json.dumps(dict(result, model=text, imgsz=args.imgsz)))
+        else:
+            print(f"{text:>24}: p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  "
+                  f"count MAE {result['count_mae']}  exact {result['exact']:.0%}  "
+                  f"within 1 {result['within_one']:.0%}")
+
+
+if __name__ == '__main__':
+    main()
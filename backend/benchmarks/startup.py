@@ -0,0 +1,94 @@
+"""Cold-start time of the backend: process start to the first outlet status response.
+
+Starts the app in a fresh process (on a temporary database) and polls
+``/api/device/status`` until it answers, then ``/api/ready?inference=1``
+until the detection model is loaded. Reports both times, the median over
+``--runs`` starts. Run from the backend directory::
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVE = ("import sys; import app; from werkzeug.serving import make_server; "
+         "make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True).serve_forever()")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+
+def run(timeout: float, env: dict) -> dict:
+    with tempfile.TemporaryDirectory(prefix='startup-bench-') as directory:
+        port = _free_port()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                   TIMESERIES_DIR=os.path.join(directory, 'timeseries'), **env)
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, '-c', SERVE, str(port)], cwd=BACKEND, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = f"http://127.0.0.1:{port}"
+        first_response = inference_ready = None
+        try:
+            while time.perf_counter() - started < timeout and process.poll() is None:
+                if first_response is None:
+                    # Unknown hardware id: a 404 is still a full round trip through the app
+                    if _status(f"{base}/api/device/status?hardware_id=startup-bench"):
+                        first_response = time.perf_counter() - started
+                elif _status(f"{base}/api/ready?inference=1") == 200:
+                    inference_ready = time.perf_counter() - started
+                    break
+                time.sleep(0.01)
+        finally:
+            process.terminate()
+            process.wait()
+        return {'first_response_s': first_response, 'inference_ready_s': inference_ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=120.0, help='give up on a start after this long')
+    parser.add_argument('--lazy', action='store_true', help='start with MODEL_WARMUP=lazy')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args()
+
+    env = {'MODEL_WARMUP': 'lazy'} if args.lazy else {}
+    runs = [run(args.timeout, env) for _ in range(args.runs)]
+
+    def median(key):
+        values = [r[key] for r in runs if r[key] is not None]
+        return round(statistics.median(values), 3) if values else None
+
+    result = {'runs': len(runs), 'first_response_s': median('first_response_s'),
+              'inference_ready_s': median('inference_ready_s')}
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"first /api/device/status response: {result['first_response_s']} s, "
+              f"inference ready: {result['inference_ready_s']} s (median of {len(runs)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,130 +1,822 @@
 import cv2
+import os
 import threading
 import time
-from ultralytics import YOLO
 import numpy as np
-from typing import Optional, Tuple, Dict
+from typing import AsyncIterator, Callable, Optional, Tuple, Dict, Iterator, List, Set, Union
+from backends import InferenceBackend, create_backend
+from connection import CONNECTING, FAILED, LIVE, STALLED, CameraHealth, ConnectionPolicy
+from decode import CameraSource, DecodeOptions, open_capture
+from metrics import REGISTRY, TimedLock, counter, histogram
+from models import ModelSpec
+from framering import FrameRing
+from inference import PERSON_CLASS, DetectionConfig, Detections, FrameGate, InferenceScheduler, annotate
+from occupancy import OccupancyPolicy, PersonTracker
+from streaming import FrameBroadcaster, StreamProfile
+from zones import split_zone, zone_key
+
+FRAME_READ_SECONDS = histogram('camera_frame_read_seconds', 'Time to read and decode one frame, waiting for it included',
+                               ('camera',))
+RECONNECTS = counter('camera_reconnects_total', 'Failed opens and reads, each followed by a reconnect', ('camera',))
+RING_FULL_DROPS = counter('camera_ring_full_drops_total', 'Frames read and dropped because every ring slot was pinned',
+                          ('camera',))
+INFERRED_FRAMES = counter('camera_inferred_frames_total', 'Frames inference results were published for', ('camera',))
+INFERENCE_BATCH_SECONDS = histogram('inference_batch_seconds', 'Time the model took for one batch of frames')
+INFERENCE_LOOP_SECONDS = histogram('inference_loop_seconds', 'One pass of the inference loop, from wake-up to published results')
+LOCK_WAIT_SECONDS = histogram('camera_service_lock_wait_seconds', 'Time spent waiting for the camera service lock')
+
+
+class CameraStream:
+    """A single camera with its own grab thread.
+
+    The grab thread opens the stored source itself and reconnects to it with
+    exponential backoff (``ConnectionPolicy``), so neither adding a camera
+    nor a dead source ever blocks a request. It decodes straight into a slot of the camera's shared-memory
+    ``FrameRing`` and advertises it as the newest frame, so a slow RTSP stream
+    only ever delays itself. ``self.lock`` guards pointer swaps on the slot
+    and the published results; no I/O or inference runs while it is held.
+
+    Ring slots stay pinned while they are in flight to inference, while they
+    hold the published ``output``, and for as long as the feed broadcaster
+    may still encode them (it releases them through ``FrameBroadcaster.publish``'s
+    ``release``).
+
+    When the source has a separate inference stream (an RTSP sub-stream),
+    the grab thread decodes that one and a second thread decodes the main
+    stream only while the feed has viewers, drawing the latest boxes scaled
+    to its resolution.
+
+    The published person count is that of a ``PersonTracker`` over the
+    detections, so one missed detection does not change it.
+
+    With zones (``source.zones``), inference gets only the box around them,
+    cut out of the ring slot without a copy, and its boxes are moved back
+    onto the whole frame before tracking. The camera then counts the people
+    standing in any zone and publishes each zone's count as a count of its
+    own, keyed ``<camera_id>:<zone>``.
+    """
+
+    # Seconds the main-stream reader keeps running after the last viewer left
+    VIEW_IDLE_TIMEOUT = 5.0
+
+    def __init__(self, camera_id: str, source: CameraSource, on_frame=None,
+                 config: Optional[DetectionConfig] = None, renderer=None, ring_size: int = 6,
+                 on_count=None, policy: Optional[ConnectionPolicy] = None, view_fps: float = 15.0,
+                 occupancy: Optional[OccupancyPolicy] = None):
+        self.camera_id = camera_id
+        self.source = source
+        self.decode = source.decode or DecodeOptions()
+        # Opened by the grab thread; None while (re)connecting
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.policy = policy or ConnectionPolicy()
+        # Connection health, guarded by self.lock
+        self.state = CONNECTING
+        self.state_since = time.time()
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        # Cuts a reconnect backoff short on stop()
+        self._wake = threading.Event()
+        # Reasons to stay open (e.g. 'automation'); without any, the camera closes once idle
+        self.consumers: Set[str] = set()
+        self.last_used = time.monotonic()
+        self.on_frame = on_frame
+        # Called as on_count(camera_id, person_count) whenever the (tracked) count changes
+        self.on_count = on_count
+        self.tracker = PersonTracker(occupancy)
+        self.zones = source.zones
+        # Zone name -> tracked count of people standing in it, guarded by self.lock
+        self.zone_counts: Dict[str, int] = {}
+        # Decides which frames are worth running inference on
+        self.gate = FrameGate(config or DetectionConfig())
+        self.lock = threading.Lock()
+        # Preallocated on the first frame, once the resolution is known
+        self.ring: Optional[FrameRing] = None
+        self.ring_size = ring_size
+        # Newest frame: view into the ring plus its slot and ring seq
+        self.frame: Optional[np.ndarray] = None
+        self.frame_index = -1
+        self.frame_ring_seq = 0
+        self.frame_seq = 0
+        self.frame_time = 0.0
+        # Sequence number of the last frame handed to inference
+        self.taken_seq = 0
+        # (ring, index, ring_seq) of the frame in flight and of the published output
+        self._inflight: Optional[Tuple[FrameRing, int, int]] = None
+        self._output_slot: Optional[Tuple[FrameRing, int, int]] = None
+        # (whole frame, x0, y0) when the frame in flight was cropped to the zones
+        self._crop: Optional[Tuple[np.ndarray, int, int]] = None
+        # Published results: raw inferred frame, its detections, person count, last update time
+        self.output: Optional[np.ndarray] = None
+        self.detections: Detections = Detections.empty()
+        self.person_count = 0
+        self.last_update = time.time()
+        # Frames inference results were published for
+        self.inferred = 0
+        # Encode-once JPEG fan-out to feed viewers; overlays are drawn only when a viewer encodes
+        self.broadcast = FrameBroadcaster(renderer=renderer, name=camera_id)
+        # Main-stream reader for viewers when inference runs on a sub-stream
+        self.view_fps = view_fps
+        self._view_thread: Optional[threading.Thread] = None
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._grab_loop, name=f"camera-{self.camera_id}", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        thread = self.thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        if (thread is None or not thread.is_alive()) and self.cap is not None:
+            # Otherwise the grab thread is still blocked in cap.read() or opening the source;
+            # releasing the capture under it can crash OpenCV, so it releases it on the way out
+            self.cap.release()
+            self.cap = None
+        self.broadcast.close()
+        if self.ring is not None:
+            self.ring.close()
+
+    def _grab_loop(self):
+        try:
+            while self.running:
+                if self.cap is None and not self._connect():
+                    continue
+                self._grab_frames()
+        finally:
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+
+    def _connect(self) -> bool:
+        """Open the stored source; after a failure, wait out the backoff before returning."""
+        with self.lock:
+            if self.state != FAILED:
+                self._set_state(CONNECTING)
+        url = self.source.inference_url or self.source.url
+        cap = open_capture(url, self.decode)
+        if cap.isOpened() and self.running:
+            self.cap = cap
+            return True
+        cap.release()
+        if self.running:
+            self._retry_later(f"Could not open source {url}")
+        return False
+
+    def ensure_view(self):
+        """Start decoding the main stream for viewers, if it is separate and not running yet."""
+        if self.source.view_url is None or not self.running:
+            return
+        with self.lock:
+            if self._view_thread is not None:
+                return
+            self._view_thread = threading.Thread(target=self._view_loop, name=f"camera-view-{self.camera_id}",
+                                                 daemon=True)
+        self._view_thread.start()
+
+    def _view_loop(self):
+        # Frames above the viewers' rate are dropped with grab() alone
+        cap = open_capture(self.source.view_url, DecodeOptions(max_fps=self.view_fps, hwaccel=self.decode.hwaccel))
+        try:
+            if not cap.isOpened():
+                print(f"Could not open main stream of camera {self.camera_id}: {self.source.view_url}")
+                return
+            last_viewer = time.monotonic()
+            while self.running:
+                now = time.monotonic()
+                if self.broadcast.subscribers:
+                    last_viewer = now
+                elif now - last_viewer > self.VIEW_IDLE_TIMEOUT:
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    print(f"Failed to read main stream of camera {self.camera_id}")
+                    break
+                with self.lock:
+                    detections, inferred = self.detections, self.output
+                if inferred is not None and inferred.shape[:2] != frame.shape[:2]:
+                    detections = detections.scaled(frame.shape[1] / inferred.shape[1],
+                                                   frame.shape[0] / inferred.shape[0])
+                self.broadcast.publish(frame, detections)
+        finally:
+            cap.release()
+            with self.lock:
+                self._view_thread = None
+
+    def _retry_later(self, error: str):
+        RECONNECTS.inc(camera=self.camera_id)
+        with self.lock:
+            self.attempts += 1
+            self.last_error = error
+            attempts = self.attempts
+            if attempts >= self.policy.fail_after:
+                self._set_state(FAILED)
+        delay = self.policy.delay(attempts)
+        print(f"Camera {self.camera_id}: {error}; retrying in {delay:.1f}s (attempt {attempts})")
+        self._wake.wait(delay)
+
+    def _set_state(self, state: str):
+        # Caller holds self.lock
+        if state != self.state:
+            self.state = state
+            self.state_since = time.time()
+
+    def health(self) -> CameraHealth:
+        with self.lock:
+            state, since = self.state, self.state_since
+            if state == LIVE and time.time() - self.frame_time > self.policy.stall_timeout:
+                state, since = STALLED, self.frame_time + self.policy.stall_timeout
+            return CameraHealth(state, since, self.attempts, self.frame_time or None, self.last_error)
+
+    def is_idle(self, now: float) -> bool:
+        """No consumer, no viewer, and unused for the grace period (``now`` is monotonic)."""
+        if self.consumers:
+            return False
+        if self.broadcast.subscribers:
+            self.last_used = now  # The grace period starts when the last viewer leaves
+            return False
+        return now - self.last_used > self.policy.idle_grace
+
+    def _grab_frames(self):
+        while self.running:
+            ring = self.ring
+            started = time.perf_counter()
+            index = None
+            if ring is not None:
+                try:
+                    index = ring.acquire()
+                except RuntimeError:
+                    pass  # Every slot is pinned by inference and viewers: read the frame anyway, then drop it
+            if index is None:
+                ret, frame = self.cap.read()
+            else:
+                # Decodes in place when the slot matches the stream resolution
+                ret, frame = self.cap.read(ring.view(index))
+            FRAME_READ_SECONDS.observe(time.perf_counter() - started, camera=self.camera_id)
+            if not self.running:
+                break
+            if not ret:
+                self._on_read_failure()
+                return
+            if index is None and ring is not None and frame.shape == ring.shape:
+                # Keeps up with the source so it does not buffer; the next read finds a slot once one is unpinned
+                RING_FULL_DROPS.inc(camera=self.camera_id)
+                continue
+            if ring is None or frame.shape != ring.shape:
+                ring = self._allocate_ring(frame.shape)
+                index = ring.acquire()
+                ring.view(index)[...] = frame
+            now = time.time()
+            with self.lock:
+                self.frame_ring_seq = ring.commit(index, now)
+                self.frame_index = index
+                self.frame = ring.view(index)
+                self.frame_seq += 1
+                self.frame_time = now
+                if self.state != LIVE:
+                    self._set_state(LIVE)
+                    self.attempts = 0
+            if self.on_frame is not None:
+                self.on_frame()
+
+    def _allocate_ring(self, shape: Tuple[int, ...]) -> FrameRing:
+        ring = FrameRing(shape, capacity=self.ring_size)
+        old = self.ring
+        with self.lock:
+            self.ring = ring
+            self.frame = None
+        if old is not None:
+            # Views still held by readers keep the old mapping alive until dropped
+            old.close()
+        return ring
+
+    def _on_read_failure(self):
+        with self.lock:
+            self._set_state(CONNECTING)
+            changed = self.person_count != 0
+            self.frame = None
+            self.output = None
+            self.detections = Detections.empty()
+            self.person_count = 0
+            self.last_update = time.time()
+            # Slots the broadcaster still encodes from are released by it, once it is done
+            self._release_output()
+            self.tracker.reset()
+            dropped = [name for name, count in self.zone_counts.items() if count]
+            self.zone_counts = dict.fromkeys(self.zone_counts, 0)
+        if changed and self.on_count is not None:
+            self.on_count(self.camera_id, 0)
+        self._notify_zones(dict.fromkeys(dropped, 0))
+        # The grab loop reconnects to the stored source once the backoff has passed
+        self.cap.release()
+        self.cap = None
+        if self.running:
+            self._retry_later("Read failed")
+
+    def set_zones(self, source: CameraSource):
+        """Take over ``source``, which differs from the current one in its zones only; no reconnect."""
+        names = set(source.zones.names) if source.zones is not None else set()
+        with self.lock:
+            self.source = source
+            self.zones = source.zones
+            dropped = [name for name, count in self.zone_counts.items() if count and name not in names]
+            self.zone_counts = {name: count for name, count in self.zone_counts.items() if name in names}
+        # Nobody stands in a zone that is gone; the camera's own count follows with the next inference
+        self._notify_zones(dict.fromkeys(dropped, 0))
+
+    def _notify_zones(self, counts: Dict[str, int]):
+        if self.on_count is not None:
+            for name, count in counts.items():
+                self.on_count(zone_key(self.camera_id, name), count)
+
+    def _release_output(self):
+        # Caller holds self.lock
+        if self._output_slot is not None:
+            ring, index, _ = self._output_slot
+            ring.unpin(index)
+            self._output_slot = None
+
+    def _unpinner(self, ring: FrameRing, index: int) -> Callable[[], None]:
+        def release():
+            with self.lock:
+                ring.unpin(index)
+        return release
+
+    def has_pending(self) -> bool:
+        with self.lock:
+            return self.frame is not None and self.frame_seq != self.taken_seq
+
+    def take_pending(self) -> Optional[Tuple[int, np.ndarray]]:
+        """Return the newest frame if it has not been handed to inference yet.
+
+        The frame is a view into the ring; its slot stays pinned until the
+        result is published or the frame is discarded.
+        """
+        with self.lock:
+            if self.frame is None or self.frame_seq == self.taken_seq:
+                return None
+            self.taken_seq = self.frame_seq
+            self._discard_inflight()
+            self.ring.pin(self.frame_index)
+            self._inflight = (self.ring, self.frame_index, self.frame_ring_seq)
+            frame = self.frame
+            if self.zones is not None:
+                x0, y0, x1, y1 = self.zones.bounds(frame.shape[1], frame.shape[0], self.gate.config.zone_margin)
+                self._crop = (frame, x0, y0)
+                frame = frame[y0:y1, x0:x1]
+            return self.frame_seq, frame
+
+    def discard(self):
+        """Release the in-flight frame without publishing a result for it."""
+        with self.lock:
+            self._discard_inflight()
+
+    def _discard_inflight(self):
+        if self._inflight is not None:
+            ring, index, _ = self._inflight
+            ring.unpin(index)
+            self._inflight = None
+        self._crop = None
+
+    def publish(self, frame: np.ndarray, detections: Detections):
+        zone_changes = {}
+        release = None
+        with self.lock:
+            if self._crop is not None:
+                # Inference saw the crop around the zones: back onto the whole frame
+                frame, x0, y0 = self._crop
+                detections = detections.shifted(x0, y0)
+                self._crop = None
+            person_count = self.tracker.update(detections.xyxy[detections.cls == PERSON_CLASS])
+            if self.zones is not None:
+                person_count, zone_counts = self.zones.count(self.tracker.confirmed(), frame.shape[1], frame.shape[0])
+                zone_changes = {name: count for name, count in zone_counts.items()
+                                if self.zone_counts.get(name) != count}
+                self.zone_counts = zone_counts
+            if self._inflight is not None:
+                ring, index, ring_seq = self._inflight
+                ring.set_count(index, ring_seq, person_count, detections)
+                # The in-flight pin moves over to the published output
+                self._release_output()
+                self._output_slot, self._inflight = self._inflight, None
+                if self.source.view_url is None:
+                    ring.pin(index)
+                    release = self._unpinner(ring, index)
+            changed = person_count != self.person_count or self.output is None
+            self.output = frame
+            self.detections = detections
+            self.person_count = person_count
+            self.last_update = time.time()
+            self.inferred += 1
+        INFERRED_FRAMES.inc(camera=self.camera_id)
+        if self.source.view_url is None:
+            self.broadcast.publish(frame, detections, release=release)
+        if changed and self.on_count is not None:
+            self.on_count(self.camera_id, person_count)
+        self._notify_zones(zone_changes)
+
 
 class CameraService:
     _instance = None
     _lock = threading.Lock()
-    
+
+    IDLE_CHECK_INTERVAL = 1.0
+
     def __new__(cls):
         with cls._lock:
             if cls._instance is None:
                 cls._instance = super(CameraService, cls).__new__(cls)
                 cls._instance._initialize()
         return cls._instance
-    
+
     def _initialize(self):
-        # Store (cv2.VideoCapture, current_frame, last_update_time, person_count)
-        self.cameras: Dict[str, Tuple[cv2.VideoCapture, np.ndarray, float, int]] = {}
-        self.model = YOLO("yolo11s.pt")
-        self.lock = threading.Lock()
+        self.cameras: Dict[str, CameraStream] = {}
+        self.detection_config = DetectionConfig.from_env()
+        # Thread-local model or a pool of worker processes (INFERENCE_BACKEND), running the model
+        # and runtime picked by DETECTION_MODEL / DETECTION_RUNTIME, exported at the inference size
+        self.model_spec = ModelSpec.from_env(self.detection_config.imgsz)
+        # Loaded in the background by warm_up(), so importing this module and serving the
+        # API never waits for torch/ultralytics, the weights or an export
+        self.backend: Optional[InferenceBackend] = None
+        self.model_state = 'idle'  # idle -> loading -> ready | failed
+        self.model_error: Optional[str] = None
+        self.model_load_seconds: Optional[float] = None
+        self.model_ready = threading.Event()
+        self.stream_profile = StreamProfile.from_env()
+        # Raw frames kept per camera in its shared-memory ring
+        self.ring_size = int(os.environ.get('CAMERA_RING_SIZE', 6))
+        # Reconnect backoff, stall detection and idle close (CAMERA_BACKOFF_*, CAMERA_IDLE_GRACE, ...)
+        self.connection_policy = ConnectionPolicy.from_env()
+        # Reader, decode size and rate of inference streams (CAMERA_READER, CAMERA_DECODE_*); rooms may override
+        self.decode_options = DecodeOptions.from_env()
+        # Person tracking per camera and count smoothing per room (OCCUPANCY_*)
+        self.occupancy_policy = OccupancyPolicy.from_env()
+        # Guards the cameras dict only; per-camera state has its own lock
+        self.lock = TimedLock(LOCK_WAIT_SECONDS)
         self.running = True
-        # Start the camera update thread
-        self.thread = threading.Thread(target=self._update_cameras, daemon=True)
+        self._count_listeners: List[Callable[[str, int], None]] = []
+        # Set by grab threads whenever a new frame lands in a slot
+        self.frame_ready = threading.Event()
+        self.scheduler = InferenceScheduler(
+            self._predict_batch,
+            latency_budget=float(os.environ.get('INFERENCE_LATENCY_BUDGET', 0.25)),
+            max_batch_size=int(os.environ.get('INFERENCE_MAX_BATCH', 16)),
+            max_interval=float(os.environ.get('INFERENCE_MAX_INTERVAL', 1.0)),
+        )
+        # Start the inference thread
+        self.thread = threading.Thread(target=self._inference_loop, name="camera-inference", daemon=True)
         self.thread.start()
-    
-    def add_camera(self, camera_id: str, source: str) -> bool:
-        """Add a new camera feed.
-        
+        threading.Thread(target=self._monitor_loop, name="camera-monitor", daemon=True).start()
+
+    def warm_up(self):
+        """Start loading the model in the background; later calls do nothing.
+
+        Called at startup (unless MODEL_WARMUP=lazy) and when the first
+        camera is added. Frames are not inferred until the model is ready.
+        """
+        with self.lock:
+            if self.model_state != 'idle':
+                return
+            self.model_state = 'loading'
+        threading.Thread(target=self._load_model, name="model-loader", daemon=True).start()
+
+    def _load_model(self):
+        started = time.monotonic()
+        try:
+            backend = create_backend(self.model_spec.prepare())
+            # The first predict initializes the runtime (and for torch, lazy modules); pay it now
+            backend.predict([np.zeros((64, 64, 3), np.uint8)], self.detection_config.predict_kwargs())
+        except Exception as e:
+            print(f"Failed to load detection model {self.model_spec.name}: {e}")
+            with self.lock:
+                self.model_state = 'failed'
+                self.model_error = str(e)
+            return
+        if not self.running:
+            backend.close()
+            return
+        self.backend = backend
+        self.model_load_seconds = time.monotonic() - started
+        with self.lock:
+            self.model_state = 'ready'
+        self.model_ready.set()
+        self.frame_ready.set()
+
+    def get_model_status(self) -> dict:
+        """Whether inference is available, for readiness checks."""
+        with self.lock:
+            return {
+                'state': self.model_state,
+                'ready': self.model_state == 'ready',
+                'error': self.model_error,
+                'load_seconds': self.model_load_seconds,
+                'model': self.model_spec._asdict(),
+            }
+
+    def add_camera(self, camera_id: str, source: Union[str, CameraSource], config: Optional[DetectionConfig] = None,
+                   consumer: Optional[str] = None) -> bool:
+        """Start a camera feed, or keep an already running one open.
+
+        Returns at once: the camera's grab thread connects in the background
+        (see ``get_health``). A camera closes after ``idle_grace`` seconds
+        without viewers unless ``consumer`` names a reason to keep it open,
+        until ``release_camera`` is called for it.
+
         Args:
             camera_id: Unique identifier for the camera
-            source: Can be an RTSP URL (e.g., 'rtsp://...') or a camera index (e.g., '0' for default webcam)
+            source: Can be an RTSP URL (e.g., 'rtsp://...') or a camera index (e.g., '0' for default webcam),
+                or a ``CameraSource`` with a sub-stream for inference and decode options
+            config: Per-camera frame skipping/motion settings, defaults to the service config
+            consumer: Keeps the camera open, e.g. 'automation'
         """
+        if not self.running:
+            return False
+        self.warm_up()
+        if isinstance(source, str):
+            source = CameraSource(source)
+        if source.decode is None:
+            source = source._replace(decode=self.decode_options)
+        replaced = rezoned = None
         with self.lock:
-            if camera_id in self.cameras:
-                return True  # Already added
-                
-            # Check if source is a numeric camera index
-            try:
-                # Try to convert to int for local camera index
-                camera_index = int(source)
-                cap = cv2.VideoCapture(camera_index)
-            except ValueError:
-                # If not an int, treat as URL/RTSP
-                cap = cv2.VideoCapture(source)
-            if not cap.isOpened():
-                print(f"Failed to open camera {camera_id} with source: {source}")
-                return False
-                
-            # Store camera capture, current frame, last update time, and initial person count
-            self.cameras[camera_id] = (cap, None, time.time(), 0)
-            return True
-    
+            stream = self.cameras.get(camera_id)
+            if stream is not None and stream.source != source:
+                if stream.source._replace(zones=None) == source._replace(zones=None):
+                    # Only the zones changed: the next inference crops and counts by the new ones
+                    rezoned = stream
+                else:
+                    # The room's camera or its decode options changed: reconnect
+                    replaced, stream = stream, None
+            started = stream is None
+            if started:
+                stream = CameraStream(camera_id, source, on_frame=self.frame_ready.set,
+                                      config=config or self.detection_config, renderer=self._annotate,
+                                      ring_size=self.ring_size, on_count=self._notify_count,
+                                      policy=self.connection_policy, view_fps=self.stream_profile.max_fps,
+                                      occupancy=self.occupancy_policy)
+                if replaced is not None:
+                    stream.consumers.update(replaced.consumers)
+                self.cameras[camera_id] = stream
+            if consumer is not None:
+                stream.consumers.add(consumer)
+            stream.last_used = time.monotonic()
+        if rezoned is not None:
+            rezoned.set_zones(source)
+        if replaced is not None:
+            self._close(replaced)
+        if started:
+            stream.start()
+        return True
+
+    def release_camera(self, camera_id: str, consumer: str):
+        """Drop one reason to keep a camera open; it closes once idle for the grace period."""
+        with self.lock:
+            stream = self.cameras.get(camera_id)
+            if stream is not None and consumer in stream.consumers:
+                stream.consumers.discard(consumer)
+                stream.last_used = time.monotonic()
+
+    def set_consumers(self, consumer: str, cameras: Dict[str, Union[str, CameraSource]]):
+        """Make ``cameras`` (``{camera_id: source}``) exactly the cameras held open by ``consumer``."""
+        with self.lock:
+            released = [camera_id for camera_id, stream in self.cameras.items()
+                        if consumer in stream.consumers and camera_id not in cameras]
+        for camera_id in released:
+            self.release_camera(camera_id, consumer)
+        for camera_id, source in cameras.items():
+            self.add_camera(camera_id, source, consumer=consumer)
+
     def remove_camera(self, camera_id: str):
         """Remove a camera feed."""
         with self.lock:
-            if camera_id in self.cameras:
-                cap, _, _ = self.cameras[camera_id]
-                cap.release()
-                del self.cameras[camera_id]
-    
-    def get_frame(self, camera_id: str) -> Optional[bytes]:
-        """Get the latest frame from a camera as JPEG bytes."""
+            stream = self.cameras.pop(camera_id, None)
+        if stream is not None:
+            self._close(stream)
+
+    def _close(self, stream: CameraStream):
+        stream.stop()
+        if self.cameras.get(stream.camera_id) is None:
+            REGISTRY.remove(camera=stream.camera_id)
+            if stream.person_count:
+                # Nobody is seen by a closed camera; don't leave its last count behind in the room's total
+                self._notify_count(stream.camera_id, 0)
+            for name, count in stream.zone_counts.items():
+                if count:
+                    self._notify_count(zone_key(stream.camera_id, name), 0)
+
+    def _monitor_loop(self):
+        """Close cameras nobody has used for the grace period."""
+        while self.running:
+            time.sleep(self.IDLE_CHECK_INTERVAL)
+            now = time.monotonic()
+            with self.lock:
+                idle = [camera_id for camera_id, stream in self.cameras.items() if stream.is_idle(now)]
+                streams = [self.cameras.pop(camera_id) for camera_id in idle]
+            for stream in streams:
+                print(f"Closing idle camera {stream.camera_id}")
+                self._close(stream)
+
+    def add_count_listener(self, listener: Callable[[str, int], None]):
+        """Call ``listener(camera_id, person_count)`` whenever a camera's count changes.
+
+        Listeners run on the inference thread and must return quickly.
+        """
+        self._count_listeners.append(listener)
+
+    def remove_count_listener(self, listener: Callable[[str, int], None]):
+        if listener in self._count_listeners:
+            self._count_listeners.remove(listener)
+
+    def _notify_count(self, camera_id: str, person_count: int):
+        for listener in list(self._count_listeners):
+            try:
+                listener(camera_id, person_count)
+            except Exception as e:
+                print(f"Count listener failed for camera {camera_id}: {e}")
+
+    def get_camera_ids(self) -> List[str]:
+        """Ids of the cameras this process is running."""
         with self.lock:
-            if camera_id not in self.cameras:
-                return None
-                
-            _, frame, _, _ = self.cameras[camera_id]
-            if frame is None:
-                return None
-                
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', frame)
-            return buffer.tobytes()
-    
-    def _update_cameras(self):
-        """Background thread to update camera frames."""
+            return list(self.cameras)
+
+    def _get_stream(self, camera_id: str) -> Optional[CameraStream]:
+        with self.lock:
+            return self.cameras.get(camera_id)
+
+    def get_health(self, camera_id: str) -> Optional[CameraHealth]:
+        """Connection state of a camera, or None if it is not open in this process."""
+        stream = self._get_stream(camera_id)
+        return stream.health() if stream is not None else None
+
+    def get_camera_health(self) -> Dict[str, CameraHealth]:
+        with self.lock:
+            streams = list(self.cameras.values())
+        return {stream.camera_id: stream.health() for stream in streams}
+
+    def get_frame(self, camera_id: str, profile: Optional[StreamProfile] = None) -> Optional[bytes]:
+        """Get the latest frame from a camera as JPEG bytes."""
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        stream.ensure_view()
+        return stream.broadcast.latest(profile or self.stream_profile)
+
+    def get_raw_frame(self, camera_id: str) -> Optional[np.ndarray]:
+        """Get a copy of the newest grabbed frame, or of the latest inferred one if there is none.
+
+        Works before the model is loaded (or when it failed to). The grabbed
+        frame's ring slot is pinned while it is copied, so the grab thread
+        neither overwrites it nor waits for the copy. Never opens the camera
+        or counts as a viewer: None if it is not open in this process.
+        """
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        with stream.lock:
+            if stream.frame is None:
+                return stream.output.copy() if stream.output is not None else None
+            ring, index, frame = stream.ring, stream.frame_index, stream.frame
+            ring.pin(index)
+        try:
+            return frame.copy()
+        finally:
+            with stream.lock:
+                ring.unpin(index)
+
+    def get_frame_ring(self, camera_id: str) -> Optional[str]:
+        """Shared-memory name of a camera's frame ring, for ``FrameRing.attach`` in other processes."""
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        with stream.lock:
+            return stream.ring.name if stream.ring is not None else None
+
+    def get_detections(self, camera_id: str) -> Optional[Detections]:
+        """Get the detections of the latest inferred frame."""
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        with stream.lock:
+            return stream.detections
+
+    def stream_frames(self, camera_id: str, profile: Optional[StreamProfile] = None) -> Optional[Iterator[bytes]]:
+        """Iterate JPEG frames for a viewer, blocking until each new frame is published.
+
+        Viewers asking for the same profile share one encode per frame.
+        Returns None if the camera is unknown.
+        """
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        stream.ensure_view()
+        return stream.broadcast.subscribe(profile or self.stream_profile)
+
+    def stream_frames_async(self, camera_id: str,
+                            profile: Optional[StreamProfile] = None) -> Optional[AsyncIterator[bytes]]:
+        """``stream_frames`` for coroutines: a viewer waiting for the next frame holds no thread."""
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        stream.ensure_view()
+        return stream.broadcast.subscribe_async(profile or self.stream_profile)
+
+    def _inference_loop(self):
+        """Background thread that runs batched detection over the newest frame of each camera."""
         while self.running:
+            if not self.model_ready.is_set():
+                # Grab threads keep only the newest frame meanwhile; nothing piles up
+                self.model_ready.wait(timeout=0.5)
+                continue
+            self.frame_ready.wait(timeout=0.5)
+            self.frame_ready.clear()
+            started = time.perf_counter()
+
             with self.lock:
-                for camera_id, (cap, _, _, _) in list(self.cameras.items()):
-                    ret, frame = cap.read()
-                    person_count = 0
-                    if ret:
-                        # Run object detection
-                        results = self.model.predict(source=frame, conf=0.5, verbose=False)
-                        if len(results) > 0 and len(results[0].boxes) > 0:
-                            boxes = results[0].boxes
-                            # Count persons (YOLO class 0 is 'person')
-                            for box in boxes:
-                                if hasattr(box, 'cls'):
-                                    cls_id = int(box.cls[0]) if hasattr(box.cls, '__getitem__') else int(box.cls)
-                                    if cls_id == 0:
-                                        person_count += 1
-                            # Overlay person count on frame
-                            frame = results[0].plot()
-                            cv2.putText(frame, f'Persons: {person_count}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2, cv2.LINE_AA)
-                        # Update frame, timestamp, and person_count
-                        self.cameras[camera_id] = (cap, frame, time.time(), person_count)
-                    else:
-                        print(f"Failed to read from camera {camera_id}")
-                        # Reconnect after a short delay
-                        cap.release()
-                        cap = cv2.VideoCapture(camera_id)
-                        self.cameras[camera_id] = (cap, None, time.time(), 0)
-            
-            time.sleep(0.033)  # ~30 FPS
-    
-    def get_person_count(self, camera_id: str) -> Optional[int]:
-        """Get the number of persons detected in the latest frame."""
+                streams: List[CameraStream] = list(self.cameras.values())
+
+            batch = self.scheduler.collect(streams)
+            if batch:
+                try:
+                    results = self.scheduler.run([frame for _, frame in batch])
+                except Exception as e:
+                    print(f"Inference failed for batch of {len(batch)} frames: {e}")
+                    results = []
+                for (stream, frame), detections in zip(batch, results):
+                    stream.publish(frame, detections)
+            INFERENCE_LOOP_SECONDS.observe(time.perf_counter() - started)
+
+            if self.scheduler.backlog:
+                # Cameras that did not fit in this batch go first next tick
+                self.frame_ready.set()
+            if self.scheduler.interval:
+                time.sleep(self.scheduler.interval)
+
+    def _predict_batch(self, frames: List[np.ndarray]) -> List[Detections]:
+        started = time.perf_counter()
+        results = self.backend.predict(frames, self.detection_config.predict_kwargs())
+        INFERENCE_BATCH_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    def _annotate(self, frame: np.ndarray, detections: Detections) -> np.ndarray:
+        return annotate(frame, detections, self.backend.names if self.backend is not None else None)
+
+    def get_inference_stats(self) -> dict:
+        """Batch latency and frames/sec of the inference scheduler."""
+        stats = self.scheduler.get_stats()
+        stats['model'] = self.model_spec._asdict()
         with self.lock:
-            if camera_id not in self.cameras:
-                return None
-            _, _, _, person_count = self.cameras[camera_id]
-            return person_count
+            streams = list(self.cameras.values())
+        stats['cameras'] = len(streams)
+        # Cumulative, per camera: frames/sec per camera is the difference between two reads
+        stats['inferred_frames'] = {stream.camera_id: stream.inferred for stream in streams}
+        stats['skipped_frames'] = sum(stream.gate.skipped for stream in streams)
+        # Frames dropped by the decode rate cap before they were converted
+        stats['dropped_frames'] = sum(getattr(stream.cap, 'dropped', 0) for stream in streams)
+        return stats
+
+    def get_person_count(self, camera_id: str) -> Optional[int]:
+        """Get the number of persons detected in the latest frame, of a camera or a zone (``<camera>:<zone>``)."""
+        state = self.get_camera_state(camera_id)
+        return state[0] if state is not None else None
+
+    def get_camera_state(self, camera_id: str) -> Optional[Tuple[int, float]]:
+        """Get ``(person_count, last_update)`` for a camera or one of its zones, or None if unknown."""
+        camera_id, zone = split_zone(camera_id)
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return None
+        with stream.lock:
+            if zone is None:
+                return stream.person_count, stream.last_update
+            person_count = stream.zone_counts.get(zone)
+            return (person_count, stream.last_update) if person_count is not None else None
+
+    def get_zone_counts(self, camera_id: str) -> Dict[str, int]:
+        """Counts of a camera's zones, keyed ``<camera_id>:<zone>``; empty without zones."""
+        stream = self._get_stream(camera_id)
+        if stream is None:
+            return {}
+        with stream.lock:
+            return {zone_key(camera_id, name): count for name, count in stream.zone_counts.items()}
 
     def cleanup(self):
         """Clean up resources."""
         self.running = False
+        self.frame_ready.set()
         if self.thread.is_alive():
             self.thread.join()
-            
+
         with self.lock:
-            for cap, _, _ in self.cameras.values():
-                cap.release()
+            streams = list(self.cameras.values())
             self.cameras.clear()
+        for stream in streams:
+            stream.stop()
+        if self.backend is not None:
+            self.backend.close()
 
 # Global instance
 camera_service = CameraService()
@@ -0,0 +1,662 @@
+import json
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from zones import split_zone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class LocalLeaseStore:
+    """In-memory leases with a TTL; shared by every ``Cluster`` in one process.
+
+    The stand-in for tests and single-process runs of the clustered code path.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew ``name`` for ``ttl`` seconds; False while someone else holds it."""
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] != holder and current[1] > now:
+                return False
+            self._leases[name] = (holder, now + ttl)
+            return True
+
+    def release(self, name: str, holder: str):
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] == holder:
+                del self._leases[name]
+
+    def holders(self, prefix: str = '') -> Dict[str, str]:
+        """``{lease name: holder}`` of the live leases starting with ``prefix``."""
+        now = time.time()
+        with self._lock:
+            return {name: holder for name, (holder, expires_at) in self._leases.items()
+                    if name.startswith(prefix) and expires_at > now}
+
+
+class FileLeaseStore:
+    """Leases as ``flock``-ed files in a directory, for several workers on one host.
+
+    A lease is held for as long as this process keeps the file locked, so the
+    TTL is not needed: the kernel drops the lock the moment a worker dies.
+    """
+
+    def __init__(self, directory: str):
+        if fcntl is None:
+            raise RuntimeError("File leases need fcntl (not available on Windows); use CLUSTER_MODE=db")
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # name -> open, locked file
+        self._held: Dict[str, object] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.lock")
+
+    def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        with self._lock:
+            if name in self._held:
+                return True
+            f = open(self._path(name), 'a+')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            f.seek(0)
+            f.truncate()
+            f.write(holder)
+            f.flush()
+            self._held[name] = f
+            return True
+
+    def release(self, name: str, holder: str):
+        with self._lock:
+            f = self._held.pop(name, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def holders(self, prefix: str = '') -> Dict[str, str]:
+        result = {}
+        for filename in os.listdir(self.directory):
+            if not filename.startswith(prefix) or not filename.endswith('.lock'):
+                continue
+            name = filename[:-len('.lock')]
+            with self._lock:
+                f = self._held.get(name)
+            if f is not None:
+                with open(self._path(name)) as own:
+                    result[name] = own.read()
+                continue
+            try:
+                with open(self._path(name)) as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                    except OSError:
+                        result[name] = f.read()  # Locked by a live worker
+                    else:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            except FileNotFoundError:
+                pass
+        return result
+
+
+class DatabaseLeaseStore:
+    """Leases as rows of the application database, for workers on several hosts.
+
+    Taking a lease is one conditional UPDATE (ours already, or expired),
+    falling back to an INSERT that loses cleanly on the primary key. Hosts
+    compare wall-clock expiry times, so their clocks must be roughly in sync
+    (well within the TTL).
+    """
+
+    def __init__(self, app, db, lease_model):
+        self.app = app
+        self.db = db
+        self.Lease = lease_model
+
+    def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        table = self.Lease.__table__
+        now = time.time()
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                result = session.execute(
+                    update(table)
+                    .where(table.c.name == name, or_(table.c.holder == holder, table.c.expires_at < now))
+                    .values(holder=holder, expires_at=now + ttl)
+                )
+                if result.rowcount:
+                    session.commit()
+                    return True
+                session.execute(insert(table).values(name=name, holder=holder, expires_at=now + ttl))
+                session.commit()
+                return True
+            except IntegrityError:
+                session.rollback()
+                return False
+            except Exception:
+                session.rollback()
+                raise
+
+    def release(self, name: str, holder: str):
+        table = self.Lease.__table__
+        with self.app.app_context():
+            try:
+                self.db.session.execute(delete(table).where(table.c.name == name, table.c.holder == holder))
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def holders(self, prefix: str = '') -> Dict[str, str]:
+        table = self.Lease.__table__
+        with self.app.app_context():
+            rows = self.db.session.execute(
+                select(table.c.name, table.c.holder)
+                .where(table.c.name.startswith(prefix, autoescape=True), table.c.expires_at > time.time())
+            ).all()
+        return dict(rows)
+
+
+def create_lease_store(mode: str, app=None, db=None, lease_model=None):
+    """Build the lease store selected by CLUSTER_MODE (``db``, ``file`` or ``local``)."""
+    if mode == 'db':
+        return DatabaseLeaseStore(app, db, lease_model)
+    if mode == 'file':
+        directory = os.environ.get('CLUSTER_LEASE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'leases'))
+        return FileLeaseStore(directory)
+    if mode == 'local':
+        return LocalLeaseStore()
+    raise ValueError(f"Unknown CLUSTER_MODE: {mode}")
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Cluster:
+    """Scheduler leadership and camera ownership through leases.
+
+    Every ``all``-role worker renews a node lease and campaigns for the
+    ``scheduler`` lease every ``ttl / 3`` seconds; the holder runs the
+    automation engine and history recorder (``on_leadership`` callbacks).
+    Cameras with consumers (``wanted_cameras() -> {room_id: source}``) are
+    claimed one lease each, up to a fair share of the live nodes, so each
+    camera is opened and inferred exactly once. ``api``-role workers hold no
+    leases and only serve requests.
+    """
+
+    LEADER = 'scheduler'
+
+    def __init__(self, store, camera_service, wanted_cameras: Callable[[], Dict[str, str]],
+                 node_id: Optional[str] = None, role: str = 'all', ttl: float = 15.0, max_cameras: int = 0):
+        if role not in ('all', 'api'):
+            raise ValueError(f"Unknown CLUSTER_ROLE: {role}")
+        self.store = store
+        self.camera_service = camera_service
+        self.wanted_cameras = wanted_cameras
+        self.node_id = node_id or default_node_id()
+        self.role = role
+        self.ttl = ttl
+        self.max_cameras = max_cameras
+        self.is_leader = False
+        # Ids of the nodes holding a node lease as of the last tick; None before the first one
+        self.live_nodes: Optional[Set[str]] = None
+        # room id -> source of the cameras this node runs
+        self.cameras: Dict[str, str] = {}
+        self._leadership_listeners: List[Tuple[Callable[[], None], Callable[[], None]]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def on_leadership(self, elected: Callable[[], None], demoted: Callable[[], None]):
+        """Call ``elected()`` when this node becomes scheduler leader and ``demoted()`` when it stops."""
+        self._leadership_listeners.append((elected, demoted))
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="cluster-leases", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=5.0)
+        with self._lock:
+            for camera_id in list(self.cameras):
+                self._drop(camera_id)
+            self._set_leader(False)
+            if self.role == 'all':
+                self._release(self.LEADER)
+                self._release(f"node-{self.node_id}")
+
+    def owns_camera(self, camera_id: str) -> bool:
+        return camera_id in self.cameras
+
+    def _run(self):
+        # Opening cameras can take seconds, so even the first round runs here rather than in start()
+        self.tick()
+        while not self._stop.wait(self.ttl / 3):
+            self.tick()
+
+    def tick(self):
+        with self._lock:
+            try:
+                if self.role == 'all':
+                    self.store.acquire(f"node-{self.node_id}", self.node_id, self.ttl)
+                self.live_nodes = set(self.store.holders('node-').values())
+                if self.role != 'all':
+                    return
+                self._set_leader(self.store.acquire(self.LEADER, self.node_id, self.ttl))
+                self._reconcile()
+            except Exception as e:
+                # Without a working store we cannot prove we still hold anything
+                print(f"Cluster lease renewal failed: {e}")
+                self._set_leader(False)
+                for camera_id in list(self.cameras):
+                    self._drop(camera_id, release=False)
+
+    def _set_leader(self, leader: bool):
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        print(f"Cluster node {self.node_id} {'is now' if leader else 'is no longer'} the scheduler leader")
+        for elected, demoted in self._leadership_listeners:
+            try:
+                (elected if leader else demoted)()
+            except Exception as e:
+                print(f"Cluster leadership callback failed: {e}")
+
+    def _reconcile(self):
+        wanted = self.wanted_cameras()
+        for camera_id, source in list(self.cameras.items()):
+            # Camera removed or its source changed; a lost lease means another node may run it now
+            if wanted.get(camera_id) != source:
+                self._drop(camera_id)
+            elif not self.store.acquire(f"camera-{camera_id}", self.node_id, self.ttl):
+                self._drop(camera_id, release=False)
+
+        nodes = max(1, len(self.live_nodes))
+        share = math.ceil(len(wanted) / nodes)
+        if self.max_cameras:
+            share = min(share, self.max_cameras)
+        # Give back what exceeds our share after nodes joined, for them to pick up
+        for camera_id in sorted(self.cameras, reverse=True)[:max(0, len(self.cameras) - share)]:
+            self._drop(camera_id)
+        for camera_id, source in sorted(wanted.items()):
+            if len(self.cameras) >= share:
+                break
+            if camera_id in self.cameras or not self.store.acquire(f"camera-{camera_id}", self.node_id, self.ttl):
+                continue
+            if self.camera_service.add_camera(camera_id, source, consumer='cluster'):
+                self.cameras[camera_id] = source
+            else:
+                self._release(f"camera-{camera_id}")  # Let another node try
+
+    def _drop(self, camera_id: str, release: bool = True):
+        self.cameras.pop(camera_id, None)
+        self.camera_service.remove_camera(camera_id)
+        if release:
+            self._release(f"camera-{camera_id}")
+
+    def _release(self, name: str):
+        try:
+            self.store.release(name, self.node_id)
+        except Exception as e:
+            print(f"Cluster lease release failed for {name}: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            'node_id': self.node_id,
+            'role': self.role,
+            'leader': self.is_leader,
+            'cameras': sorted(self.cameras),
+        }
+
+
+class RemoteCamera(NamedTuple):
+    """Last state a camera's owner wrote to the database."""
+    owner: str
+    host: str
+    ring: Optional[str]
+    person_count: Optional[int]
+    last_update: Optional[float]
+    updated_at: float
+    state: Optional[str]
+
+
+class ClusterState:
+    """Counts and device changes shared between workers through the database.
+
+    Camera owners write each camera's person count and frame ring name to
+    the camera state table (on change, and every ``heartbeat`` seconds);
+    every worker reads the table back and serves it through the same
+    ``get_person_count`` / ``get_camera_state`` / count listener interface as
+    ``CameraService``, so the automation engine and summaries work unchanged.
+
+    Device events published in this worker are appended to the change log
+    and events from other workers are handed to ``on_remote_event``, all
+    every ``interval`` seconds from one sync thread. Viewers asking for a
+    camera (``request_camera``) mark it as demanded for ``demand_ttl``
+    seconds, so the cluster opens it even without automated devices.
+
+    A camera's row is deleted when its owner stops running it. Rows of an
+    owner that is no longer live (``live_nodes()``, the node leases; without
+    it, no row for ``3 * HEARTBEAT`` seconds) count as 0 people, so a dead
+    worker's last counts do not keep devices on.
+    """
+
+    HEARTBEAT = 5.0
+    # Seconds, on this worker's clock, a missing change id is waited for: concurrent writers
+    # can commit rows out of id order, and an id that never shows up was rolled back
+    LOG_LAG = 2.0
+    LOG_RETENTION = 300.0
+
+    def __init__(self, app, db, camera_state_model, change_model, demand_model, camera_service, node_id: str,
+                 interval: float = 0.25, on_remote_event: Optional[Callable[[dict], None]] = None,
+                 demand_ttl: float = 60.0, live_nodes: Optional[Callable[[], Optional[Set[str]]]] = None):
+        self.app = app
+        self.db = db
+        self.CameraState = camera_state_model
+        self.DeviceChange = change_model
+        self.CameraDemand = demand_model
+        self.camera_service = camera_service
+        self.node_id = node_id
+        self.host = socket.gethostname()
+        self.interval = interval
+        self.demand_ttl = demand_ttl
+        self.on_remote_event = on_remote_event
+        self.live_nodes = live_nodes
+        self.prune_log = False
+        self._lock = threading.Lock()
+        self._remote: Dict[str, RemoteCamera] = {}
+        # camera_id -> count last handed to listeners for cameras run by other workers
+        self._remote_counts: Dict[str, int] = {}
+        # camera_id -> (person_count, ring, state, written_at) last written for cameras we own
+        self._written: Dict[str, Tuple[Optional[int], Optional[str], Optional[str], float]] = {}
+        # camera_id -> last viewer request, and the demand expiry we last wrote for it
+        self._requested: Dict[str, float] = {}
+        self._demand_written: Dict[str, float] = {}
+        self._outbox: List[dict] = []
+        # Every change id up to the cursor has been handled; above it, those handled and those still missing
+        self._cursor = 0
+        self._delivered: Set[int] = set()
+        self._gaps: Dict[int, float] = {}
+        self._last_prune = 0.0
+        self._count_listeners: List[Callable[[str, int], None]] = []
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        table = self.DeviceChange.__table__
+        with self.app.app_context():
+            # Only changes made from now on are of interest
+            self._cursor = self.db.session.execute(select(table.c.id).order_by(table.c.id.desc()).limit(1)).scalar() or 0
+        self.camera_service.add_count_listener(self._on_local_count)
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="cluster-sync", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.camera_service.remove_count_listener(self._on_local_count)
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=5.0)
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Cluster sync failed: {e}")
+
+    # Count source interface, as on CameraService
+
+    def add_count_listener(self, listener: Callable[[str, int], None]):
+        self._count_listeners.append(listener)
+
+    def remove_count_listener(self, listener: Callable[[str, int], None]):
+        if listener in self._count_listeners:
+            self._count_listeners.remove(listener)
+
+    def get_person_count(self, camera_id: str) -> Optional[int]:
+        state = self.get_camera_state(camera_id)
+        return state[0] if state is not None else None
+
+    def get_camera_state(self, camera_id: str) -> Optional[Tuple[int, float]]:
+        """``(person_count, last_update)`` from the local camera, else from its owner's row."""
+        state = self.camera_service.get_camera_state(camera_id)
+        if state is not None:
+            return state
+        remote = self.remote_camera(camera_id)
+        if remote is None or remote.person_count is None:
+            return None
+        return remote.person_count, remote.last_update
+
+    def remote_camera(self, camera_id: str) -> Optional[RemoteCamera]:
+        """The owner's last row for a camera run by another worker, if the owner is alive."""
+        with self._lock:
+            remote = self._remote.get(camera_id)
+        if remote is None or remote.owner == self.node_id or not self._owner_alive(remote, self._live()):
+            return None
+        return remote
+
+    def _live(self) -> Optional[Set[str]]:
+        return self.live_nodes() if self.live_nodes is not None else None
+
+    def _owner_alive(self, remote: RemoteCamera, nodes: Optional[Set[str]]) -> bool:
+        if nodes is not None:
+            return remote.owner in nodes
+        # No lease view (yet): go by the owner's heartbeat
+        return time.time() - remote.updated_at <= 3 * self.HEARTBEAT
+
+    def request_camera(self, camera_id: str):
+        """A viewer wants ``camera_id``; cheap, the demand is written by the sync thread."""
+        with self._lock:
+            self._requested[camera_id] = time.time()
+
+    def demanded_cameras(self) -> List[str]:
+        """Cameras some worker's viewers asked for within ``demand_ttl``."""
+        table = self.CameraDemand.__table__
+        with self.app.app_context():
+            return list(self.db.session.execute(
+                select(table.c.camera_id).where(table.c.until > time.time())
+            ).scalars())
+
+    def _on_local_count(self, camera_id: str, person_count: int):
+        self._notify(camera_id, person_count)
+
+    def _notify(self, camera_id: str, person_count: int):
+        for listener in list(self._count_listeners):
+            try:
+                listener(camera_id, person_count)
+            except Exception as e:
+                print(f"Count listener failed for camera {camera_id}: {e}")
+
+    # Change log
+
+    def on_event(self, event: dict):
+        """``DeviceEventHub`` listener (local events only) queueing changes for other workers."""
+        with self._lock:
+            self._outbox.append(event)
+
+    # Sync thread
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Cluster sync failed: {e}")
+
+    def sync(self):
+        with self.app.app_context():
+            try:
+                self._write_cameras()
+                self._write_demand()
+                self._write_changes()
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                self._demand_written.clear()  # Not written after all
+                raise
+            self._read_cameras()
+            self._read_changes()
+            if self.prune_log and time.time() - self._last_prune > self.LOG_RETENTION / 10:
+                self._prune()
+
+    def _write_cameras(self):
+        table = self.CameraState.__table__
+        now = time.time()
+        camera_ids = self.camera_service.get_camera_ids()
+        # Zone counts (``<camera_id>:<zone>``) get rows of their own, without a ring
+        camera_ids += [key for camera_id in list(camera_ids) for key in self.camera_service.get_zone_counts(camera_id)]
+        for camera_id in camera_ids:
+            state = self.camera_service.get_camera_state(camera_id)
+            if state is None:
+                continue
+            person_count, last_update = state
+            ring = self.camera_service.get_frame_ring(camera_id)
+            health = self.camera_service.get_health(split_zone(camera_id)[0])
+            health_state = health.state if health is not None else None
+            written = self._written.get(camera_id)
+            if (written is not None and written[:3] == (person_count, ring, health_state)
+                    and now - written[3] < self.HEARTBEAT):
+                continue
+            values = dict(owner=self.node_id, host=self.host, ring=ring, person_count=person_count,
+                          last_update=last_update, updated_at=now, state=health_state)
+            result = self.db.session.execute(update(table).where(table.c.camera_id == camera_id).values(values))
+            if not result.rowcount:
+                self.db.session.execute(insert(table).values(dict(values, camera_id=camera_id)))
+            self._written[camera_id] = (person_count, ring, health_state, now)
+        for camera_id in list(self._written):
+            if camera_id not in camera_ids:
+                # Closed, dropped or moved: its last count must not outlive it
+                self.db.session.execute(
+                    delete(table).where(table.c.camera_id == camera_id, table.c.owner == self.node_id)
+                )
+                del self._written[camera_id]
+
+    def _write_demand(self):
+        table = self.CameraDemand.__table__
+        with self._lock:
+            requested = dict(self._requested)
+        for camera_id, requested_at in requested.items():
+            until = requested_at + self.demand_ttl
+            # Refreshing the row at most every half TTL keeps busy viewers from writing per request
+            if until - self._demand_written.get(camera_id, 0.0) < self.demand_ttl / 2:
+                continue
+            result = self.db.session.execute(update(table).where(table.c.camera_id == camera_id).values(until=until))
+            if not result.rowcount:
+                self.db.session.execute(insert(table).values(camera_id=camera_id, until=until))
+            self._demand_written[camera_id] = until
+        now = time.time()
+        with self._lock:
+            for camera_id, requested_at in list(self._requested.items()):
+                if requested_at + self.demand_ttl < now:
+                    del self._requested[camera_id]
+                    self._demand_written.pop(camera_id, None)
+
+    def _write_changes(self):
+        with self._lock:
+            outbox, self._outbox = self._outbox, []
+        if outbox:
+            now = time.time()
+            self.db.session.execute(insert(self.DeviceChange.__table__), [
+                {'origin': self.node_id, 'payload': json.dumps(event), 'created_at': now} for event in outbox
+            ])
+
+    def _read_cameras(self):
+        table = self.CameraState.__table__
+        rows = self.db.session.execute(select(
+            table.c.camera_id, table.c.owner, table.c.host, table.c.ring, table.c.person_count,
+            table.c.last_update, table.c.updated_at, table.c.state,
+        )).all()
+        remote = {camera_id: RemoteCamera(*fields) for camera_id, *fields in rows}
+        with self._lock:
+            self._remote = remote
+        nodes = self._live()
+        counts = {}
+        for camera_id, state in remote.items():
+            # Cameras running here report through the camera service, even while a dead owner's row remains
+            if (state.owner == self.node_id or state.person_count is None
+                    or self.camera_service.get_camera_state(camera_id) is not None):
+                continue
+            counts[camera_id] = state.person_count if self._owner_alive(state, nodes) else 0
+        previous, self._remote_counts = self._remote_counts, counts
+        for camera_id, person_count in previous.items():
+            # Row deleted by its owner, or the camera moved here
+            if camera_id not in counts and person_count and self.camera_service.get_camera_state(camera_id) is None:
+                self._notify(camera_id, 0)
+        for camera_id, person_count in counts.items():
+            if previous.get(camera_id) != person_count:
+                self._notify(camera_id, person_count)
+
+    def _read_changes(self):
+        """Deliver the changes of other workers not delivered yet, by id only; the writers' clocks don't matter."""
+        table = self.DeviceChange.__table__
+        rows = self.db.session.execute(
+            select(table.c.id, table.c.origin, table.c.payload).where(table.c.id > self._cursor).order_by(table.c.id)
+        ).all()
+        for change_id, origin, payload in rows:
+            if change_id in self._delivered:
+                continue
+            # Our own changes are read too, so they do not look like gaps
+            self._delivered.add(change_id)
+            self._gaps.pop(change_id, None)
+            if origin == self.node_id or self.on_remote_event is None:
+                continue
+            try:
+                self.on_remote_event(json.loads(payload))
+            except Exception as e:
+                print(f"Remote device change {change_id} failed: {e}")
+        now = time.monotonic()
+        if self._delivered:
+            for change_id in range(self._cursor + 1, max(self._delivered)):
+                if change_id not in self._delivered:
+                    self._gaps.setdefault(change_id, now)
+        # Move the cursor over what was delivered and over gaps that stayed empty for LOG_LAG
+        while True:
+            following = self._cursor + 1
+            if following in self._delivered:
+                self._delivered.discard(following)
+            elif following in self._gaps and now - self._gaps[following] > self.LOG_LAG:
+                del self._gaps[following]
+            else:
+                break
+            self._cursor = following
+
+    def _prune(self):
+        table = self.DeviceChange.__table__
+        self._last_prune = time.time()
+        try:
+            self.db.session.execute(delete(table).where(table.c.created_at < self._last_prune - self.LOG_RETENTION))
+            demand = self.CameraDemand.__table__
+            self.db.session.execute(delete(demand).where(demand.c.until < self._last_prune))
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            remote = sum(1 for state in self._remote.values() if state.owner != self.node_id)
+            outbox = len(self._outbox)
+        return {'remote_cameras': remote, 'pending_changes': outbox, 'log_cursor': self._cursor}
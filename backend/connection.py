@@ -0,0 +1,51 @@
+import os
+import random
+from typing import NamedTuple, Optional
+
+# Health of a camera's connection, as reported by ``CameraService.get_health``
+CONNECTING = 'connecting'  # Opening the source (first time or after a failure)
+LIVE = 'live'              # Frames are arriving
+STALLED = 'stalled'        # Connected, but no frame for ``stall_timeout`` seconds
+FAILED = 'failed'          # ``fail_after`` attempts in a row failed; still retrying at the backoff cap
+IDLE = 'idle'              # Not open in any worker: nothing uses it (see ``CameraService.add_camera``)
+
+
+class ConnectionPolicy(NamedTuple):
+    """How cameras are (re)connected and when idle ones are closed."""
+    backoff_initial: float = 0.5
+    backoff_max: float = 30.0
+    stall_timeout: float = 10.0
+    fail_after: int = 5
+    # Seconds a camera without consumers stays open, so a reloading viewer does not reconnect it
+    idle_grace: float = 60.0
+
+    @classmethod
+    def from_env(cls) -> 'ConnectionPolicy':
+        return cls(
+            backoff_initial=float(os.environ.get('CAMERA_BACKOFF_INITIAL', 0.5)),
+            backoff_max=float(os.environ.get('CAMERA_BACKOFF_MAX', 30)),
+            stall_timeout=float(os.environ.get('CAMERA_STALL_TIMEOUT', 10)),
+            fail_after=int(os.environ.get('CAMERA_FAIL_AFTER', 5)),
+            idle_grace=float(os.environ.get('CAMERA_IDLE_GRACE', 60)),
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before reconnect attempt ``attempt`` (1-based), with +-20% jitter.
+
+        The jitter keeps cameras that dropped together (e.g. a switch reboot)
+        from reconnecting in lockstep.
+        """
+        base = min(self.backoff_max, self.backoff_initial * 2 ** max(0, attempt - 1))
+        return base * random.uniform(0.8, 1.2)
+
+
+class CameraHealth(NamedTuple):
+    """Connection state of one camera."""
+    state: str
+    since: float                # When the camera entered ``state``
+    attempts: int               # Failed connects/reads since the last good frame
+    last_frame: Optional[float]
+    last_error: Optional[str]
+
+    def to_dict(self) -> dict:
+        return self._asdict()
@@ -0,0 +1,244 @@
+import os
+import shutil
+import subprocess
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from zones import CameraZones
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+class DecodeOptions(NamedTuple):
+    """How a camera's inference stream is decoded.
+
+    ``width``/``height`` downscale frames before they enter the pipeline (0
+    keeps the source size; with only one set the aspect ratio is kept).
+    ``max_fps`` drops frames above the rate with ``grab()`` alone, which
+    skips the colour conversion and copy of ``retrieve()``. The ``ffmpeg``
+    reader scales and drops frames inside FFmpeg and can decode key frames
+    only (``keyframes_only``), which skips decoding every other frame.
+    """
+    reader: str = 'opencv'
+    width: int = 0
+    height: int = 0
+    max_fps: float = 0.0
+    keyframes_only: bool = False
+    hwaccel: bool = False
+
+    @classmethod
+    def from_env(cls) -> 'DecodeOptions':
+        return cls().merged({
+            'reader': os.environ.get('CAMERA_READER', 'opencv'),
+            'width': os.environ.get('CAMERA_DECODE_WIDTH', 0),
+            'height': os.environ.get('CAMERA_DECODE_HEIGHT', 0),
+            'max_fps': os.environ.get('CAMERA_DECODE_FPS', 0),
+            'keyframes_only': os.environ.get('CAMERA_KEYFRAMES_ONLY', 'false'),
+            'hwaccel': os.environ.get('CAMERA_HWACCEL', 'false'),
+        })
+
+    def merged(self, overrides: Optional[dict]) -> 'DecodeOptions':
+        """These options with per-camera ``overrides``; raises ValueError for unknown or bad values."""
+        if not overrides:
+            return self
+        unknown = set(overrides) - set(self._fields)
+        if unknown:
+            raise ValueError(f"Unknown decode options: {', '.join(sorted(unknown))}")
+        values = self._asdict()
+        values.update(overrides)
+        reader = str(values['reader']).lower()
+        if reader not in ('opencv', 'ffmpeg'):
+            raise ValueError(f"Unknown camera reader: {reader}")
+        width, height, max_fps = int(values['width']), int(values['height']), float(values['max_fps'])
+        if width < 0 or height < 0 or max_fps < 0:
+            raise ValueError("Decode width, height and max_fps must not be negative")
+        return DecodeOptions(reader, width, height, max_fps, _flag(values['keyframes_only']), _flag(values['hwaccel']))
+
+    def size_for(self, width: int, height: int) -> Tuple[int, int]:
+        """Output size for a ``width`` x ``height`` source; never upscales, keeps sizes even."""
+        if not self.width and not self.height:
+            return width, height
+        scale = min(self.width / width if self.width else 1.0, self.height / height if self.height else 1.0, 1.0)
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+class CameraSource(NamedTuple):
+    """Where a camera's frames come from.
+
+    ``url`` is the main stream. With an ``inference_url`` (e.g. an RTSP
+    sub-stream) detection runs on that one and the main stream is only
+    decoded while someone watches the feed. With ``zones``, detection only
+    sees the part of the picture around them and people are counted per zone.
+    """
+    url: str
+    inference_url: Optional[str] = None
+    decode: Optional[DecodeOptions] = None
+    zones: Optional[CameraZones] = None
+
+    @property
+    def view_url(self) -> Optional[str]:
+        """The main stream if it is decoded separately for viewers, else None."""
+        return self.url if self.inference_url and self.inference_url != self.url else None
+
+
+def _capture_source(source: str):
+    try:
+        # Local camera index
+        return int(source)
+    except ValueError:
+        # If not an int, treat as URL/RTSP
+        return source
+
+
+class OpenCVCapture:
+    """``cv2.VideoCapture`` with optional hardware decode, frame dropping and downscaling."""
+
+    def __init__(self, source: str, options: DecodeOptions):
+        self.options = options
+        params = []
+        if options.hwaccel:
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        self.cap = cv2.VideoCapture(_capture_source(source), cv2.CAP_ANY, params)
+        if options.keyframes_only:
+            print(f"Key-frame-only decoding needs CAMERA_READER=ffmpeg; decoding every frame of {source}")
+        self.min_interval = 1.0 / options.max_fps if options.max_fps else 0.0
+        self.last_retrieved = 0.0
+        self.dropped = 0
+        # Decode buffer when frames are downscaled into the caller's buffer
+        self._scaled: Optional[np.ndarray] = None
+        self._native = not options.width and not options.height
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        while True:
+            if not self.cap.grab():
+                return False, None
+            now = time.monotonic()
+            if now - self.last_retrieved >= self.min_interval:
+                break
+            # Dropped without retrieve(): no colour conversion, no copy
+            self.dropped += 1
+        self.last_retrieved = now
+        if self._native:
+            return self.cap.retrieve(out)
+        ret, frame = self.cap.retrieve(self._scaled)
+        if not ret:
+            return False, None
+        self._scaled = frame
+        size = self.options.size_for(frame.shape[1], frame.shape[0])
+        if size == (frame.shape[1], frame.shape[0]):
+            # Source already small enough: decode straight into the caller's buffer from now on
+            self._native = True
+            return True, frame.copy()
+        if out is not None and out.shape[:2] == (size[1], size[0]):
+            return True, cv2.resize(frame, size, dst=out, interpolation=cv2.INTER_AREA)
+        return True, cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def release(self):
+        self.cap.release()
+
+
+class FFmpegCapture:
+    """Raw BGR frames piped from an ``ffmpeg`` process.
+
+    Scaling, frame rate limiting and key-frame-only decoding
+    (``-skip_frame nokey``) all happen inside FFmpeg, before frames are
+    converted to BGR, which is where most decode CPU goes. Needs the
+    ``ffmpeg`` and ``ffprobe`` binaries on the PATH.
+    """
+
+    PROBE_TIMEOUT = 15.0
+
+    def __init__(self, source: str, options: DecodeOptions):
+        self.source = source
+        self.options = options
+        self.proc: Optional[subprocess.Popen] = None
+        self.shape: Optional[Tuple[int, int, int]] = None
+        if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+            print(f"CAMERA_READER=ffmpeg needs ffmpeg and ffprobe on the PATH; cannot open {source}")
+            return
+        size = self._probe()
+        if size is None:
+            return
+        width, height = options.size_for(*size)
+        self.shape = (height, width, 3)
+        self.proc = subprocess.Popen(self._command(width, height), stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, bufsize=0)
+
+    def _input_args(self):
+        args = []
+        if self.source.startswith('rtsp://'):
+            args += ['-rtsp_transport', 'tcp']
+        if self.options.hwaccel:
+            args += ['-hwaccel', 'auto']
+        if self.options.keyframes_only:
+            args += ['-skip_frame', 'nokey']
+        return args
+
+    def _probe(self) -> Optional[Tuple[int, int]]:
+        command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height',
+                   '-of', 'csv=p=0', *(['-rtsp_transport', 'tcp'] if self.source.startswith('rtsp://') else []),
+                   self.source]
+        try:
+            output = subprocess.run(command, capture_output=True, text=True, timeout=self.PROBE_TIMEOUT).stdout
+            width, height = (int(value) for value in output.strip().splitlines()[0].split(',')[:2])
+        except (subprocess.SubprocessError, ValueError, IndexError):
+            return None
+        return width, height
+
+    def _command(self, width: int, height: int):
+        filters = [f'scale={width}:{height}']
+        output = []
+        if self.options.keyframes_only:
+            # Key frames arrive every GOP (typically 0.5-2 s); pass them through without filling in
+            output = ['-vsync', 'passthrough']
+        elif self.options.max_fps:
+            filters.append(f'fps={self.options.max_fps:g}')
+        return ['ffmpeg', '-nostdin', '-loglevel', 'error', *self._input_args(), '-i', self.source,
+                '-an', '-vf', ','.join(filters), *output, '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+
+    def isOpened(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def read(self, out: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if self.proc is None:
+            return False, None
+        if out is None or out.shape != self.shape:
+            out = np.empty(self.shape, np.uint8)
+        view = memoryview(out).cast('B')
+        filled = 0
+        while filled < len(view):
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+        return True, out
+
+    def release(self):
+        if self.proc is None:
+            return
+        self.proc.kill()
+        self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+
+def open_capture(source: str, options: Optional[DecodeOptions] = None):
+    """Open a capture for an RTSP/URL source or a local camera index.
+
+    The result has the ``isOpened`` / ``read(out)`` / ``release`` subset of
+    the ``cv2.VideoCapture`` interface.
+    """
+    options = options or DecodeOptions()
+    if options.reader == 'ffmpeg':
+        return FFmpegCapture(source, options)
+    return OpenCVCapture(source, options)
@@ -0,0 +1,234 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, insert, select, update
+
+from zones import CameraZones, resolve_zone, split_zone
+
+INT_FIELDS = ('persons_before_enabled', 'delay_before_enabled', 'persons_before_disabled', 'delay_before_disabled')
+BOOL_FIELDS = ('is_enabled', 'is_manual')
+# Columns an upsert may change, compared against the stored row to report 'unchanged'
+UPSERT_FIELDS = ('name', 'room_id', 'zone') + INT_FIELDS + BOOL_FIELDS
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+CHUNK = 500
+
+
+class BulkResult(NamedTuple):
+    """Outcome of a bulk write: one report entry per item plus what the caller must propagate."""
+    report: List[dict]
+    created_ids: List[int]
+    updated_ids: List[int]
+    # Rooms whose device list or devices changed, including rooms devices were moved out of
+    room_ids: Set[int]
+
+
+def _chunks(values: Sequence, size: int = CHUNK) -> Iterable[Sequence]:
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def parse_settings(data: dict) -> dict:
+    """Typed copy of the automation/state fields present in ``data``; raises ValueError."""
+    values = {}
+    for field in INT_FIELDS:
+        if field in data:
+            values[field] = int(data[field]) if data[field] is not None else None
+    for field in BOOL_FIELDS:
+        if field in data:
+            values[field] = bool(data[field])
+    return values
+
+
+def _existing_ids(db, column, keys: List) -> Dict:
+    """Map each key found in ``column`` to its row id, one query per chunk."""
+    table = column.table
+    found = {}
+    for chunk in _chunks(keys):
+        for row_id, key in db.session.execute(select(table.c.id, column).where(column.in_(chunk))):
+            found[key] = row_id
+    return found
+
+
+def _room_zones(db, room_model, room_ids: List[int]) -> Dict[int, Optional[CameraZones]]:
+    """Zones of each of ``room_ids`` that exists (None for a room without zones), one query per chunk."""
+    rooms = room_model.__table__
+    found = {}
+    for chunk in _chunks(room_ids):
+        for room_id, camera_zones in db.session.execute(
+                select(rooms.c.id, rooms.c.camera_zones).where(rooms.c.id.in_(chunk))):
+            found[room_id] = CameraZones.parse(camera_zones)
+    return found
+
+
+def upsert_devices(db, device_model, room_model, items: List[dict],
+                   default_room_id: Optional[int] = None) -> BulkResult:
+    """Create or update many devices keyed by ``hardware_id`` without committing.
+
+    New devices go to their item's ``room_id``, or else ``default_room_id``;
+    existing devices only move when their item names a room. ``zone`` binds a
+    device to a camera zone as on the single-device endpoints: ``"desk"`` of
+    the device's room, or ``"12:desk"`` of room 12.
+
+    Items that fail validation are reported and skipped; the rest are written
+    with one executemany INSERT and one executemany UPDATE per distinct set
+    of changed fields. The report has one entry per input item, in order;
+    existing devices the item does not change are reported ``unchanged``.
+    Raises ValueError for an invalid ``default_room_id``.
+    """
+    table = device_model.__table__
+    default_room_id = int(default_room_id) if default_room_id is not None else None
+    report: List[dict] = [None] * len(items)
+    parsed: List[Tuple[int, str, Optional[int], dict]] = []
+    seen = set()
+
+    for index, item in enumerate(items):
+        hardware_id = str(item.get('hardware_id') or '').strip() if isinstance(item, dict) else ''
+        entry = {'index': index, 'hardware_id': hardware_id or None}
+        report[index] = entry
+        if not hardware_id:
+            entry.update(status='error', message='Missing or empty required field: hardware_id')
+            continue
+        if hardware_id in seen:
+            entry.update(status='error', message='Duplicate hardware_id in request')
+            continue
+        seen.add(hardware_id)
+        try:
+            values = parse_settings(item)
+            room_id = item.get('room_id')
+            room_id = int(room_id) if room_id is not None else None
+        except (TypeError, ValueError) as e:
+            entry.update(status='error', message=f'Invalid data format: {e}')
+            continue
+        if item.get('name'):
+            values['name'] = str(item['name'])
+        if 'zone' in item:
+            values['zone'] = item['zone']  # Resolved to a zone key once the rooms are loaded
+        parsed.append((index, hardware_id, room_id, values))
+
+    existing: Dict[str, dict] = {}
+    columns = [table.c.id, table.c.hardware_id] + [table.c[field] for field in UPSERT_FIELDS]
+    for chunk in _chunks([hardware_id for _, hardware_id, _, _ in parsed]):
+        for row in db.session.execute(select(*columns).where(table.c.hardware_id.in_(chunk))).mappings():
+            existing[row['hardware_id']] = dict(row)
+
+    # Each item's room: the one it names, else the device's current one, else (new devices) the default
+    resolved = []
+    for index, hardware_id, room_id, values in parsed:
+        current = existing.get(hardware_id)
+        if room_id is None:
+            room_id = current['room_id'] if current is not None else default_room_id
+        resolved.append((index, hardware_id, room_id, values, current))
+    room_ids = {room_id for _, _, room_id, _, _ in resolved if room_id is not None}
+    # Rooms whose zones other rooms' devices are bound to ("12:desk")
+    for _, _, _, values, _ in resolved:
+        owner, zone = split_zone(str(values.get('zone') or ''))
+        if zone is not None and owner.isdigit():
+            room_ids.add(int(owner))
+    rooms = _room_zones(db, room_model, sorted(room_ids))
+
+    now = datetime.utcnow()
+    inserts: List[dict] = []
+    inserted_items: List[Tuple[int, str]] = []
+    # Sorted field names -> parameter rows, so each group is one executemany
+    updates: Dict[Tuple[str, ...], List[dict]] = defaultdict(list)
+    updated_ids: List[int] = []
+    touched_rooms: Set[int] = set()
+
+    def zones_of(owner: str) -> Optional[CameraZones]:
+        return rooms.get(int(owner))
+
+    for index, hardware_id, room_id, values, current in resolved:
+        entry = report[index]
+        if room_id is not None and room_id not in rooms:
+            entry.update(status='error', message='Room not found')
+            continue
+        if 'zone' in values:
+            try:
+                values['zone'] = resolve_zone(values['zone'], room_id, zones_of)
+            except ValueError as e:
+                entry.update(status='error', message=str(e))
+                continue
+        if current is None:
+            if room_id is None:
+                entry.update(status='error', message='Missing required field: room_id')
+                continue
+            if 'name' not in values:
+                entry.update(status='error', message='Missing or empty required field: name')
+                continue
+            row = {field: None for field in INT_FIELDS}
+            row.update(is_enabled=False, is_manual=False, zone=None, last_seen=now)
+            row.update(values, hardware_id=hardware_id, room_id=room_id)
+            inserts.append(row)
+            inserted_items.append((index, hardware_id))
+            touched_rooms.add(room_id)
+            continue
+        values['room_id'] = room_id
+        changed = {field: value for field, value in values.items() if current[field] != value}
+        device_id = current['id']
+        entry.update(status='updated' if changed else 'unchanged', id=device_id)
+        if not changed:
+            continue
+        updates[tuple(sorted(changed))].append(dict({f'b_{k}': v for k, v in changed.items()}, b_id=device_id))
+        updated_ids.append(device_id)
+        touched_rooms.update(r for r in (current['room_id'], room_id) if r is not None)
+
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    for fields, rows in updates.items():
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values({field: bindparam(f'b_{field}') for field in fields})
+        )
+        db.session.execute(stmt, rows)
+
+    created_ids: List[int] = []
+    if inserted_items:
+        new_ids = _existing_ids(db, table.c.hardware_id, [hardware_id for _, hardware_id in inserted_items])
+        for index, hardware_id in inserted_items:
+            report[index].update(status='created', id=new_ids.get(hardware_id))
+            created_ids.append(new_ids.get(hardware_id))
+    return BulkResult(report, created_ids, updated_ids, touched_rooms)
+
+
+def update_matching(db, device_model, room_model, selector: dict, values: dict) -> BulkResult:
+    """Apply ``values`` to every device matched by ``selector`` with one UPDATE, without committing.
+
+    ``selector`` holds one of ``device_ids``, ``room_id`` or ``building_id``.
+    Requested ids that do not exist are reported as ``not_found``.
+    """
+    if not values:
+        raise ValueError('Nothing to update')
+    table = device_model.__table__
+    rooms = room_model.__table__
+    requested: Optional[List[int]] = None
+    if 'device_ids' in selector:
+        requested = [int(i) for i in selector['device_ids']]
+        condition = table.c.id.in_
+    elif 'room_id' in selector:
+        condition = table.c.room_id == int(selector['room_id'])
+    elif 'building_id' in selector:
+        condition = table.c.room_id.in_(
+            select(rooms.c.id).where(rooms.c.building_id == int(selector['building_id'])).scalar_subquery()
+        )
+    else:
+        raise ValueError('Filter must contain device_ids, room_id or building_id')
+
+    columns = (table.c.id, table.c.hardware_id, table.c.room_id)
+    matched: List[Tuple[int, str, int]] = []
+    if requested is not None:
+        for chunk in _chunks(list(dict.fromkeys(requested))):
+            matched.extend(db.session.execute(select(*columns).where(condition(chunk))).all())
+            db.session.execute(update(table).where(condition(chunk)).values(values))
+    else:
+        matched = db.session.execute(select(*columns).where(condition)).all()
+        if matched:
+            db.session.execute(update(table).where(condition).values(values))
+
+    report = [{'id': device_id, 'hardware_id': hardware_id, 'status': 'updated'}
+              for device_id, hardware_id, _ in matched]
+    if requested is not None:
+        found = {device_id for device_id, _, _ in matched}
+        report.extend({'id': i, 'status': 'not_found'} for i in dict.fromkeys(requested) if i not in found)
+    return BulkResult(report, [], [device_id for device_id, _, _ in matched], {room_id for _, _, room_id in matched})
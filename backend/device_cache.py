@@ -0,0 +1,194 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, update
+
+
+def device_status_payload(device) -> dict:
+    """The ``/api/device/status`` body for one device, as the ESP32 firmware expects it."""
+    return {
+        'id': device.id,
+        'hardware_id': device.hardware_id,
+        'name': device.name,
+        'is_enabled': device.is_enabled,
+        'persons_before_enabled': device.persons_before_enabled or 0,
+        'delay_before_enabled': device.delay_before_enabled or 0,
+        'persons_before_disabled': device.persons_before_disabled or 0,
+        'delay_before_disabled': device.delay_before_disabled or 0,
+        'room_id': device.room_id,
+        'is_manual': device.is_manual
+    }
+
+
+class DeviceStatusCache:
+    """Read-through cache of device status keyed by ``hardware_id``.
+
+    Outlets poll every few seconds, so the common case is served from memory.
+    Unknown hardware ids are remembered for ``miss_ttl`` seconds so a
+    misconfigured outlet cannot hammer the database either. Heartbeats
+    (``last_seen``/``ip_address``) are collected in memory and written with
+    one bulk UPDATE every ``flush_interval`` seconds.
+
+    Entries are dropped by ``invalidate`` after CRUD writes and patched in
+    place by ``apply_states`` when the automation engine flips devices.
+    """
+
+    MAX_MISSES = 10000
+
+    def __init__(self, app, db, device_model, flush_interval: float = 10.0, miss_ttl: float = 30.0):
+        self.app = app
+        self.db = db
+        self.Device = device_model
+        self.flush_interval = flush_interval
+        self.miss_ttl = miss_ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._by_id: Dict[int, str] = {}
+        self._misses: Dict[str, float] = {}
+        # device_id -> (last_seen, ip_address) not yet written to the database
+        self._heartbeats: Dict[int, Tuple[datetime, Optional[str]]] = {}
+        # Bumped by every invalidation so a load racing with a write is not cached
+        self._generation = 0
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._flush_loop, name="heartbeat-flush", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=5.0)
+        self.flush()
+
+    def peek(self, hardware_id: str) -> Tuple[bool, Optional[dict]]:
+        """``(known, entry)`` from memory only; ``known`` is False when only the database can tell."""
+        with self._lock:
+            entry = self._entries.get(hardware_id)
+            if entry is not None:
+                self.hits += 1
+                return True, entry
+            missed_at = self._misses.get(hardware_id)
+            if missed_at is not None and time.monotonic() - missed_at < self.miss_ttl:
+                self.hits += 1
+                return True, None
+            return False, None
+
+    def get(self, hardware_id: str) -> Optional[dict]:
+        """Return the cached status payload, loading it from the database on a miss."""
+        with self._lock:
+            entry = self._entries.get(hardware_id)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            missed_at = self._misses.get(hardware_id)
+            if missed_at is not None and time.monotonic() - missed_at < self.miss_ttl:
+                self.hits += 1
+                return None
+            self.misses += 1
+            generation = self._generation
+
+        device = self.db.session.execute(
+            self.db.select(self.Device).filter_by(hardware_id=hardware_id)
+        ).scalar_one_or_none()
+
+        with self._lock:
+            if device is None:
+                if generation == self._generation:
+                    if len(self._misses) >= self.MAX_MISSES:
+                        self._misses.clear()
+                    self._misses[hardware_id] = time.monotonic()
+                return None
+            entry = device_status_payload(device)
+            if generation != self._generation:
+                return entry
+            self._entries[hardware_id] = entry
+            self._by_id[device.id] = hardware_id
+            self._misses.pop(hardware_id, None)
+            return entry
+
+    def heartbeat(self, device_id: int, ip_address: Optional[str]):
+        """Record that a device checked in; written to the database on the next flush."""
+        with self._lock:
+            self._heartbeats[device_id] = (datetime.utcnow(), ip_address)
+
+    def invalidate(self, device_id: Optional[int] = None, hardware_id: Optional[str] = None):
+        """Drop the entries for a device id and/or hardware id; with no arguments, drop everything."""
+        with self._lock:
+            self._generation += 1
+            if device_id is None and hardware_id is None:
+                self._entries.clear()
+                self._by_id.clear()
+                self._misses.clear()
+                return
+            if device_id is not None:
+                old = self._by_id.pop(device_id, None)
+                if old is not None:
+                    self._entries.pop(old, None)
+            if hardware_id is not None:
+                entry = self._entries.pop(hardware_id, None)
+                if entry is not None:
+                    self._by_id.pop(entry['id'], None)
+                self._misses.pop(hardware_id, None)
+
+    def apply_states(self, changes: List[Tuple[int, bool, int]]):
+        """Patch ``is_enabled`` of cached entries after the automation engine committed changes."""
+        with self._lock:
+            self._generation += 1
+            for device_id, is_enabled, _ in changes:
+                hardware_id = self._by_id.get(device_id)
+                if hardware_id is not None:
+                    # Replace rather than mutate: readers may be serialising the old dict
+                    self._entries[hardware_id] = dict(self._entries[hardware_id], is_enabled=is_enabled)
+
+    def flush(self) -> int:
+        """Write pending heartbeats with one executemany UPDATE; returns the number of rows."""
+        with self._lock:
+            pending, self._heartbeats = self._heartbeats, {}
+        if not pending:
+            return 0
+        table = self.Device.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values(
+                last_seen=bindparam('b_last_seen'),
+                ip_address=func.coalesce(bindparam('b_ip'), table.c.ip_address),
+            )
+        )
+        rows = [
+            {'b_id': device_id, 'b_last_seen': last_seen, 'b_ip': ip_address}
+            for device_id, (last_seen, ip_address) in pending.items()
+        ]
+        with self.app.app_context():
+            try:
+                self.db.session.execute(stmt, rows)
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                self.app.logger.error(f"Heartbeat flush failed: {e}")
+                # Keep them for the next attempt unless a newer heartbeat arrived meanwhile
+                with self._lock:
+                    for device_id, beat in pending.items():
+                        self._heartbeats.setdefault(device_id, beat)
+                return 0
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'negative_entries': len(self._misses),
+                'pending_heartbeats': len(self._heartbeats),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+import zlib
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aio import LoopSignal, loop_signal
+
+
+def status_version(payload: dict) -> int:
+    """Version of a device status payload, derived from its content.
+
+    Every worker (and every restart) computes the same version for the same
+    state, so an outlet can long-poll whichever worker it reaches. Kept
+    below 2**31 so it fits the firmware's ``long``.
+    """
+    return zlib.crc32(json.dumps(payload, sort_keys=True, default=str).encode()) & 0x7fffffff
+
+
+class _Subscriber:
+    __slots__ = ('room_id', 'queue', 'event', 'dropped', 'signal')
+
+    def __init__(self, room_id: Optional[int], max_queue: int, signal: Optional[LoopSignal] = None):
+        self.room_id = room_id
+        self.queue: Deque[dict] = deque(maxlen=max_queue)
+        self.event = threading.Event()
+        self.dropped = False
+        # Set for coroutine subscribers: wakes them on their event loop
+        self.signal = signal
+
+    def wake(self):
+        self.event.set()
+        if self.signal is not None:
+            self.signal.notify(self)
+
+
+class DeviceEventHub:
+    """Device change notifications for long-polling outlets and SSE clients.
+
+    Every change to a device bumps a per-device tick. Outlets hold a status
+    request open with ``wait_for_change`` until the device is touched, so a
+    state flip reaches them immediately instead of on the next 5-second
+    poll. Dashboards subscribe to a server-sent event stream, optionally
+    filtered by room. Both have a coroutine flavour (``wait_for_change_async``,
+    ``subscribe_async``) for the ASGI server, where a waiting client holds
+    no thread.
+
+    Listeners see every event; ``local_only`` listeners (e.g. the cluster
+    change log) only see events published in this process, not those
+    handed over from other workers through ``deliver``.
+    """
+
+    KEEPALIVE = 15.0
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._ticks: Dict[int, int] = {}
+        # One condition per device with a waiting outlet, so a change wakes only its own poller
+        self._waiters: Dict[int, threading.Condition] = {}
+        self._waiting: Dict[int, int] = {}
+        self._subscribers: List[_Subscriber] = []
+        self._listeners: List[Tuple[Callable[[dict], None], bool]] = []
+        # One per event loop with async waiters
+        self._signals: Dict[asyncio.AbstractEventLoop, LoopSignal] = {}
+        self.closed = False
+
+    def add_listener(self, listener: Callable[[dict], None], local_only: bool = False):
+        """Call ``listener(event)`` for every event (only this process's events if ``local_only``)."""
+        self._listeners.append((listener, local_only))
+
+    def remove_listener(self, listener: Callable[[dict], None]):
+        self._listeners = [entry for entry in self._listeners if entry[0] is not listener]
+
+    def tick(self, device_id: int) -> int:
+        """Change counter of a device, to pass to ``wait_for_change``."""
+        with self._lock:
+            return self._ticks.get(device_id, 0)
+
+    def publish(self, device_id: int, room_id: Optional[int], **fields):
+        """Record a change of one device and wake its long-poller and matching subscribers."""
+        self._dispatch(dict(fields, type='device', id=device_id, room_id=room_id), local=True)
+
+    def publish_states(self, changes):
+        """Automation engine listener: ``[(device_id, is_enabled, room_id), ...]``."""
+        for device_id, is_enabled, room_id in changes:
+            self.publish(device_id, room_id, is_enabled=is_enabled)
+
+    def publish_room(self, room_id: int, device_ids: List[int]):
+        """A room's device list changed (devices added, removed or the room deleted)."""
+        self._dispatch({'type': 'room', 'room_id': room_id, 'device_ids': list(device_ids)}, local=True)
+
+    def deliver(self, event: dict):
+        """Hand over an event published by another worker."""
+        self._dispatch(event, local=False)
+
+    def _dispatch(self, event: dict, local: bool):
+        device_ids = event['device_ids'] if event['type'] == 'room' else [event['id']]
+        with self._lock:
+            for device_id in device_ids:
+                self._ticks[device_id] = self._ticks.get(device_id, 0) + 1
+                cond = self._waiters.get(device_id)
+                if cond is not None:
+                    cond.notify_all()
+                for signal in self._signals.values():
+                    signal.notify(device_id)
+        self._broadcast(event)
+        for listener, local_only in list(self._listeners):
+            if local_only and not local:
+                continue
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Device event listener failed: {e}")
+
+    def wait_for_change(self, device_id: int, tick: int, timeout: float) -> int:
+        """Block until the device's tick differs from ``tick`` or ``timeout`` passes."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            cond = self._waiters.get(device_id)
+            if cond is None:
+                cond = self._waiters[device_id] = threading.Condition(self._lock)
+            self._waiting[device_id] = self._waiting.get(device_id, 0) + 1
+            try:
+                while not self.closed:
+                    current = self._ticks.get(device_id, 0)
+                    remaining = deadline - time.monotonic()
+                    if current != tick or remaining <= 0:
+                        return current
+                    cond.wait(remaining)
+                return self._ticks.get(device_id, 0)
+            finally:
+                self._release(device_id)
+
+    async def wait_for_change_async(self, device_id: int, tick: int, timeout: float) -> int:
+        """``wait_for_change`` for coroutines."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._waiting[device_id] = self._waiting.get(device_id, 0) + 1
+        try:
+            while True:
+                with self._lock:
+                    current = self._ticks.get(device_id, 0)
+                    remaining = deadline - time.monotonic()
+                    if self.closed or current != tick or remaining <= 0:
+                        return current
+                    signal = loop_signal(self._signals)
+                    future = signal.waiter(device_id)
+                await signal.wait(future, remaining, device_id)
+        finally:
+            with self._lock:
+                self._release(device_id)
+
+    def _release(self, device_id: int):
+        """One long poll of the device ended; must be called with ``_lock`` held."""
+        self._waiting[device_id] -= 1
+        if not self._waiting[device_id]:
+            del self._waiting[device_id]
+            self._waiters.pop(device_id, None)
+
+    def subscribe(self, room_id: Optional[int] = None) -> Iterator[str]:
+        """Yield server-sent event chunks for device changes (of one room, if given)."""
+        subscriber = _Subscriber(room_id, self.max_queue)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        try:
+            yield 'retry: 3000\n\n'
+            while not self.closed:
+                if not subscriber.event.wait(self.KEEPALIVE):
+                    yield ': keepalive\n\n'
+                    continue
+                yield from self._drain(subscriber)
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+
+    async def subscribe_async(self, room_id: Optional[int] = None) -> AsyncIterator[str]:
+        """``subscribe`` for coroutines."""
+        with self._lock:
+            subscriber = _Subscriber(room_id, self.max_queue, loop_signal(self._signals))
+            self._subscribers.append(subscriber)
+        signal = subscriber.signal
+        try:
+            yield 'retry: 3000\n\n'
+            while not self.closed:
+                with self._lock:
+                    pending = subscriber.event.is_set()
+                    if not pending:
+                        future = signal.waiter(subscriber)
+                if not pending and not await signal.wait(future, self.KEEPALIVE, subscriber):
+                    yield ': keepalive\n\n'
+                    continue
+                for chunk in self._drain(subscriber):
+                    yield chunk
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+
+    def _drain(self, subscriber: _Subscriber) -> List[str]:
+        """Take the events queued for a subscriber, as server-sent event chunks."""
+        with self._lock:
+            subscriber.event.clear()
+            events = list(subscriber.queue)
+            subscriber.queue.clear()
+            dropped, subscriber.dropped = subscriber.dropped, False
+        if dropped:
+            # The client fell behind; tell it to refetch instead of replaying a partial history
+            events = [{'type': 'resync', 'room_id': subscriber.room_id}]
+        return [f"data: {json.dumps(event)}\n\n" for event in events]
+
+    def _broadcast(self, event: dict):
+        room_id = event.get('room_id')
+        with self._lock:
+            for subscriber in self._subscribers:
+                if subscriber.room_id is not None and subscriber.room_id != room_id:
+                    continue
+                if len(subscriber.queue) == subscriber.queue.maxlen:
+                    subscriber.dropped = True
+                subscriber.queue.append(event)
+                subscriber.wake()
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            for cond in self._waiters.values():
+                cond.notify_all()
+            for signal in self._signals.values():
+                signal.notify_all()
+            for subscriber in self._subscribers:
+                subscriber.wake()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'long_polls': sum(self._waiting.values()),
+                'subscribers': len(self._subscribers),
+                'tracked_devices': len(self._ticks),
+            }
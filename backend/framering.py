@@ -0,0 +1,266 @@
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_HEADER_FIELDS = 8  # capacity, ndim, dim0, dim1, dim2, head seq, max boxes, reserved
+_ALIGN = 64
+# Detections kept per slot (x1, y1, x2, y2, conf, cls), so other processes can draw overlays
+MAX_BOXES = 64
+_BOX_FIELDS = 6
+
+# Rings created by this process, so backends can turn a frame view back into (shm name, offset)
+_registry: Dict[str, 'FrameRing'] = {}
+_registry_lock = threading.Lock()
+_release_listeners: List[Callable[[str], None]] = []
+# Closed blocks whose memory a reader still had a view into; retried on the next ring operation
+_orphans: List[SharedMemory] = []
+
+
+def attach_shm(name: str) -> SharedMemory:
+    """Attach to another process's block without letting this process's resource tracker own it."""
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = SharedMemory(name=name)
+        # Older Pythons would otherwise unlink the creator's block when this process exits
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _close_shm(shm: SharedMemory):
+    try:
+        shm.close()
+    except BufferError:
+        _orphans.append(shm)
+
+
+def _reap_orphans():
+    for shm in list(_orphans):
+        try:
+            shm.close()
+            _orphans.remove(shm)
+        except BufferError:
+            pass
+
+
+def _align(value: int) -> int:
+    return (value + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing:
+    """Fixed-size ring of the last K raw frames of one camera in shared memory.
+
+    Layout: an int64 header (capacity, shape, newest seq), per-slot seq,
+    timestamp, person count and detection arrays, then K contiguous frame slots. The
+    owning process decodes straight into a slot and readers get numpy views,
+    so steady state allocates nothing and memory is ``K * frame_bytes``.
+
+    A slot's seq is zeroed while it is being rewritten; readers in other
+    processes should re-check ``seq_at(index)`` after using a view. In the
+    owning process, slots handed to inference or published to viewers are
+    pinned and the writer skips them.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], capacity: int = 6, name: Optional[str] = None):
+        _reap_orphans()
+        create = name is None
+        if create:
+            shape = tuple(int(d) for d in shape)
+            self.capacity = max(3, capacity)
+            size = self._layout(self.capacity, shape)
+            self.shm = SharedMemory(create=True, size=size)
+        else:
+            self.shm = attach_shm(name)
+            header = np.ndarray((_HEADER_FIELDS,), np.int64, self.shm.buf, 0)
+            self.capacity = int(header[0])
+            shape = tuple(int(d) for d in header[2:2 + int(header[1])])
+            self._layout(self.capacity, shape)
+            del header
+        self.owner = create
+        self.closed = False
+        self.name = self.shm.name
+        self.shape = shape
+        buf = self.shm.buf
+        self.header = np.ndarray((_HEADER_FIELDS,), np.int64, buf, 0)
+        self.seqs = np.ndarray((self.capacity,), np.int64, buf, self._seqs_offset)
+        self.times = np.ndarray((self.capacity,), np.float64, buf, self._times_offset)
+        self.counts = np.ndarray((self.capacity,), np.int64, buf, self._counts_offset)
+        self.box_counts = np.ndarray((self.capacity,), np.int64, buf, self._box_counts_offset)
+        self.boxes = np.ndarray((self.capacity, MAX_BOXES, _BOX_FIELDS), np.float32, buf, self._boxes_offset)
+        self.frames = np.ndarray((self.capacity,) + shape, np.uint8, buf, self._frames_offset)
+        self._base = self.frames.__array_interface__['data'][0]
+        self._pins = [0] * self.capacity
+        self._cursor = -1
+        self._latest = -1
+        if create:
+            self.header[:] = 0
+            self.header[0] = self.capacity
+            self.header[1] = len(shape)
+            self.header[2:2 + len(shape)] = shape
+            self.header[6] = MAX_BOXES
+            self.seqs[:] = 0
+            self.counts[:] = -1
+            self.box_counts[:] = 0
+            with _registry_lock:
+                _registry[self.name] = self
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        """Open a ring created by another process (read-only use)."""
+        return cls((), name=name)
+
+    def _layout(self, capacity: int, shape: Tuple[int, ...]) -> int:
+        self.frame_bytes = int(np.prod(shape))
+        self._seqs_offset = _HEADER_FIELDS * 8
+        self._times_offset = self._seqs_offset + capacity * 8
+        self._counts_offset = self._times_offset + capacity * 8
+        self._box_counts_offset = self._counts_offset + capacity * 8
+        self._boxes_offset = self._box_counts_offset + capacity * 8
+        self._frames_offset = _align(self._boxes_offset + capacity * MAX_BOXES * _BOX_FIELDS * 4)
+        return self._frames_offset + capacity * self.frame_bytes
+
+    @property
+    def head(self) -> int:
+        """Seq of the newest committed frame (0 before the first one)."""
+        return int(self.header[5])
+
+    def acquire(self) -> int:
+        """Pick the next unpinned slot for the writer and invalidate it."""
+        for step in range(1, self.capacity + 1):
+            index = (self._cursor + step) % self.capacity
+            if index != self._latest and not self._pins[index]:
+                self._cursor = index
+                self.seqs[index] = 0
+                return index
+        raise RuntimeError("All frame ring slots are pinned")
+
+    def commit(self, index: int, timestamp: float) -> int:
+        """Publish a freshly written slot as the newest frame and return its seq."""
+        seq = self.head + 1
+        self.times[index] = timestamp
+        self.counts[index] = -1
+        self.box_counts[index] = 0
+        self.seqs[index] = seq
+        self.header[5] = seq
+        self._latest = index
+        return seq
+
+    def view(self, index: int) -> np.ndarray:
+        return self.frames[index]
+
+    def seq_at(self, index: int) -> int:
+        return int(self.seqs[index])
+
+    def pin(self, index: int):
+        self._pins[index] += 1
+
+    def unpin(self, index: int):
+        if self._pins[index] > 0:
+            self._pins[index] -= 1
+
+    def set_count(self, index: int, seq: int, count: int, detections=None):
+        """Record the person count (and boxes) for a slot if it still holds frame ``seq``."""
+        if self.closed or self.seqs[index] != seq:
+            return
+        if detections is not None:
+            n = min(len(detections.conf), MAX_BOXES)
+            boxes = self.boxes[index]
+            boxes[:n, :4] = detections.xyxy[:n]
+            boxes[:n, 4] = detections.conf[:n]
+            boxes[:n, 5] = detections.cls[:n]
+            self.box_counts[index] = n
+        self.counts[index] = count
+
+    def boxes_at(self, index: int) -> np.ndarray:
+        """Copy of the ``(n, 6)`` detections stored for a slot."""
+        if self.closed:
+            return np.empty((0, _BOX_FIELDS), np.float32)
+        return self.boxes[index, :int(self.box_counts[index])].copy()
+
+    def latest_slot(self) -> Optional[Tuple[int, int]]:
+        """``(seq, index)`` of the newest committed frame."""
+        if self.closed:
+            return None
+        head = self.head
+        if not head:
+            return None
+        matches = np.flatnonzero(self.seqs == head)
+        if not len(matches):
+            return None
+        return head, int(matches[0])
+
+    def latest(self) -> Optional[Tuple[int, np.ndarray, float, int]]:
+        """``(seq, frame_view, timestamp, count)`` of the newest frame; count is -1 until inferred."""
+        slot = self.latest_slot()
+        if slot is None:
+            return None
+        head, index = slot
+        return head, self.frames[index], float(self.times[index]), int(self.counts[index])
+
+    def recent(self) -> List[Tuple[int, int, float, int]]:
+        """``(seq, index, timestamp, count)`` for every valid slot, oldest first."""
+        if self.closed:
+            return []
+        order = np.argsort(self.seqs)
+        return [
+            (int(self.seqs[i]), int(i), float(self.times[i]), int(self.counts[i]))
+            for i in order if self.seqs[i] > 0
+        ]
+
+    def locate(self, array: np.ndarray) -> Optional[int]:
+        """Offset of ``array`` inside the shared block if it is one of this ring's slots."""
+        if self.closed:
+            return None
+        address = array.__array_interface__['data'][0]
+        offset = address - self._base
+        if 0 <= offset < self.capacity * self.frame_bytes and offset % self.frame_bytes == 0 \
+                and array.shape == self.shape and array.flags['C_CONTIGUOUS']:
+            return self._frames_offset + offset
+        return None
+
+    def close(self):
+        """Detach; the owner also unlinks the block and notifies listeners.
+
+        Views handed out earlier stay valid: if a reader still holds one, the
+        mapping is only released once it has been dropped.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.owner:
+            with _registry_lock:
+                _registry.pop(self.name, None)
+            for listener in list(_release_listeners):
+                listener(self.name)
+        del self.header, self.seqs, self.times, self.counts, self.box_counts, self.boxes, self.frames
+        _close_shm(self.shm)
+        _reap_orphans()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def locate(array: np.ndarray) -> Optional[Tuple[str, int]]:
+    """Map a frame view back to ``(shm_name, offset)`` if it lives in a ring of this process."""
+    with _registry_lock:
+        rings = list(_registry.values())
+    for ring in rings:
+        offset = ring.locate(array)
+        if offset is not None:
+            return ring.name, offset
+    return None
+
+
+def add_release_listener(listener: Callable[[str], None]):
+    """Call ``listener(shm_name)`` whenever a ring owned by this process is closed."""
+    _release_listeners.append(listener)
+
+
+def remove_release_listener(listener: Callable[[str], None]):
+    if listener in _release_listeners:
+        _release_listeners.remove(listener)
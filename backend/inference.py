@@ -0,0 +1,300 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# YOLO/COCO class index for 'person'
+PERSON_CLASS = 0
+
+
+class Detections(NamedTuple):
+    """Detection output of one frame as plain numpy arrays."""
+    xyxy: np.ndarray  # (N, 4) float32 box corners
+    conf: np.ndarray  # (N,) float32 scores
+    cls: np.ndarray   # (N,) int class ids
+
+    @classmethod
+    def empty(cls) -> 'Detections':
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int32))
+
+    @classmethod
+    def from_result(cls, result) -> 'Detections':
+        """Convert an ultralytics ``Results`` object (or None) in one bulk transfer per field."""
+        if result is None or result.boxes is None or len(result.boxes) == 0:
+            return cls.empty()
+        boxes = result.boxes
+        return cls(
+            boxes.xyxy.cpu().numpy().astype(np.float32, copy=False),
+            boxes.conf.cpu().numpy().astype(np.float32, copy=False),
+            boxes.cls.cpu().numpy().astype(np.int32),
+        )
+
+    def count(self, class_id: int = PERSON_CLASS) -> int:
+        return int(np.count_nonzero(self.cls == class_id))
+
+    def scaled(self, scale_x: float, scale_y: float) -> 'Detections':
+        """Boxes mapped onto a frame of another resolution, e.g. the main stream of a sub-stream camera."""
+        factors = np.array([scale_x, scale_y, scale_x, scale_y], np.float32)
+        return Detections(self.xyxy * factors, self.conf, self.cls)
+
+    def shifted(self, dx: float, dy: float) -> 'Detections':
+        """Boxes moved by ``(dx, dy)``, e.g. from a cropped region back onto the whole frame."""
+        if not dx and not dy:
+            return self
+        offset = np.array([dx, dy, dx, dy], np.float32)
+        return Detections(self.xyxy + offset, self.conf, self.cls)
+
+
+def annotate(frame: np.ndarray, detections: Detections, names: Optional[Dict[int, str]] = None) -> np.ndarray:
+    """Draw boxes and the person count on a copy of ``frame``."""
+    frame = frame.copy()
+    for (x1, y1, x2, y2), score, class_id in zip(detections.xyxy.astype(int), detections.conf, detections.cls):
+        color = (0, 255, 0) if class_id == PERSON_CLASS else (255, 128, 0)
+        label = f"{names.get(int(class_id), class_id) if names else class_id} {score:.2f}"
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, max(y1 - 5, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    cv2.putText(frame, f'Persons: {detections.count()}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2, cv2.LINE_AA)
+    return frame
+
+
+class DetectionConfig:
+    """How much work detection does per camera.
+
+    ``full`` mode keeps the original behaviour: every frame, native
+    resolution, all COCO classes. ``counting`` mode only detects persons at a
+    reduced ``imgsz``, caps inference at ``target_hz`` per camera and skips
+    frames whose motion score is below ``motion_threshold``. ``person_only``
+    and ``imgsz`` apply to the whole batch; the rest are per camera.
+    """
+
+    def __init__(
+        self,
+        person_only: bool = False,
+        imgsz: Optional[int] = None,
+        conf: float = 0.5,
+        every_n: int = 1,
+        target_hz: Optional[float] = None,
+        motion_threshold: float = 0.0,
+        max_idle: float = 10.0,
+        zone_margin: float = 0.15,
+    ):
+        self.person_only = person_only
+        self.imgsz = imgsz
+        self.conf = conf
+        self.every_n = max(1, every_n)
+        self.target_hz = target_hz
+        # Fraction of changed pixels (0..1) needed to run inference; 0 disables motion gating
+        self.motion_threshold = motion_threshold
+        # Force an inference at least this often even without motion (seconds)
+        self.max_idle = max_idle
+        # Cameras with zones infer on the box around them, grown by this share of its size per side
+        self.zone_margin = zone_margin
+
+    @classmethod
+    def counting(cls, **overrides) -> 'DetectionConfig':
+        params = dict(person_only=True, imgsz=320, target_hz=2.0, motion_threshold=0.002)
+        params.update(overrides)
+        return cls(**params)
+
+    @classmethod
+    def from_env(cls) -> 'DetectionConfig':
+        """Build a config from DETECTION_* environment variables."""
+        env = os.environ
+        base = cls.counting() if env.get('DETECTION_MODE', 'full') == 'counting' else cls()
+        if 'DETECTION_PERSON_ONLY' in env:
+            base.person_only = env['DETECTION_PERSON_ONLY'].lower() in ('1', 'true', 'yes')
+        if 'DETECTION_IMGSZ' in env:
+            base.imgsz = int(env['DETECTION_IMGSZ']) or None
+        if 'DETECTION_CONF' in env:
+            base.conf = float(env['DETECTION_CONF'])
+        if 'DETECTION_EVERY_N' in env:
+            base.every_n = max(1, int(env['DETECTION_EVERY_N']))
+        if 'DETECTION_TARGET_HZ' in env:
+            base.target_hz = float(env['DETECTION_TARGET_HZ']) or None
+        if 'DETECTION_MOTION_THRESHOLD' in env:
+            base.motion_threshold = float(env['DETECTION_MOTION_THRESHOLD'])
+        if 'DETECTION_MAX_IDLE' in env:
+            base.max_idle = float(env['DETECTION_MAX_IDLE'])
+        if 'DETECTION_ZONE_MARGIN' in env:
+            base.zone_margin = max(0.0, float(env['DETECTION_ZONE_MARGIN']))
+        return base
+
+    def predict_kwargs(self) -> dict:
+        kwargs = {'conf': self.conf, 'verbose': False}
+        if self.person_only:
+            kwargs['classes'] = [PERSON_CLASS]
+        if self.imgsz:
+            kwargs['imgsz'] = self.imgsz
+        return kwargs
+
+
+class FrameGate:
+    """Per-camera decision whether a new frame is worth running inference on."""
+
+    MOTION_SIZE = (64, 48)
+    PIXEL_DELTA = 25
+
+    def __init__(self, config: DetectionConfig):
+        self.config = config
+        self.last_seq = 0
+        # Last inference, and last time the frame was looked at (inferred or motion-checked)
+        self.last_time = 0.0
+        self.last_check = 0.0
+        self._reference: Optional[np.ndarray] = None
+        self.skipped = 0
+
+    def admit(self, seq: int, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        config = self.config
+        now = time.time() if now is None else now
+        if self.last_seq and seq - self.last_seq < config.every_n:
+            return self._skip()
+        # The Hz cap also bounds motion checks, which cost a full-resolution resize each
+        if config.target_hz and now - self.last_check < 1.0 / config.target_hz:
+            return self._skip()
+        self.last_check = now
+
+        if config.motion_threshold > 0:
+            small = cv2.cvtColor(cv2.resize(frame, self.MOTION_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            idle = now - self.last_time < config.max_idle
+            if self._reference is not None and idle and self.motion_score(small) < config.motion_threshold:
+                return self._skip()
+            self._reference = small
+
+        self.last_seq = seq
+        self.last_time = now
+        return True
+
+    def motion_score(self, small: np.ndarray) -> float:
+        """Fraction of pixels that changed noticeably since the last inferred frame."""
+        diff = cv2.absdiff(small, self._reference)
+        return np.count_nonzero(diff > self.PIXEL_DELTA) / diff.size
+
+    def _skip(self) -> bool:
+        self.skipped += 1
+        return False
+
+
+class InferenceScheduler:
+    """Gathers the newest pending frame from every camera into batched predict calls.
+
+    Batch size and tick interval adapt to keep each batch within
+    ``latency_budget`` seconds: over budget shrinks the batch multiplicatively
+    and slows the tick down, comfortably under budget grows the batch by one
+    and speeds the tick back up.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[np.ndarray]], list],
+        latency_budget: float = 0.25,
+        max_batch_size: int = 16,
+        min_interval: float = 0.0,
+        max_interval: float = 1.0,
+        stats_window: float = 10.0,
+    ):
+        self.predict_batch = predict_batch
+        self.latency_budget = latency_budget
+        self.max_batch_size = max(1, max_batch_size)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.batch_size = 1
+        self.interval = min_interval
+        # Number of cameras left pending by the last collect()
+        self.backlog = 0
+        self._offset = 0
+        self._stats_lock = threading.Lock()
+        self._stats_window = stats_window
+        # (finished_at, frames, latency) for batches inside the stats window
+        self._history: Deque[Tuple[float, int, float]] = deque()
+        self._total_frames = 0
+        self._total_batches = 0
+        self._last_latency = 0.0
+        self._last_batch = 0
+
+    def collect(self, streams: Sequence) -> List[Tuple[object, np.ndarray]]:
+        """Take up to ``batch_size`` pending frames, rotating the start camera for fairness."""
+        batch = []
+        pending = 0
+        count = len(streams)
+        for i in range(count):
+            stream = streams[(self._offset + i) % count]
+            if len(batch) >= self.batch_size:
+                if stream.has_pending():
+                    pending += 1
+                continue
+            taken = stream.take_pending()
+            if taken is None:
+                continue
+            seq, frame = taken
+            gate = getattr(stream, 'gate', None)
+            if gate is not None and not gate.admit(seq, frame):
+                stream.discard()
+                continue
+            batch.append((stream, frame))
+        if count:
+            self._offset = (self._offset + len(batch)) % count
+        self.backlog = pending
+        return batch
+
+    def run(self, frames: List[np.ndarray]) -> list:
+        """Run one batched predict call, record its latency and adapt the schedule."""
+        started = time.perf_counter()
+        results = self.predict_batch(frames)
+        latency = time.perf_counter() - started
+        self._record(len(frames), latency)
+        self._adapt(len(frames), latency)
+        return results
+
+    def _adapt(self, frames: int, latency: float):
+        if latency > self.latency_budget:
+            if self.batch_size > 1:
+                self.batch_size = max(1, int(self.batch_size * self.latency_budget / latency))
+            else:
+                # A single frame already blows the budget: back off the tick rate
+                self.interval = min(self.max_interval, max(self.interval * 1.5, 0.05))
+        elif latency < self.latency_budget * 0.5:
+            if self.interval > self.min_interval:
+                self.interval *= 0.5
+                if self.interval < 0.01:
+                    self.interval = self.min_interval
+            elif self.backlog and frames >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + 1)
+
+    def _record(self, frames: int, latency: float):
+        now = time.time()
+        with self._stats_lock:
+            self._history.append((now, frames, latency))
+            while self._history and now - self._history[0][0] > self._stats_window:
+                self._history.popleft()
+            self._total_frames += frames
+            self._total_batches += 1
+            self._last_latency = latency
+            self._last_batch = frames
+
+    def get_stats(self) -> dict:
+        """Per-batch latency and throughput over the recent stats window."""
+        now = time.time()
+        with self._stats_lock:
+            history = [h for h in self._history if now - h[0] <= self._stats_window]
+            frames = sum(h[1] for h in history)
+            latencies = sorted(h[2] for h in history)
+            span = now - history[0][0] if history else 0.0
+            return {
+                'batch_size': self.batch_size,
+                'interval': self.interval,
+                'latency_budget': self.latency_budget,
+                'last_batch_frames': self._last_batch,
+                'last_batch_latency': self._last_latency,
+                'avg_batch_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'p95_batch_latency': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+                'frames_per_second': frames / max(span, 1.0) if history else 0.0,
+                'batches_per_second': len(history) / max(span, 1.0) if history else 0.0,
+                'total_frames': self._total_frames,
+                'total_batches': self._total_batches,
+                'backlog': self.backlog,
+            }
+
@@ -0,0 +1,296 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Hot paths take well under a millisecond to seconds; frame reads and lock waits sit at the low end
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels):
+        """Forget one label set, e.g. a camera that was closed."""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            values = sorted(self._values.items())
+        yield from self._samples(values)
+
+    def _samples(self, values) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic count per label set; names end in ``_total``."""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self, values) -> Iterator[str]:
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    """Bucketed observations (seconds) per label set, with sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, the last one for +Inf; then the sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state[0]) if state is not None else 0
+
+    def _samples(self, values) -> Iterator[str]:
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket = _format_labels(self.labelnames, key, f'le="{le}"')
+                yield f"{self.name}_bucket{bucket} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """Metrics by name, rendered in the Prometheus text format for ``/metrics``."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def remove(self, **labels):
+        """Forget a label set (e.g. ``camera='3'``) in every metric that has exactly these labels."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if set(metric.labelnames) == set(labels):
+                metric.remove(**labels)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+
+class TimedLock:
+    """A ``threading.Lock`` whose ``with`` blocks record how long they waited for it."""
+
+    def __init__(self, wait_seconds: Histogram, **labels):
+        self._lock = threading.Lock()
+        self._histogram = wait_seconds
+        self._labels = labels
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(blocking=False):
+            self._histogram.observe(0.0, **self._labels)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(timeout=timeout)
+        self._histogram.observe(time.perf_counter() - start, **self._labels)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def time_commits(commit_seconds: Histogram, session_class=None):
+    """Observe the duration of every ORM session commit (flush included) in ``commit_seconds``."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    session_class = session_class or Session
+
+    @event.listens_for(session_class, 'before_commit')
+    def _before_commit(session):
+        session.info['commit_started'] = time.perf_counter()
+
+    @event.listens_for(session_class, 'after_commit')
+    def _after_commit(session):
+        started = session.info.pop('commit_started', None)
+        if started is not None:
+            commit_seconds.observe(time.perf_counter() - started)
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread, e.g. the inference thread, while switched on.
+
+    Off by default and free while off. ``start`` samples the named thread
+    every ``interval`` seconds for at most ``seconds`` from a background
+    thread; ``report`` returns the most frequent stacks in the folded format
+    flame graph tools read (``outer;inner;leaf count``) and the functions
+    with the most samples at the top of the stack (self) and anywhere on it.
+    """
+
+    MAX_SECONDS = 600.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.target: Optional[str] = None
+        self.interval = 0.0
+        self.started: Optional[float] = None
+        self.samples = 0
+        self.stacks: _Tally = _Tally()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, thread_name: str = 'camera-inference', interval: float = 0.005, seconds: float = 30.0):
+        """Start sampling ``thread_name``; raises ValueError if it is not running or a profile already is."""
+        if not 0.001 <= interval <= 1.0 or not 0 < seconds <= self.MAX_SECONDS:
+            raise ValueError(f"interval must be 0.001-1 s and seconds 0-{self.MAX_SECONDS:.0f}")
+        target = next((t for t in threading.enumerate() if t.name == thread_name), None)
+        if target is None:
+            raise ValueError(f"No thread named {thread_name}")
+        with self._lock:
+            if self.running:
+                raise ValueError("A profile is already running")
+            self._stop.clear()
+            self.target, self.interval, self.started = thread_name, interval, time.time()
+            self.samples = 0
+            self.stacks = _Tally()
+            self.thread = threading.Thread(target=self._run, args=(target.ident, interval, seconds),
+                                           name="profiler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self.thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=2.0)
+
+    def _run(self, ident: int, interval: float, seconds: float):
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                break  # The thread ended
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            with self._lock:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def report(self, limit: int = 50) -> dict:
+        with self._lock:
+            stacks = self.stacks.most_common()
+            samples = self.samples
+        own, total = _Tally(), _Tally()
+        for stack, count in stacks:
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+
+        def top(tally: _Tally) -> List[dict]:
+            return [{'function': function, 'samples': count, 'share': round(count / samples, 3)}
+                    for function, count in tally.most_common(limit)]
+
+        return {
+            'running': self.running,
+            'thread': self.target,
+            'interval': self.interval,
+            'started': self.started,
+            'samples': samples,
+            'self': top(own) if samples else [],
+            'total': top(total) if samples else [],
+            'folded': [f"{stack} {count}" for stack, count in stacks[:limit]],
+        }
@@ -0,0 +1,101 @@
+import os
+import shutil
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+# ultralytics export formats of the runtimes that run without PyTorch
+EXPORT_FORMATS = {'onnx': 'onnx', 'openvino': 'openvino'}
+
+
+class ModelSpec(NamedTuple):
+    """Which detector to run, and on which runtime.
+
+    ``torch`` loads the ``.pt`` weights as before. ``onnx`` (ONNX Runtime)
+    and ``openvino`` load a model exported from those weights, which is
+    usually several times faster on CPUs; ``int8`` quantizes the OpenVINO
+    export. Exports are made once and cached in the model directory under a
+    name that encodes the whole spec, so restarts load them directly.
+    """
+    name: str = 'yolo11s'
+    runtime: str = 'torch'
+    int8: bool = False
+    imgsz: int = 640
+
+    @classmethod
+    def from_env(cls, imgsz: Optional[int] = None) -> 'ModelSpec':
+        """Spec from DETECTION_MODEL / DETECTION_RUNTIME / DETECTION_INT8; ``imgsz`` is the export size."""
+        return cls(
+            name=os.environ.get('DETECTION_MODEL', 'yolo11s'),
+            runtime=os.environ.get('DETECTION_RUNTIME', 'torch').lower(),
+            int8=os.environ.get('DETECTION_INT8', 'false').lower() in ('1', 'true', 'yes'),
+            imgsz=imgsz or 640,
+        ).validated()
+
+    @classmethod
+    def parse(cls, text: str, imgsz: int = 640) -> 'ModelSpec':
+        """``name[:runtime[:int8]]``, e.g. ``yolo11n:openvino:int8``."""
+        parts = text.split(':')
+        return cls(
+            name=parts[0],
+            runtime=parts[1].lower() if len(parts) > 1 else 'torch',
+            int8=len(parts) > 2 and parts[2].lower() == 'int8',
+            imgsz=imgsz,
+        ).validated()
+
+    def validated(self) -> 'ModelSpec':
+        if self.runtime != 'torch' and self.runtime not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown DETECTION_RUNTIME: {self.runtime}")
+        if self.int8 and self.runtime != 'openvino':
+            raise ValueError("INT8 models need DETECTION_RUNTIME=openvino")
+        return self
+
+    @property
+    def is_path(self) -> bool:
+        """``name`` points at a model file or export directory rather than naming released weights."""
+        return os.sep in self.name or os.path.splitext(self.name)[1] != '' or self.name.endswith('_model')
+
+    @property
+    def key(self) -> str:
+        base = os.path.splitext(os.path.basename(self.name.rstrip(os.sep)))[0]
+        return f"{base}-{self.imgsz}{'-int8' if self.int8 else ''}"
+
+    def artifact(self, directory: str = MODEL_DIR) -> str:
+        """Where the export of this spec is cached."""
+        if self.runtime == 'onnx':
+            return os.path.join(directory, f"{self.key}.onnx")
+        return os.path.join(directory, f"{self.key}_openvino_model")
+
+    def prepare(self, directory: str = MODEL_DIR) -> str:
+        """Path for ``YOLO(...)``: the weights, or the cached export (exporting it on first use)."""
+        if self.runtime == 'torch':
+            return self.name if self.is_path else f"{self.name}.pt"
+        if self.is_path and not self.name.endswith('.pt'):
+            return self.name  # Already exported
+        target = self.artifact(directory)
+        if os.path.exists(target):
+            return target
+        os.makedirs(directory, exist_ok=True)
+        # Several workers may start at once; one exports, the others wait and reuse it
+        with open(os.path.join(directory, f"{self.key}.{self.runtime}.lock"), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(target):
+                self._export(directory, target)
+        return target
+
+    def _export(self, directory: str, target: str):
+        from ultralytics import YOLO
+        weights = self.name if self.is_path else os.path.join(directory, f"{self.name}.pt")
+        print(f"Exporting {weights} to {self.runtime}{' INT8' if self.int8 else ''} at {self.imgsz}px, "
+              f"cached as {target}")
+        kwargs = dict(format=EXPORT_FORMATS[self.runtime], imgsz=self.imgsz, dynamic=True)
+        if self.int8:
+            kwargs.update(int8=True, data=os.environ.get('DETECTION_INT8_DATA', 'coco8.yaml'))
+        exported = str(YOLO(weights).export(**kwargs))
+        # Lands next to the weights; move it under the name of the full spec
+        shutil.move(exported, target)
@@ -0,0 +1,338 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from zones import ZONE_SEPARATOR, split_zone, zone_key
+
+# How the counts of several cameras in one room combine
+FUSION_MODES = ('max', 'sum')
+
+
+class OccupancyPolicy(NamedTuple):
+    """How raw detections become the stable counts automation acts on.
+
+    Per camera, person boxes are tracked across inferences: a new person
+    counts after ``min_hits`` consecutive detections, and a tracked one keeps
+    counting through up to ``max_misses`` inferences without a detection.
+    Per room, the cameras' counts are fused (``max`` for cameras watching the
+    same space, ``sum`` for disjoint views) and the room count follows the
+    time-weighted median of the last ``window`` seconds (0 turns smoothing
+    off). It only moves once ``hysteresis`` of the window is on the new
+    value's side.
+    """
+    min_hits: int = 2
+    max_misses: int = 2
+    # Farthest a person may move between inferences, in box sizes
+    gate: float = 1.0
+    window: float = 5.0
+    hysteresis: float = 0.6
+    fusion: str = 'max'
+
+    @classmethod
+    def from_env(cls) -> 'OccupancyPolicy':
+        env = os.environ
+        return cls(
+            min_hits=int(env.get('OCCUPANCY_MIN_HITS', 2)),
+            max_misses=int(env.get('OCCUPANCY_MAX_MISSES', 2)),
+            gate=float(env.get('OCCUPANCY_TRACK_GATE', 1.0)),
+            window=float(env.get('OCCUPANCY_WINDOW', 5.0)),
+            hysteresis=float(env.get('OCCUPANCY_HYSTERESIS', 0.6)),
+            fusion=env.get('OCCUPANCY_FUSION', 'max').lower(),
+        ).validated()
+
+    def validated(self) -> 'OccupancyPolicy':
+        if self.min_hits < 1 or self.max_misses < 0:
+            raise ValueError("OCCUPANCY_MIN_HITS must be at least 1 and OCCUPANCY_MAX_MISSES at least 0")
+        if self.window < 0:
+            raise ValueError("OCCUPANCY_WINDOW must not be negative")
+        if not 0.5 <= self.hysteresis <= 1.0:
+            raise ValueError("OCCUPANCY_HYSTERESIS must be between 0.5 and 1")
+        if self.fusion not in FUSION_MODES:
+            raise ValueError(f"Unknown OCCUPANCY_FUSION: {self.fusion}")
+        return self
+
+
+class PersonTracker:
+    """Greedy nearest-centre tracker over the person boxes of one camera.
+
+    Tracks are matched by the distance between box centres relative to the
+    track's box size, which still works at 1-2 inferences per second, when a
+    walking person's boxes no longer overlap from one inference to the next.
+    Tracks only age when inference runs, so frames skipped by the motion gate
+    never drop anyone.
+    """
+
+    def __init__(self, policy: Optional[OccupancyPolicy] = None):
+        self.policy = policy or OccupancyPolicy()
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.zeros((0, 4), np.float32)
+        self.hits = np.zeros(0, np.int32)
+        self.misses = np.zeros(0, np.int32)
+
+    def update(self, boxes: np.ndarray) -> int:
+        """Match one inference's ``(N, 4)`` person boxes to the tracks; returns the tracked count."""
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        matched = np.full(len(self.boxes), -1)
+        if len(self.boxes) and len(boxes):
+            tracked = (self.boxes[:, :2] + self.boxes[:, 2:]) / 2
+            detected = (boxes[:, :2] + boxes[:, 2:]) / 2
+            extent = self.boxes[:, 2:] - self.boxes[:, :2]
+            size = np.sqrt(np.maximum(extent[:, 0] * extent[:, 1], 1.0))
+            distance = np.linalg.norm(tracked[:, None] - detected[None], axis=2) / size[:, None]
+            taken = np.zeros(len(boxes), bool)
+            for flat in np.argsort(distance, axis=None):
+                track, box = divmod(int(flat), len(boxes))
+                if distance[track, box] > self.policy.gate:
+                    break
+                if matched[track] < 0 and not taken[box]:
+                    matched[track] = box
+                    taken[box] = True
+        hit = matched >= 0
+        self.boxes[hit] = boxes[matched[hit]]
+        self.hits[hit] += 1
+        self.misses[hit] = 0
+        self.misses[~hit] += 1
+        # Lost tracks go, and so do unconfirmed ones on their first miss (a one-off false positive)
+        keep = (self.misses <= self.policy.max_misses) & (hit | (self.hits >= self.policy.min_hits))
+        new = np.ones(len(boxes), bool)
+        new[matched[hit]] = False
+        self.boxes = np.concatenate([self.boxes[keep], boxes[new]])
+        self.hits = np.concatenate([self.hits[keep], np.ones(int(new.sum()), np.int32)])
+        self.misses = np.concatenate([self.misses[keep], np.zeros(int(new.sum()), np.int32)])
+        return self.count()
+
+    def count(self) -> int:
+        return int(np.count_nonzero(self.hits >= self.policy.min_hits))
+
+    def confirmed(self) -> np.ndarray:
+        """Latest boxes of the tracks that count."""
+        return self.boxes[self.hits >= self.policy.min_hits]
+
+
+class CountSmoother:
+    """Time-weighted sliding-window median of a count, with hysteresis.
+
+    Fed the count whenever it changes; ``update`` re-evaluates as the window
+    slides. ``confidence`` is the share of the window spent at the stable
+    count: 1.0 once the input has agreed with it for a whole window.
+    """
+
+    def __init__(self, window: float, hysteresis: float):
+        self.window = window
+        self.hysteresis = hysteresis
+        # (time, count) change points; the oldest may start before the window, holding its value into it
+        self.points: Deque[Tuple[float, int]] = deque()
+        self.stable: Optional[int] = None
+        self.confidence = 0.0
+
+    def add(self, now: float, count: int):
+        if self.points and self.points[-1][1] == count:
+            return
+        self.points.append((now, count))
+        if self.stable is None:
+            self.stable = count  # Nothing to smooth against yet
+
+    @property
+    def settled(self) -> bool:
+        """Nothing left to re-evaluate until the next change: the window agrees with the stable count."""
+        return len(self.points) <= 1 and self.confidence >= 1.0
+
+    def update(self, now: float) -> bool:
+        """Slide the window to ``now``; returns whether the stable count changed."""
+        if not self.points:
+            return False
+        if self.window <= 0:  # Smoothing off: follow the input
+            latest = self.points[-1][1]
+            self.points = deque([self.points[-1]])
+            changed, self.stable, self.confidence = latest != self.stable, latest, 1.0
+            return changed
+        start = now - self.window
+        while len(self.points) > 1 and self.points[1][0] <= start:
+            self.points.popleft()
+        weights: Dict[int, float] = {}
+        for i, (t, count) in enumerate(self.points):
+            end = self.points[i + 1][0] if i + 1 < len(self.points) else now
+            weights[count] = weights.get(count, 0.0) + max(end - max(t, start), 0.0)
+        total = sum(weights.values())
+        if total <= 0:
+            return False
+        cumulative, median = 0.0, self.stable
+        for count in sorted(weights):
+            cumulative += weights[count]
+            if cumulative >= total / 2:
+                median = count
+                break
+        changed = False
+        if median != self.stable:
+            if median > self.stable:
+                support = sum(w for count, w in weights.items() if count >= median)
+            else:
+                support = sum(w for count, w in weights.items() if count <= median)
+            if support >= self.hysteresis * total:
+                self.stable = median
+                changed = True
+        # Grows over the first window: a count seen for a moment is not yet trusted
+        self.confidence = round(min(weights.get(self.stable, 0.0) / self.window, 1.0), 3)
+        return changed
+
+
+class OccupancyEstimator:
+    """Stable per-room person counts on top of the per-camera counts.
+
+    Listens to the camera counts (of this process, or of the whole cluster)
+    and publishes a room's count through the same listener interface only
+    when its smoothed value changes, so a missed detection or a person
+    walking past the door does not restart device timers or write history.
+    Cameras belong to the room in front of the first ``.`` of their id:
+    ``12`` is room 12's camera, ``12.1`` its first extra camera. Zone counts
+    (``12:desk``) are smoothed on their own, as if the zone were a room.
+
+    Changes are published from whichever thread made them (a camera's count
+    listener or the re-evaluation thread). Each carries the room's change
+    number, and listeners are called one change at a time, skipping any
+    change older than one already published, so they never see a room go
+    back to a superseded count.
+    """
+
+    # Seconds between re-evaluations while a room's window still holds other counts
+    TICK = 0.25
+
+    def __init__(self, camera_counts, policy: Optional[OccupancyPolicy] = None,
+                 logger: Optional[logging.Logger] = None):
+        self.camera_counts = camera_counts
+        self.policy = policy or OccupancyPolicy()
+        self.logger = logger or logging.getLogger(__name__)
+        self._cond = threading.Condition()
+        # room_id -> camera_id -> last (tracked) count
+        self.cameras: Dict[str, Dict[str, int]] = {}
+        self.smoothers: Dict[str, CountSmoother] = {}
+        # room_id -> number of the room's latest stable count change, and of the latest one published
+        self._changes: Dict[str, int] = {}
+        self._published: Dict[str, int] = {}
+        # Reentrant: a listener may feed a count back in
+        self._notify_lock = threading.RLock()
+        self._count_listeners: List[Callable[[str, int], None]] = []
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def room_of(camera_id: str) -> str:
+        camera_id, zone = split_zone(camera_id)
+        room_id = camera_id.split('.', 1)[0]
+        return zone_key(room_id, zone) if zone else room_id
+
+    def start(self):
+        self.running = True
+        self.camera_counts.add_count_listener(self.on_count)
+        self.thread = threading.Thread(target=self._run, name="occupancy", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.camera_counts.remove_count_listener(self.on_count)
+        with self._cond:
+            self._cond.notify()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+
+    def add_count_listener(self, listener: Callable[[str, int], None]):
+        """Call ``listener(room_id, person_count)`` whenever a room's stable count changes."""
+        self._count_listeners.append(listener)
+
+    def remove_count_listener(self, listener: Callable[[str, int], None]):
+        if listener in self._count_listeners:
+            self._count_listeners.remove(listener)
+
+    def on_count(self, camera_id: str, person_count: int):
+        """Camera count listener."""
+        room_id = self.room_of(camera_id)
+        now = time.monotonic()
+        with self._cond:
+            cameras = self.cameras.setdefault(room_id, {})
+            cameras[camera_id] = person_count
+            smoother = self.smoothers.get(room_id)
+            if smoother is None:
+                smoother = self.smoothers[room_id] = CountSmoother(self.policy.window, self.policy.hysteresis)
+            smoother.add(now, self._fuse(cameras))
+            change = self._changed(room_id) if smoother.update(now) else None
+            stable = smoother.stable
+            self._cond.notify()
+        if change is not None:
+            self._notify(room_id, stable, change)
+
+    def _changed(self, room_id: str) -> int:
+        # Caller holds self._cond
+        change = self._changes[room_id] = self._changes.get(room_id, 0) + 1
+        return change
+
+    def _fuse(self, cameras: Dict[str, int]) -> int:
+        if self.policy.fusion == 'sum':
+            return sum(cameras.values())
+        return max(cameras.values())
+
+    def _run(self):
+        while self.running:
+            with self._cond:
+                unsettled = any(not smoother.settled for smoother in self.smoothers.values())
+                self._cond.wait(self.TICK if unsettled else None)
+                now = time.monotonic()
+                changes = [(room_id, smoother.stable, self._changed(room_id))
+                           for room_id, smoother in self.smoothers.items()
+                           if not smoother.settled and smoother.update(now)]
+            for room_id, person_count, change in changes:
+                self._notify(room_id, person_count, change)
+
+    def _notify(self, room_id: str, person_count: int, change: int):
+        with self._notify_lock:
+            # A later change of the room may have been published while this one waited for the lock
+            if change <= self._published.get(room_id, 0):
+                return
+            self._published[room_id] = change
+            for listener in list(self._count_listeners):
+                try:
+                    listener(room_id, person_count)
+                except Exception as e:
+                    self.logger.error(f"Occupancy listener failed for room {room_id}: {e}")
+
+    def get_person_count(self, room_id: str) -> Optional[int]:
+        """Stable count of a room; the camera's own count for rooms not heard from yet."""
+        with self._cond:
+            smoother = self.smoothers.get(room_id)
+            if smoother is not None:
+                return smoother.stable
+        return self.camera_counts.get_person_count(room_id)
+
+    def get_occupancy(self, room_id: str) -> Optional[dict]:
+        with self._cond:
+            smoother = self.smoothers.get(room_id)
+            if smoother is None:
+                return None
+            return {
+                'room_id': room_id,
+                'person_count': smoother.stable,
+                'confidence': smoother.confidence,
+                'cameras': dict(self.cameras.get(room_id, {})),
+                'fusion': self.policy.fusion,
+                'zones': self._zones(room_id),
+            }
+
+    def _zones(self, room_id: str) -> Dict[str, dict]:
+        # Caller holds self._cond
+        prefix = room_id + ZONE_SEPARATOR
+        return {key[len(prefix):]: {'person_count': smoother.stable, 'confidence': smoother.confidence}
+                for key, smoother in self.smoothers.items() if key.startswith(prefix)}
+
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                'rooms': len(self.smoothers),
+                'unsettled': sum(1 for smoother in self.smoothers.values() if not smoother.settled),
+                'policy': self.policy._asdict(),
+            }
@@ -0,0 +1,162 @@
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from framering import FrameRing
+from inference import PERSON_CLASS, Detections, annotate
+from streaming import FrameBroadcaster, StreamProfile
+
+# The owner's model labels are not known here; the overlay only needs the person class
+_NAMES = {PERSON_CLASS: 'person'}
+
+
+def _render(frame: np.ndarray, detections: Detections) -> np.ndarray:
+    return annotate(frame, detections, _NAMES)
+
+
+def _newest_inferred(ring: FrameRing) -> Optional[Tuple[int, int]]:
+    """``(seq, index)`` of the newest slot inference has finished with; the owner keeps it pinned while published."""
+    inferred = [entry for entry in ring.recent() if entry[3] >= 0]
+    return inferred[-1][:2] if inferred else None
+
+
+def _read(ring: FrameRing, seq: int, index: int) -> Optional[Tuple[np.ndarray, Detections]]:
+    frame = ring.frames[index].copy()
+    boxes = ring.boxes_at(index)
+    if ring.seq_at(index) != seq:
+        return None  # Overwritten while we copied it
+    return frame, Detections(np.ascontiguousarray(boxes[:, :4]), boxes[:, 4].copy(), boxes[:, 5].astype(np.int32))
+
+
+class _RemoteCamera:
+    """Follows the inferred frames another worker writes to a camera's frame ring."""
+
+    POLL_INTERVAL = 1 / 30
+    IDLE_TIMEOUT = 10.0
+
+    def __init__(self, camera_id: str, ring_name: str):
+        self.camera_id = camera_id
+        self.ring_name = ring_name
+        self.ring = FrameRing.attach(ring_name)
+        self.broadcast = FrameBroadcaster(renderer=_render, name=camera_id)
+        self.last_seq = 0
+        self.last_used = time.monotonic()
+        self.running = True
+        self.thread = threading.Thread(target=self._poll_loop, name=f"remote-camera-{camera_id}", daemon=True)
+        self.thread.start()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def _poll_loop(self):
+        while self.running:
+            if self.broadcast.subscribers:
+                self.touch()
+            elif time.monotonic() - self.last_used > self.IDLE_TIMEOUT:
+                break
+            self._poll()
+            time.sleep(self.POLL_INTERVAL)
+        self.running = False
+        self.broadcast.close()
+        self.ring.close()
+
+    def _poll(self):
+        newest = _newest_inferred(self.ring)
+        if newest is None or newest[0] == self.last_seq:
+            return
+        read = _read(self.ring, *newest)
+        if read is None:
+            return
+        self.last_seq = newest[0]
+        self.broadcast.publish(*read)
+
+    def stop(self):
+        self.running = False
+
+
+class RemoteFrames:
+    """MJPEG frames of cameras run by another worker on this host, read from shared memory.
+
+    ``locate(camera_id)`` returns the camera's current ring name (or None),
+    e.g. from the cluster's camera state table. Readers are started on
+    demand and stop after ``IDLE_TIMEOUT`` seconds without viewers.
+    """
+
+    def __init__(self, locate: Callable[[str], Optional[str]], stream_profile: Optional[StreamProfile] = None):
+        self.locate = locate
+        self.stream_profile = stream_profile or StreamProfile.from_env()
+        self._lock = threading.Lock()
+        self._cameras: Dict[str, _RemoteCamera] = {}
+
+    def _get(self, camera_id: str) -> Optional[_RemoteCamera]:
+        ring_name = self.locate(camera_id)
+        if ring_name is None:
+            return None
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is not None and camera.running and camera.ring_name == ring_name:
+                camera.touch()
+                return camera
+            if camera is not None:
+                camera.stop()  # The owner restarted the camera or it moved to another worker
+            try:
+                camera = self._cameras[camera_id] = _RemoteCamera(camera_id, ring_name)
+            except FileNotFoundError:
+                self._cameras.pop(camera_id, None)
+                return None
+            return camera
+
+    def get_frame(self, camera_id: str, profile: Optional[StreamProfile] = None) -> Optional[bytes]:
+        camera = self._get(camera_id)
+        if camera is None:
+            return None
+        profile = profile or self.stream_profile
+        frame = camera.broadcast.latest(profile)
+        if frame is None:
+            result = camera.broadcast.next(profile, 0, timeout=1.0)
+            frame = result[1] if result else None
+        return frame
+
+    def get_raw_frame(self, camera_id: str) -> Optional[np.ndarray]:
+        """Copy of the newest grabbed frame (the newest inferred one if that was overwritten while copied).
+
+        Reads the ring once, without starting a reader, so asking neither
+        keeps a reader polling nor counts as a viewer.
+        """
+        ring_name = self.locate(camera_id)
+        if ring_name is None:
+            return None
+        try:
+            ring = FrameRing.attach(ring_name)
+        except FileNotFoundError:
+            return None
+        try:
+            for slot in (ring.latest_slot(), _newest_inferred(ring)):
+                read = _read(ring, *slot) if slot is not None else None
+                if read is not None:
+                    return read[0]
+            return None
+        finally:
+            ring.close()
+
+    def stream_frames(self, camera_id: str, profile: Optional[StreamProfile] = None) -> Optional[Iterator[bytes]]:
+        camera = self._get(camera_id)
+        if camera is None:
+            return None
+        return camera.broadcast.subscribe(profile or self.stream_profile)
+
+    def stream_frames_async(self, camera_id: str,
+                            profile: Optional[StreamProfile] = None) -> Optional[AsyncIterator[bytes]]:
+        camera = self._get(camera_id)
+        if camera is None:
+            return None
+        return camera.broadcast.subscribe_async(profile or self.stream_profile)
+
+    def close(self):
+        with self._lock:
+            cameras = list(self._cameras.values())
+            self._cameras.clear()
+        for camera in cameras:
+            camera.stop()
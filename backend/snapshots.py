@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from metrics import counter
+from streaming import StreamProfile
+
+SNAPSHOTS = counter('camera_snapshots_total', 'Snapshot requests, by whether the cached preview was used',
+                    ('result',))
+
+
+class Snapshot(NamedTuple):
+    data: bytes  # JPEG
+    etag: str
+
+
+class _Entry:
+    __slots__ = ('snapshot', 'made', 'refreshing')
+
+    def __init__(self, snapshot: Snapshot, made: float):
+        self.snapshot = snapshot
+        self.made = made
+        self.refreshing = False
+
+
+class SnapshotCache:
+    """Small JPEG previews of cameras for overview pages, cached with an ETag.
+
+    A preview is the camera's latest inferred frame scaled down to ``width``
+    pixels, made at most once per ``refresh`` seconds per camera however many
+    dashboards ask; while one request makes a new preview, the others get the
+    previous one. Serving a preview never decodes a camera's main stream or
+    encodes a full-resolution JPEG. Previews are kept in least recently used
+    order within ``max_bytes``.
+    """
+
+    def __init__(self, width: int = 320, quality: int = 70, refresh: float = 5.0, max_bytes: int = 8 << 20):
+        self.profile = StreamProfile(quality=min(100, max(10, quality)), width=max(0, width))
+        self.refresh = refresh
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self.bytes = 0
+
+    def get(self, camera_id: str, grab: Callable[[], Optional[np.ndarray]]) -> Optional[Snapshot]:
+        """The preview of ``camera_id``, made from ``grab()`` when missing or due; None if there is no frame."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(camera_id)
+            if entry is not None:
+                self._entries.move_to_end(camera_id)
+                if now - entry.made < self.refresh or entry.refreshing:
+                    SNAPSHOTS.inc(result='hit')
+                    return entry.snapshot
+                entry.refreshing = True
+        SNAPSHOTS.inc(result='refresh')
+        try:
+            frame = grab()
+            snapshot = None
+            if frame is not None:
+                data = self.profile.encode(frame)
+                snapshot = Snapshot(data, hashlib.sha1(data).hexdigest())
+        except Exception:
+            with self._lock:
+                if entry is not None:
+                    entry.refreshing = False
+            raise
+        with self._lock:
+            if snapshot is None:
+                # The camera has no picture (any more): don't keep showing its last one
+                self._remove(camera_id)
+            else:
+                self._store(camera_id, _Entry(snapshot, now))
+        return snapshot
+
+    def _store(self, camera_id: str, entry: _Entry):
+        # Caller holds self._lock
+        self._remove(camera_id)
+        self._entries[camera_id] = entry
+        self.bytes += len(entry.snapshot.data)
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted.snapshot.data)
+
+    def _remove(self, camera_id: str):
+        # Caller holds self._lock
+        entry = self._entries.pop(camera_id, None)
+        if entry is not None:
+            self.bytes -= len(entry.snapshot.data)
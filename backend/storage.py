@@ -0,0 +1,104 @@
+import os
+from typing import NamedTuple
+
+from sqlalchemy import event, inspect, text
+
+
+class SqliteSettings(NamedTuple):
+    """Per-connection SQLite pragmas.
+
+    WAL lets the status endpoint keep reading while heartbeats and
+    automation commits write, and ``synchronous=NORMAL`` is durable across
+    application crashes in WAL mode (only an OS crash can lose the last
+    transactions). ``busy_timeout`` makes a writer wait for the lock instead
+    of failing with "database is locked".
+    """
+    journal_mode: str = 'WAL'
+    synchronous: str = 'NORMAL'
+    busy_timeout_ms: int = 5000
+    cache_size_kib: int = 16384
+    mmap_size: int = 64 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> 'SqliteSettings':
+        return cls(
+            journal_mode=os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper(),
+            synchronous=os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper(),
+            busy_timeout_ms=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+            cache_size_kib=int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 16384)),
+            mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)),
+        )
+
+    def apply(self, dbapi_connection):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            # Negative cache_size is in KiB rather than pages
+            cursor.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+            cursor.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+
+def database_url(default_path: str) -> str:
+    """DATABASE_URL if set (e.g. a PostgreSQL URL), otherwise the SQLite file at ``default_path``."""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return f"sqlite:///{default_path}"
+    if url.startswith('postgres://'):
+        # Heroku-style scheme that SQLAlchemy no longer accepts
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url: str, sqlite: SqliteSettings = None) -> dict:
+    """SQLAlchemy ``create_engine`` options for ``url``."""
+    if url.startswith('sqlite'):
+        sqlite = sqlite or SqliteSettings.from_env()
+        # pysqlite's own lock wait; the busy_timeout pragma covers the same case for SQLite itself
+        return {'connect_args': {'timeout': sqlite.busy_timeout_ms / 1000.0}}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
+
+def install_pragmas(engine, sqlite: SqliteSettings = None):
+    """Apply ``sqlite`` pragmas to every new connection of a SQLite engine; no-op otherwise."""
+    if engine.dialect.name != 'sqlite':
+        return
+    sqlite = sqlite or SqliteSettings.from_env()
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        sqlite.apply(dbapi_connection)
+
+
+def ensure_schema(db):
+    """Create missing tables, columns and indexes declared on the models but missing in the database.
+
+    ``create_all`` skips tables that already exist, so columns and indexes
+    added to an existing model would otherwise never reach databases
+    created earlier. Added columns must be nullable.
+    """
+    db.create_all()
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable:
+                with engine.begin() as connection:
+                    connection.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                                            f"{column.type.compile(dialect=engine.dialect)}"))
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,334 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from aio import LoopSignal, loop_signal
+from metrics import histogram
+
+ENCODE_SECONDS = histogram('jpeg_encode_seconds', 'Time to draw the overlay and encode one feed frame', ('camera',))
+
+_FPS_STEPS = (0.5, 1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0, 60.0)
+
+
+class StreamProfile(NamedTuple):
+    """Encoding settings shared by every viewer that asks for the same stream."""
+    quality: int = 80
+    max_fps: float = 15.0
+    width: int = 0  # 0 keeps the native width
+
+    @classmethod
+    def from_env(cls) -> 'StreamProfile':
+        return cls.clamped(
+            os.environ.get('STREAM_JPEG_QUALITY', 80),
+            os.environ.get('STREAM_MAX_FPS', 15),
+            os.environ.get('STREAM_WIDTH', 0),
+        )
+
+    @classmethod
+    def clamped(cls, quality, max_fps, width) -> 'StreamProfile':
+        """Profile for viewer-supplied values, rounded to a small set so viewers share encodes."""
+        fps = min(60.0, max(0.5, float(max_fps)))
+        width = int(width)
+        return cls(
+            quality=min(100, max(10, round(int(quality) / 10) * 10)),
+            max_fps=min(_FPS_STEPS, key=lambda step: abs(step - fps)),
+            width=0 if width <= 0 else min(3840, max(160, round(width / 160) * 160)),
+        )
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        if self.width and frame.shape[1] > self.width:
+            height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer.tobytes()
+
+
+class _Encoded:
+    __slots__ = ('version', 'data', 'encoding', 'next_allowed', 'subscribers', 'last_used')
+
+    def __init__(self):
+        self.version = 0
+        self.data: Optional[bytes] = None
+        self.encoding = False
+        self.next_allowed = 0.0
+        self.subscribers = 0
+        self.last_used = time.monotonic()
+
+
+class _Published:
+    """A published frame and the encodes still reading it."""
+    __slots__ = ('frame', 'overlay', 'version', 'release', 'encodes')
+
+    def __init__(self, frame: np.ndarray, overlay: Any, version: int, release: Optional[Callable[[], None]]):
+        self.frame = frame
+        self.overlay = overlay
+        self.version = version
+        self.release = release
+        self.encodes = 0
+
+
+class _Snapshot(NamedTuple):
+    """The frame a viewer claimed for encoding, taken under the lock."""
+    published: _Published
+    rendered: Optional[Tuple[int, np.ndarray]]
+
+
+class FrameBroadcaster:
+    """Publishes one camera's frames as versioned JPEG buffers.
+
+    The producer only swaps in the new frame and bumps the version. The first
+    viewer of a profile that sees a new version encodes it outside the lock,
+    everyone else waiting on that profile reuses the same bytes, so N viewers
+    cost one encode per frame (and at most ``max_fps`` encodes per second).
+
+    Frames are published raw together with an ``overlay`` payload; the
+    optional ``renderer(frame, overlay)`` draws it only when a viewer actually
+    needs a JPEG, once per version.
+
+    A frame may be a view into memory its producer reuses (a ring slot). The
+    producer then passes ``release``, which is called once the frame has been
+    replaced and no encode is reading it any more; until then the producer
+    must not overwrite it.
+
+    Viewers are either threads (``subscribe``) or coroutines of an event
+    loop (``subscribe_async``); a waiting coroutine holds no thread.
+    """
+
+    # Encoded buffers kept for profiles nobody is subscribed to
+    MAX_IDLE_PROFILES = 4
+    # Consecutive frame timeouts after which a viewer of a stalled camera is let go
+    MAX_STALLS = 6
+
+    def __init__(self, renderer: Optional[Callable[[np.ndarray, Any], np.ndarray]] = None, name: str = ''):
+        self._cond = threading.Condition()
+        self.renderer = renderer
+        # Camera id, as the label of the encode metrics
+        self.name = name
+        self._current: Optional[_Published] = None
+        self._version = 0
+        # Rendered frame cached for the version it was drawn for
+        self._rendered: Optional[Tuple[int, np.ndarray]] = None
+        self._encoded: Dict[StreamProfile, _Encoded] = {}
+        self._subscribers = 0
+        # One per event loop with async viewers
+        self._signals: Dict[asyncio.AbstractEventLoop, LoopSignal] = {}
+        self.closed = False
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def publish(self, frame: np.ndarray, overlay: Any = None, release: Optional[Callable[[], None]] = None):
+        with self._cond:
+            replaced = self._current
+            self._version += 1
+            self._current = _Published(frame, overlay, self._version, release)
+            self._wake()
+            done = replaced is not None and not replaced.encodes
+        if done:
+            self._release(replaced)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            replaced, self._current = self._current, None
+            self._wake()
+            done = replaced is not None and not replaced.encodes
+        if done:
+            self._release(replaced)
+
+    @staticmethod
+    def _release(published: _Published):
+        """Hand a frame back to its producer; called without ``_cond`` held, once per frame."""
+        release, published.release = published.release, None
+        if release is not None:
+            release()
+
+    def _wake(self):
+        """Wake every waiting viewer, threads and coroutines; must be called with ``_cond`` held."""
+        self._cond.notify_all()
+        for signal in self._signals.values():
+            signal.notify()
+
+    def _entry(self, profile: StreamProfile) -> _Encoded:
+        """Encoding state for ``profile``; must be called with ``_cond`` held."""
+        entry = self._encoded.get(profile)
+        if entry is None:
+            entry = self._encoded[profile] = _Encoded()
+            idle = sorted((e.last_used, p) for p, e in self._encoded.items()
+                          if not e.subscribers and not e.encoding and p != profile)
+            for _, stale in idle[:max(0, len(idle) - self.MAX_IDLE_PROFILES)]:
+                del self._encoded[stale]
+        entry.last_used = time.monotonic()
+        return entry
+
+    def latest(self, profile: StreamProfile) -> Optional[bytes]:
+        """Return the newest frame encoded for ``profile`` without waiting for a new one."""
+        with self._cond:
+            if self._current is None:
+                return None
+            entry = self._entry(profile)
+            if entry.data is not None and (entry.version == self._version or entry.encoding):
+                return entry.data
+            stale, after = entry.data, entry.version
+        result = self.next(profile, after, timeout=1.0)
+        return result[1] if result else stale
+
+    def next(self, profile: StreamProfile, after_version: int,
+             timeout: float = 10.0) -> Optional[Tuple[int, bytes]]:
+        """Block until a frame newer than ``after_version`` is encoded for ``profile``.
+
+        Returns ``(version, jpeg_bytes)``, or None on timeout or when closed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            entry = self._entry(profile)
+            while True:
+                step = self._claim(entry, after_version, deadline)
+                if not isinstance(step, float):
+                    break
+                self._cond.wait(step)
+        if isinstance(step, _Snapshot):
+            return self._encode(profile, entry, step)
+        return step
+
+    def _claim(self, entry: _Encoded, after_version: int, deadline: float):
+        """What a viewer of ``entry`` does next; must be called with ``_cond`` held.
+
+        Returns the ``(version, jpeg_bytes)`` to hand out, None to give up
+        (timeout or closed), the seconds to wait before asking again, or a
+        ``_Snapshot`` of the current frame that the caller now has to encode.
+        """
+        if self.closed:
+            return None
+        if entry.data is not None and entry.version > after_version:
+            return entry.version, entry.data
+        now = time.monotonic()
+        remaining = deadline - now
+        if remaining <= 0:
+            return None
+        current = self._current
+        if current is not None and current.version > entry.version and not entry.encoding:
+            wait = entry.next_allowed - now
+            if wait > 0:
+                return min(wait, remaining)
+            entry.encoding = True
+            # The frame stays with this encode until it is done, even if newer ones are published meanwhile
+            current.encodes += 1
+            return _Snapshot(current, self._rendered)
+        return remaining
+
+    def _encode(self, profile: StreamProfile, entry: _Encoded, snapshot: '_Snapshot') -> Tuple[int, bytes]:
+        """Render and encode a claimed frame outside the lock, then hand it to the profile's viewers."""
+        published, rendered = snapshot
+        frame, version = published.frame, published.version
+        started = time.perf_counter()
+        data = None
+        try:
+            if self.renderer is not None and published.overlay is not None:
+                if rendered is not None and rendered[0] == version:
+                    frame = rendered[1]
+                else:
+                    frame = self.renderer(frame, published.overlay)
+                    rendered = (version, frame)
+            data = profile.encode(frame)
+            ENCODE_SECONDS.observe(time.perf_counter() - started, camera=self.name)
+        finally:
+            with self._cond:
+                published.encodes -= 1
+                done = not published.encodes and published is not self._current
+                if rendered is not None and (self._rendered is None or self._rendered[0] < rendered[0]):
+                    self._rendered = rendered
+                if data is not None:
+                    entry.version = version
+                    entry.data = data
+                    entry.next_allowed = time.monotonic() + 1.0 / profile.max_fps
+                entry.encoding = False
+                self._wake()
+            if done:
+                self._release(published)
+        return version, data
+
+    async def _next_async(self, profile: StreamProfile, entry: _Encoded, after_version: int,
+                          timeout: float) -> Optional[Tuple[int, bytes]]:
+        """``next`` for coroutines: waits on the event loop and encodes in its default executor."""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                signal = loop_signal(self._signals)
+                step = self._claim(entry, after_version, deadline)
+                if isinstance(step, float):
+                    future = signal.waiter()
+            if isinstance(step, float):
+                await signal.wait(future, step)
+            elif isinstance(step, _Snapshot):
+                return await loop.run_in_executor(None, self._encode, profile, entry, step)
+            else:
+                return step
+
+    def subscribe(self, profile: StreamProfile, timeout: float = 10.0) -> Iterator[bytes]:
+        """Yield each new JPEG for ``profile`` until the broadcaster is closed.
+
+        While no new frame arrives the last one is repeated every ``timeout``
+        seconds (a write is the only way to notice a viewer that went away),
+        and after ``MAX_STALLS`` timeouts in a row the stream ends.
+        """
+        with self._cond:
+            self._subscribers += 1
+            entry = self._entry(profile)
+            entry.subscribers += 1
+        try:
+            version = 0
+            stalls = 0
+            while not self.closed:
+                result = self.next(profile, version, timeout=timeout)
+                if result is None:
+                    stalls += 1
+                    if stalls >= self.MAX_STALLS:
+                        break
+                    if entry.data is not None:
+                        yield entry.data
+                    continue
+                stalls = 0
+                version, data = result
+                yield data
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                entry.subscribers -= 1
+
+    async def subscribe_async(self, profile: StreamProfile, timeout: float = 10.0) -> AsyncIterator[bytes]:
+        """``subscribe`` for coroutines, with the same repeat and stall rules."""
+        with self._cond:
+            self._subscribers += 1
+            entry = self._entry(profile)
+            entry.subscribers += 1
+        try:
+            version = 0
+            stalls = 0
+            while not self.closed:
+                result = await self._next_async(profile, entry, version, timeout)
+                if result is None:
+                    stalls += 1
+                    if stalls >= self.MAX_STALLS:
+                        break
+                    if entry.data is not None:
+                        yield entry.data
+                    continue
+                stalls = 0
+                version, data = result
+                yield data
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+                entry.subscribers -= 1
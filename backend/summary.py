@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import case, func, select
+
+
+class BuildingSummary:
+    """Per-room device and occupancy counts for the dashboard, in one grouped query.
+
+    Device, enabled and online counts come from a single
+    ``building LEFT JOIN room LEFT JOIN device GROUP BY`` query; person counts
+    come from the occupancy estimator's in-memory state. Results are cached for
+    ``ttl`` seconds per building filter together with an ETag over the
+    content, so polling dashboards mostly get a 304 without touching the
+    database. A build that overlaps an ``invalidate()`` is returned but not
+    cached, as it may have read the rows before the write.
+    """
+
+    def __init__(self, db, building_model, room_model, device_model, occupancy,
+                 online_window: float = 60.0, ttl: float = 2.0):
+        self.db = db
+        self.Building = building_model
+        self.Room = room_model
+        self.Device = device_model
+        self.occupancy = occupancy
+        self.online_window = online_window
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # building_id (None for all) -> (expires_at, payload, etag)
+        self._cache: Dict[Optional[int], Tuple[float, dict, str]] = {}
+        # Bumped by invalidate(); a build only caches its result if it is unchanged
+        self._generation = 0
+
+    def get(self, building_id: Optional[int] = None) -> Tuple[dict, str]:
+        """Return ``(payload, etag)`` for one building or, with None, for all of them."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(building_id)
+            if cached is not None and cached[0] > now:
+                return cached[1], cached[2]
+            generation = self._generation
+        payload = self._build(building_id)
+        etag = hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        with self._lock:
+            if self._generation == generation:
+                self._cache[building_id] = (now + self.ttl, payload, etag)
+        return payload, etag
+
+    def invalidate(self):
+        """Drop cached summaries after buildings, rooms or devices were written."""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _build(self, building_id: Optional[int]) -> dict:
+        Building, Room, Device = self.Building, self.Room, self.Device
+        online_since = datetime.utcnow() - timedelta(seconds=self.online_window)
+        stmt = (
+            select(
+                Building.id, Building.name, Building.description,
+                Room.id, Room.name, Room.live_camera,
+                func.count(Device.id),
+                func.coalesce(func.sum(case((Device.is_enabled.is_(True), 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Device.last_seen >= online_since, 1), else_=0)), 0),
+            )
+            .select_from(Building)
+            .outerjoin(Room, Room.building_id == Building.id)
+            .outerjoin(Device, Device.room_id == Room.id)
+            .group_by(Building.id, Room.id)
+            .order_by(Building.id, Room.id)
+        )
+        if building_id is not None:
+            stmt = stmt.where(Building.id == building_id)
+
+        buildings: Dict[int, dict] = {}
+        for (b_id, b_name, b_description, room_id, room_name, live_camera,
+             devices, enabled, online) in self.db.session.execute(stmt):
+            building = buildings.get(b_id)
+            if building is None:
+                building = buildings[b_id] = {
+                    'id': b_id,
+                    'name': b_name,
+                    'description': b_description,
+                    'rooms_count': 0,
+                    'devices_count': 0,
+                    'enabled_count': 0,
+                    'online_count': 0,
+                    'person_count': None,
+                    'rooms': [],
+                }
+            if room_id is None:
+                continue  # Building without rooms
+            person_count = self.occupancy.get_person_count(str(room_id))
+            building['rooms'].append({
+                'id': room_id,
+                'name': room_name,
+                'live_camera': live_camera,
+                'building_id': b_id,
+                'devices_count': devices,
+                'enabled_count': int(enabled),
+                'online_count': int(online),
+                'person_count': person_count,
+            })
+            building['rooms_count'] += 1
+            building['devices_count'] += devices
+            building['enabled_count'] += int(enabled)
+            building['online_count'] += int(online)
+            if person_count is not None:
+                building['person_count'] = (building['person_count'] or 0) + person_count
+        return {'online_window': self.online_window, 'buildings': list(buildings.values())}
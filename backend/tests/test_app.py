@@ -0,0 +1,66 @@
+import importlib
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def backend(tmp_path_factory):
+    # app.py configures itself from the environment at import time
+    tmp = tmp_path_factory.mktemp('app')
+    os.environ.update(DATABASE_URL=f"sqlite:///{tmp / 'db.sqlite'}", TIMESERIES_DIR=str(tmp / 'timeseries'),
+                      MODEL_WARMUP='lazy', CLUSTER_MODE='off')
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def room(backend):
+    with backend.app.app_context():
+        building = backend.Building(name='HQ', description='')
+        backend.db.session.add(building)
+        backend.db.session.flush()
+        room = backend.Room(name='Lab', building_id=building.id)
+        backend.db.session.add(room)
+        backend.db.session.commit()
+        return room.id
+
+
+def test_automated_cameras_are_reopened_only_by_writes_that_change_them(backend, client, room, monkeypatch):
+    calls = []
+    monkeypatch.setattr(backend, '_open_automated_cameras', lambda: calls.append(1))
+    # The default admin is created on first start
+    assert client.post('/api/login', json={'username': 'admin', 'password': 'admin'}).status_code == 200
+    assert calls == []
+
+    response = client.post(f'/api/rooms/{room}/devices', json={'hardware_id': 'hw-open-1', 'name': 'Fan'})
+    assert response.status_code == 201
+    device = response.get_json()['device']['id']
+    assert calls == [1]
+    client.put(f'/api/devices/{device}', json={'persons_before_enabled': 2})
+    client.put(f'/api/rooms/{room}', json={'name': 'Lab', 'live_camera': '0'})
+    client.delete(f'/api/devices/{device}')
+    assert calls == [1] * 4
+
+
+def test_wsgi_long_poll_is_held_only_briefly(backend, client, room):
+    client.post(f'/api/rooms/{room}/devices', json={'hardware_id': 'hw-poll-1', 'name': 'Lamp'})
+    version = client.get('/api/device/status?hardware_id=hw-poll-1').get_json()[0]['version']
+    started = time.monotonic()
+    response = client.get(f'/api/device/status?hardware_id=hw-poll-1&wait=25&version={version}')
+    assert response.get_json()[0]['version'] == version
+    assert backend.STATUS_LONG_POLL_WSGI_MAX - 0.1 < time.monotonic() - started < backend.STATUS_LONG_POLL_WSGI_MAX + 1
+
+
+def test_snapshots_never_open_a_camera(backend, client, room, monkeypatch):
+    opened = []
+    monkeypatch.setattr(backend.camera_service, 'add_camera', lambda *args, **kwargs: opened.append(args))
+    client.put(f'/api/rooms/{room}', json={'name': 'Lab', 'live_camera': 'rtsp://closed'})
+    response = client.get(f'/api/camera/snapshot/{room}')
+    assert response.status_code == 204 and not response.data
+    assert opened == [] and str(room) not in backend.camera_service.get_camera_ids()
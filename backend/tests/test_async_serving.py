@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from device_events import DeviceEventHub
+from streaming import FrameBroadcaster, StreamProfile
+
+PROFILE = StreamProfile(quality=50, max_fps=60.0)
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((24, 32, 3), value, np.uint8)
+
+
+def publish_later(broadcaster: FrameBroadcaster, frames, delay: float = 0.05) -> threading.Thread:
+    def run():
+        for f in frames:
+            time.sleep(delay)
+            broadcaster.publish(f)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_async_viewers_get_frames_published_by_a_thread():
+    broadcaster = FrameBroadcaster()
+
+    async def view():
+        frames = broadcaster.subscribe_async(PROFILE, timeout=1.0)
+        received = [await frames.__anext__() for _ in range(3)]
+        await frames.aclose()
+        return received
+
+    async def main():
+        publisher = publish_later(broadcaster, [frame(v) for v in (10, 120, 240)], delay=0.1)
+        results = await asyncio.gather(view(), view())
+        publisher.join()
+        return results
+
+    first, second = asyncio.run(main())
+    assert len(first) == 3 and first == second
+    assert broadcaster.subscribers == 0
+
+
+def test_async_viewer_ends_when_the_broadcaster_closes():
+    broadcaster = FrameBroadcaster()
+    broadcaster.publish(frame(0))
+
+    async def main():
+        received = []
+        threading.Timer(0.1, broadcaster.close).start()
+        async for data in broadcaster.subscribe_async(PROFILE, timeout=5.0):
+            received.append(data)
+        return received
+
+    started = time.monotonic()
+    assert asyncio.run(main())
+    assert time.monotonic() - started < 2.0
+    assert broadcaster.subscribers == 0
+
+
+def test_async_long_poll_wakes_on_change_and_times_out_otherwise():
+    hub = DeviceEventHub()
+
+    async def main():
+        tick = hub.tick(7)
+        threading.Timer(0.05, hub.publish, args=(7, 1), kwargs={'is_enabled': True}).start()
+        started = time.monotonic()
+        woken = await hub.wait_for_change_async(7, tick, timeout=5.0)
+        assert woken == tick + 1 and time.monotonic() - started < 2.0
+        assert hub.get_stats()['long_polls'] == 0
+
+        started = time.monotonic()
+        assert await hub.wait_for_change_async(7, woken, timeout=0.1) == woken
+        assert time.monotonic() - started >= 0.1
+
+    asyncio.run(main())
+
+
+def test_async_and_threaded_long_polls_on_one_device():
+    hub = DeviceEventHub()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(hub.wait_for_change(3, 0, timeout=5.0)))
+    thread.start()
+
+    async def main():
+        threading.Timer(0.1, hub.publish, args=(3, None)).start()
+        return await hub.wait_for_change_async(3, 0, timeout=5.0)
+
+    assert asyncio.run(main()) == 1
+    thread.join(timeout=2.0)
+    assert results == [1]
+    assert hub.get_stats()['long_polls'] == 0
+
+
+def test_async_event_stream_filters_by_room():
+    hub = DeviceEventHub()
+
+    async def main():
+        events = hub.subscribe_async(room_id=2)
+        assert await events.__anext__() == 'retry: 3000\n\n'
+        pending = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0.01)
+        threading.Thread(target=lambda: (hub.publish(1, 1, is_enabled=True),
+                                         hub.publish(2, 2, is_enabled=False))).start()
+        chunk = await asyncio.wait_for(pending, 2.0)
+        await events.aclose()
+        return chunk
+
+    chunk = asyncio.run(main())
+    assert '"room_id": 2' in chunk and '"id": 2' in chunk
+    assert hub.get_stats()['subscribers'] == 0
@@ -0,0 +1,148 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from automation import AutomationEngine, DeviceRule
+
+
+class NoCameras:
+    def add_count_listener(self, listener):
+        pass
+
+    def remove_count_listener(self, listener):
+        pass
+
+    def get_person_count(self, camera_id):
+        return None
+
+
+def device(device_id=1, room_id=1, is_enabled=False, threshold=2, enable_delay=5, disable_delay=10, zone=None):
+    return SimpleNamespace(id=device_id, room_id=room_id, is_enabled=is_enabled,
+                           persons_before_enabled=threshold, delay_before_enabled=enable_delay,
+                           delay_before_disabled=disable_delay, zone=zone)
+
+
+@pytest.fixture
+def engine():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+
+    class Device(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        is_enabled = db.Column(db.Boolean, nullable=False, default=False)
+        room_id = db.Column(db.Integer)
+        persons_before_enabled = db.Column(db.Integer)
+        delay_before_enabled = db.Column(db.Integer)
+        delay_before_disabled = db.Column(db.Integer)
+        is_manual = db.Column(db.Boolean, nullable=False, default=False)
+        zone = db.Column(db.String(64))
+
+    with app.app_context():
+        db.create_all()
+    engine = AutomationEngine(app, db, Device, NoCameras())
+    engine.Model = Device
+    yield engine
+
+
+def count(engine, room_id, persons, at):
+    engine.counts[str(room_id)] = persons
+    for device_id in engine.rooms.get(str(room_id), ()):
+        engine._evaluate(engine.rules[device_id], at)
+
+
+def test_device_turns_on_once_count_held_for_the_delay(engine):
+    engine._index(device())
+    now = time.time()
+    count(engine, 1, 3, now - 6)  # Crossed 6s ago, enable delay is 5s
+    assert engine._fire_timers() == {1: True}
+    assert engine.rules[1].is_enabled
+
+
+def test_timer_not_due_yet(engine):
+    engine._index(device())
+    count(engine, 1, 3, time.time())
+    assert engine._fire_timers() == {}
+    assert len(engine._timers) == 1
+
+
+def test_crossing_back_cancels_pending_timer(engine):
+    engine._index(device())
+    now = time.time()
+    count(engine, 1, 3, now - 6)
+    count(engine, 1, 0, now - 1)  # Dropped below before the timer was processed
+    assert engine._fire_timers() == {}
+    assert not engine.rules[1].is_enabled
+
+
+def test_staying_above_keeps_the_original_deadline(engine):
+    engine._index(device())
+    now = time.time()
+    count(engine, 1, 3, now - 6)
+    count(engine, 1, 4, now - 1)  # Same side: must not restart the delay
+    assert engine._fire_timers() == {1: True}
+
+
+def test_disable_uses_its_own_delay(engine):
+    engine._index(device(is_enabled=True))
+    now = time.time()
+    count(engine, 1, 0, now - 6)  # Disable delay is 10s
+    assert engine._fire_timers() == {}
+    engine._timers.clear()
+    engine.rules[1].above = None
+    count(engine, 1, 0, now - 11)
+    assert engine._fire_timers() == {1: False}
+
+
+def test_device_bound_to_a_zone_follows_the_zone(engine):
+    engine._index(device(1, room_id=1))
+    engine._index(device(2, room_id=2, zone='1:desk'))
+    assert engine.rooms == {'1': {1}, '1:desk': {2}}
+    now = time.time()
+    count(engine, 1, 3, now - 6)
+    assert engine._fire_timers() == {1: True}
+    count(engine, '1:desk', 3, now - 6)
+    assert engine._fire_timers() == {2: True}
+    engine._unindex(2)
+    assert '1:desk' not in engine.rooms
+
+
+def test_devices_without_threshold_are_not_automated(engine):
+    engine._index(device(threshold=None))
+    count(engine, 1, 10, time.time() - 100)
+    assert engine._fire_timers() == {}
+
+
+def test_commit_skips_devices_switched_to_manual(engine):
+    Device = engine.Model
+    with engine.app.app_context():
+        engine.db.session.add_all([Device(id=1, room_id=1), Device(id=2, room_id=1, is_manual=True)])
+        engine.db.session.commit()
+        engine._index(device(1))
+        engine._index(device(2))
+        applied = []
+        engine.add_change_listener(applied.extend)
+        engine._commit({1: True, 2: True})
+        states = dict(engine.db.session.execute(engine.db.select(Device.id, Device.is_enabled)).all())
+    assert applied == [(1, True, 1)]
+    assert states == {1: True, 2: False}
+
+
+def test_devices_without_a_room(engine):
+    Device = engine.Model
+    with engine.app.app_context():
+        automated = dict(persons_before_enabled=2, delay_before_enabled=5)
+        engine.db.session.add_all([Device(id=1, zone='2:desk', **automated), Device(id=2, **automated)])
+        engine.db.session.commit()
+        engine._index_all(Device.query.all())
+        # Bound to a zone of another room's camera, or to nothing at all
+        assert engine.rooms == {'2:desk': {1}} and set(engine.rules) == {1, 2}
+        applied = []
+        engine.add_change_listener(applied.extend)
+        count(engine, '2:desk', 3, time.time() - 6)
+        engine._commit(engine._fire_timers())
+        assert engine.db.session.get(Device, 1).is_enabled
+    assert applied == [(1, True, None)]
@@ -0,0 +1,43 @@
+import socket
+import subprocess
+import sys
+from multiprocessing.connection import Connection
+
+import pytest
+
+from backends import _Worker
+
+
+def worker(code: str):
+    """A ``_Worker`` around a stand-in process, and the worker's end of its pipe."""
+    handle = _Worker.__new__(_Worker)
+    parent_sock, child_sock = socket.socketpair()
+    handle.model_path, handle.index, handle.shm, handle.names = 'model.pt', 0, None, None
+    handle.process = subprocess.Popen([sys.executable, '-c', code])
+    handle.conn = Connection(parent_sock.detach())
+    return handle, Connection(child_sock.detach())
+
+
+def test_a_worker_that_cannot_load_its_model_is_not_ready():
+    handle, child = worker('import time; time.sleep(0.2)')
+    child.send(('error', 'ImportError: No module named ultralytics'))
+    with pytest.raises(RuntimeError, match='ultralytics'):
+        handle.wait_ready()
+    assert handle.process.returncode is not None
+    child.close()
+
+
+def test_a_worker_that_dies_before_it_is_ready_is_not_ready():
+    handle, child = worker('raise SystemExit(3)')
+    child.close()
+    with pytest.raises(RuntimeError, match='code 3'):
+        handle.wait_ready()
+
+
+def test_close_reaps_a_worker_that_ignores_the_request_and_sigterm():
+    code = 'import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)'
+    handle, child = worker(code)
+    handle.CLOSE_TIMEOUT = handle.TERMINATE_TIMEOUT = 0.3
+    handle.close()
+    assert handle.process.returncode is not None
+    child.close()
@@ -0,0 +1,206 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import camera
+from camera import CameraStream
+from connection import CONNECTING, FAILED, LIVE, ConnectionPolicy
+from decode import CameraSource
+from inference import Detections
+from streaming import StreamProfile
+
+FAST = ConnectionPolicy(backoff_initial=0.01, backoff_max=0.02, stall_timeout=0.2, fail_after=3, idle_grace=0.1)
+
+
+class FakeCapture:
+    def __init__(self, opened=True, frames=1000, gate=None):
+        self.opened = opened
+        self.frames = frames
+        self.gate = gate
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, out=None):
+        time.sleep(0.005)
+        if self.gate is not None:
+            self.gate.wait()
+        if self.frames <= 0:
+            return False, None
+        self.frames -= 1
+        frame = np.zeros((48, 64, 3), np.uint8)
+        if out is not None and out.shape == frame.shape:
+            out[...] = frame
+            return True, out
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def captures(monkeypatch):
+    """(captures opened so far, [factory]); tests swap the factory to change what opens."""
+    opened = []
+    factory = [lambda source: FakeCapture()]
+
+    def open_capture(source, options=None):
+        cap = factory[0](source)
+        opened.append(cap)
+        return cap
+
+    monkeypatch.setattr(camera, 'open_capture', open_capture)
+    return opened, factory
+
+
+def test_stream_connects_in_the_background_and_goes_live(captures):
+    opened, factory = captures
+    gate = threading.Event()
+    factory[0] = lambda source: FakeCapture(gate=gate)
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    stream.start()
+    try:
+        assert stream.health().state == CONNECTING
+        gate.set()
+        assert wait_for(lambda: stream.health().state == LIVE)
+    finally:
+        stream.stop()
+
+
+def test_failed_opens_back_off_until_failed(captures):
+    opened, factory = captures
+    factory[0] = lambda source: FakeCapture(opened=False)
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    stream.start()
+    try:
+        assert wait_for(lambda: stream.health().state == FAILED)
+        assert stream.health().attempts >= FAST.fail_after
+        assert 'rtsp://cam' in stream.health().last_error
+    finally:
+        stream.stop()
+
+
+def test_read_failure_reopens_the_stored_source(captures):
+    opened, factory = captures
+    factory[0] = lambda source: FakeCapture(frames=3)
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    stream.start()
+    try:
+        assert wait_for(lambda: len(opened) >= 3)
+    finally:
+        stream.stop()
+
+
+def test_stalled_when_frames_stop(captures):
+    opened, factory = captures
+    gate = threading.Event()
+    gate.set()
+    factory[0] = lambda source: FakeCapture(gate=gate)
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    stream.start()
+    try:
+        assert wait_for(lambda: stream.health().state == LIVE)
+        gate.clear()
+        assert wait_for(lambda: stream.health().state == 'stalled')
+    finally:
+        gate.set()
+        stream.stop()
+
+
+def test_idle_only_without_consumers_after_the_grace_period():
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    now = time.monotonic()
+    stream.consumers.add('automation')
+    assert not stream.is_idle(now + 1)
+    stream.consumers.clear()
+    stream.last_used = now
+    assert not stream.is_idle(now + 0.05)
+    assert stream.is_idle(now + 1)
+
+
+def test_frames_are_dropped_while_every_ring_slot_is_pinned(captures):
+    stream = CameraStream('ring-full', CameraSource('rtsp://cam'), policy=FAST, ring_size=3)
+    stream.start()
+    try:
+        assert wait_for(lambda: stream.ring is not None and stream.frame_seq > 0)
+        ring = stream.ring
+        with stream.lock:
+            for index in range(ring.capacity):
+                ring.pin(index)
+        dropped = camera.RING_FULL_DROPS.value(camera='ring-full')
+        assert wait_for(lambda: camera.RING_FULL_DROPS.value(camera='ring-full') > dropped + 2)
+        assert stream.thread.is_alive() and stream.health().state == LIVE
+        with stream.lock:
+            for index in range(ring.capacity):
+                ring.unpin(index)
+            seq = stream.frame_seq
+        assert wait_for(lambda: stream.frame_seq > seq)
+    finally:
+        stream.stop()
+
+
+def test_read_failure_leaves_slots_being_encoded_to_the_broadcaster():
+    rendering, finish = threading.Event(), threading.Event()
+
+    def slow_render(frame, detections):
+        rendering.set()
+        finish.wait(2.0)
+        return frame
+
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST, renderer=slow_render)
+    ring = stream._allocate_ring((48, 64, 3))
+    index = ring.acquire()
+    with stream.lock:
+        stream.frame_ring_seq = ring.commit(index, time.time())
+        stream.frame_index, stream.frame, stream.frame_seq = index, ring.view(index), 1
+    seq, frame = stream.take_pending()
+    stream.publish(frame, Detections.empty())
+    encoder = threading.Thread(target=stream.broadcast.next, args=(StreamProfile(), 0, 2.0))
+    encoder.start()
+    try:
+        assert rendering.wait(2.0)
+        stream.cap = FakeCapture()
+        stream._on_read_failure()
+        # The output's pin is gone, the encoder's is not
+        assert stream.output is None and ring._pins[index] == 1
+        finish.set()
+        encoder.join(2.0)
+        assert ring._pins[index] == 1  # Still the broadcaster's newest frame
+        stream.broadcast.publish(np.zeros((48, 64, 3), np.uint8))
+        assert ring._pins[index] == 0
+    finally:
+        finish.set()
+        stream.stop()
+
+
+def test_snapshot_frames_are_grabbed_frames_without_inference():
+    stream = CameraStream('1', CameraSource('rtsp://cam'), policy=FAST)
+    service = camera.CameraService.__new__(camera.CameraService)
+    service.lock, service.cameras = threading.Lock(), {'1': stream}
+    assert service.get_raw_frame('1') is None
+    ring = stream._allocate_ring((48, 64, 3))
+    index = ring.acquire()
+    ring.view(index)[...] = 7
+    with stream.lock:
+        stream.frame_ring_seq = ring.commit(index, time.time())
+        stream.frame_index, stream.frame, stream.frame_seq = index, ring.view(index), 1
+    try:
+        # Nothing has been inferred (no model yet), the preview still has a picture
+        assert stream.output is None
+        frame = service.get_raw_frame('1')
+        assert frame is not None and frame.mean() == 7 and not np.shares_memory(frame, ring.frames)
+        assert ring._pins[index] == 0
+        assert service.get_raw_frame('2') is None
+    finally:
+        ring.close()
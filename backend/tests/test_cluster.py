@@ -0,0 +1,237 @@
+import time
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from cluster import Cluster, ClusterState, FileLeaseStore, LocalLeaseStore, fcntl
+from device_events import status_version
+
+
+class FakeCameraService:
+    def __init__(self, failing=()):
+        self.cameras = {}
+        self.failing = set(failing)
+
+    def add_camera(self, camera_id, source, consumer=None):
+        if camera_id in self.failing:
+            return False
+        self.cameras[camera_id] = source
+        return True
+
+    def remove_camera(self, camera_id):
+        self.cameras.pop(camera_id, None)
+
+
+def make_node(store, name, wanted, **kwargs):
+    cameras = FakeCameraService(kwargs.pop('failing', ()))
+    node = Cluster(store, cameras, lambda: dict(wanted), node_id=name, ttl=kwargs.pop('ttl', 30.0), **kwargs)
+    return node, cameras
+
+
+def test_local_lease_is_exclusive_until_released_or_expired():
+    store = LocalLeaseStore()
+    assert store.acquire('scheduler', 'a', 30)
+    assert store.acquire('scheduler', 'a', 30)  # Renewal
+    assert not store.acquire('scheduler', 'b', 30)
+    assert store.holders() == {'scheduler': 'a'}
+    store.release('scheduler', 'b')  # Not the holder: no effect
+    assert not store.acquire('scheduler', 'b', 30)
+    store.release('scheduler', 'a')
+    assert store.acquire('scheduler', 'b', 0.01)
+    time.sleep(0.02)
+    assert store.holders() == {}
+    assert store.acquire('scheduler', 'a', 30)
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock is not available")
+def test_file_leases_conflict_between_stores(tmp_path):
+    first, second = FileLeaseStore(str(tmp_path)), FileLeaseStore(str(tmp_path))
+    assert first.acquire('camera-1', 'a', 30)
+    assert not second.acquire('camera-1', 'b', 30)
+    assert second.holders('camera-') == {'camera-1': 'a'}
+    first.release('camera-1', 'a')
+    assert second.holders('camera-') == {}
+    assert second.acquire('camera-1', 'b', 30)
+
+
+def test_single_leader_and_failover():
+    store = LocalLeaseStore()
+    a, _ = make_node(store, 'a', {})
+    b, _ = make_node(store, 'b', {})
+    events = []
+    a.on_leadership(lambda: events.append('a+'), lambda: events.append('a-'))
+    b.on_leadership(lambda: events.append('b+'), lambda: events.append('b-'))
+    a.tick()
+    b.tick()
+    assert (a.is_leader, b.is_leader) == (True, False)
+    a.stop()
+    b.tick()
+    assert b.is_leader
+    assert events == ['a+', 'a-', 'b+']
+
+
+def test_cameras_are_opened_once_and_shared_fairly():
+    store = LocalLeaseStore()
+    wanted = {str(i): f'rtsp://cam{i}' for i in range(4)}
+    a, cameras_a = make_node(store, 'a', wanted)
+    a.tick()
+    assert sorted(cameras_a.cameras) == ['0', '1', '2', '3']
+
+    # A second node joins: the first gives back what exceeds its share
+    b, cameras_b = make_node(store, 'b', wanted)
+    b.tick()
+    a.tick()
+    b.tick()
+    assert len(cameras_a.cameras) == 2 and len(cameras_b.cameras) == 2
+    assert not set(cameras_a.cameras) & set(cameras_b.cameras)
+
+
+def test_failed_camera_lease_is_released_for_other_nodes():
+    store = LocalLeaseStore()
+    a, _ = make_node(store, 'a', {'1': 'rtsp://cam'}, failing={'1'})
+    a.tick()
+    assert not a.cameras
+    assert store.holders('camera-') == {}
+
+
+def test_changed_source_reopens_camera():
+    store = LocalLeaseStore()
+    wanted = {'1': 'rtsp://old'}
+    a, cameras = make_node(store, 'a', wanted)
+    a.wanted_cameras = lambda: wanted
+    a.tick()
+    wanted['1'] = 'rtsp://new'
+    a.tick()
+    assert cameras.cameras == {'1': 'rtsp://new'}
+
+
+def test_status_version_depends_only_on_content():
+    payload = {'id': 1, 'is_enabled': True, 'room_id': 2}
+    assert status_version(payload) == status_version(dict(reversed(list(payload.items()))))
+    assert status_version(payload) != status_version(dict(payload, is_enabled=False))
+    assert 0 <= status_version(payload) < 2 ** 31
+
+
+class CountingCameras:
+    """The parts of ``CameraService`` ``ClusterState`` reads: cameras run here and their counts."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add_count_listener(self, listener):
+        pass
+
+    def remove_count_listener(self, listener):
+        pass
+
+    def get_camera_ids(self):
+        return list(self.counts)
+
+    def get_zone_counts(self, camera_id):
+        return {}
+
+    def get_camera_state(self, camera_id):
+        return (self.counts[camera_id], time.time()) if camera_id in self.counts else None
+
+    def get_frame_ring(self, camera_id):
+        return None
+
+    def get_health(self, camera_id):
+        return None
+
+
+@pytest.fixture
+def shared_db():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+
+    class CameraState(db.Model):
+        camera_id = db.Column(db.String(64), primary_key=True)
+        owner = db.Column(db.String(128), nullable=False)
+        host = db.Column(db.String(255), nullable=False)
+        ring = db.Column(db.String(64))
+        person_count = db.Column(db.Integer)
+        last_update = db.Column(db.Float)
+        updated_at = db.Column(db.Float, nullable=False)
+        state = db.Column(db.String(16))
+
+    class CameraDemand(db.Model):
+        camera_id = db.Column(db.String(64), primary_key=True)
+        until = db.Column(db.Float, nullable=False)
+
+    class DeviceChange(db.Model):
+        id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+        origin = db.Column(db.String(128), nullable=False)
+        payload = db.Column(db.Text, nullable=False)
+        created_at = db.Column(db.Float, nullable=False)
+
+    with app.app_context():
+        db.create_all()
+    return app, db, (CameraState, DeviceChange, CameraDemand)
+
+
+def make_state(shared_db, name, live=None):
+    app, db, models = shared_db
+    cameras = CountingCameras()
+    state = ClusterState(app, db, *models, cameras, name, live_nodes=lambda: live)
+    counts = []
+    state.add_count_listener(lambda camera_id, person_count: counts.append((camera_id, person_count)))
+    return state, cameras, counts
+
+
+def test_counts_of_dropped_cameras_and_dead_owners_go_to_zero(shared_db):
+    live = {'a', 'b'}
+    a, cameras_a, _ = make_state(shared_db, 'a', live)
+    b, _, counts = make_state(shared_db, 'b', live)
+    cameras_a.counts.update({'1': 3, '2': 2})
+    a.sync()
+    b.sync()
+    assert sorted(counts) == [('1', 3), ('2', 2)]
+
+    # Camera 1 is closed: its row goes, and with it its people
+    del cameras_a.counts['1']
+    a.sync()
+    b.sync()
+    assert counts[2:] == [('1', 0)]
+    assert b.get_person_count('1') is None
+
+    # Worker a dies: its lease expires but its row for camera 2 stays behind
+    live.discard('a')
+    b.sync()
+    assert counts[3:] == [('2', 0)]
+    assert b.remote_camera('2') is None
+    b.sync()
+    assert len(counts) == 4
+
+
+def test_changes_are_delivered_once_by_id_whatever_the_writers_clock(shared_db):
+    app, db, (_, DeviceChange, _) = shared_db
+    b, _, _ = make_state(shared_db, 'b')
+    delivered = []
+    b.on_remote_event = lambda event: delivered.append(event['id'])
+
+    def write(change_id, origin='a', skew=0.0):
+        with app.app_context():
+            db.session.add(DeviceChange(id=change_id, origin=origin, payload=f'{{"id": {change_id}}}',
+                                        created_at=time.time() + skew))
+            db.session.commit()
+
+    write(1, skew=-3600)  # A writer whose clock is an hour behind
+    write(2, origin='b')
+    write(4, skew=3600)  # Id 3 is committed later by a slower writer
+    b.sync()
+    assert delivered == [1, 4] and b._cursor == 2
+    b.sync()
+    assert delivered == [1, 4]
+    write(3)
+    b.sync()
+    assert delivered == [1, 4, 3] and b._cursor == 4
+
+    # An id that never shows up (rolled back) holds the cursor for LOG_LAG only
+    b.LOG_LAG = 0.0
+    write(6)
+    b.sync()
+    b.sync()
+    assert delivered == [1, 4, 3, 6] and b._cursor == 6
@@ -0,0 +1,13 @@
+from connection import ConnectionPolicy
+
+
+def test_backoff_doubles_up_to_the_cap():
+    policy = ConnectionPolicy(backoff_initial=0.5, backoff_max=8.0)
+    for attempt, base in [(1, 0.5), (2, 1.0), (3, 2.0), (5, 8.0), (50, 8.0)]:
+        delay = policy.delay(attempt)
+        assert 0.8 * base <= delay <= 1.2 * base
+
+
+def test_backoff_is_jittered():
+    policy = ConnectionPolicy()
+    assert len({policy.delay(3) for _ in range(20)}) > 1
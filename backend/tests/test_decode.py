@@ -0,0 +1,55 @@
+import cv2
+import numpy as np
+import pytest
+
+from decode import CameraSource, DecodeOptions, OpenCVCapture
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 240))
+    for i in range(20):
+        frame = np.full((240, 320, 3), i * 10, np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_overrides_are_validated():
+    options = DecodeOptions().merged({'reader': 'FFMPEG', 'width': '640', 'keyframes_only': 'true'})
+    assert options == DecodeOptions(reader='ffmpeg', width=640, keyframes_only=True)
+    with pytest.raises(ValueError):
+        DecodeOptions().merged({'fps': 5})
+    with pytest.raises(ValueError):
+        DecodeOptions().merged({'reader': 'gstreamer'})
+
+
+def test_size_keeps_aspect_and_never_upscales():
+    assert DecodeOptions(width=640).size_for(1920, 1080) == (640, 360)
+    assert DecodeOptions(width=640, height=240).size_for(1920, 1080) == (426, 240)
+    assert DecodeOptions(width=3840).size_for(1920, 1080) == (1920, 1080)
+
+
+def test_view_url_only_for_a_separate_sub_stream():
+    assert CameraSource('rtsp://cam/main').view_url is None
+    assert CameraSource('rtsp://cam/main', 'rtsp://cam/main').view_url is None
+    assert CameraSource('rtsp://cam/main', 'rtsp://cam/sub').view_url == 'rtsp://cam/main'
+
+
+def test_opencv_reader_downscales_into_the_callers_buffer(clip):
+    cap = OpenCVCapture(clip, DecodeOptions(width=160))
+    out = np.empty((120, 160, 3), np.uint8)
+    ret, frame = cap.read(out)
+    cap.release()
+    assert ret and frame is out
+
+
+def test_opencv_reader_drops_frames_above_the_rate_cap(clip):
+    cap = OpenCVCapture(clip, DecodeOptions(max_fps=1))
+    frames = 0
+    while cap.read()[0]:
+        frames += 1
+    cap.release()
+    # The file decodes much faster than 1 fps: all but the first frame are grabbed and dropped
+    assert frames == 1 and cap.dropped == 19
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from device_bulk import upsert_devices
+
+DESK = json.dumps([{'name': 'desk', 'polygon': [[0, 0], [1, 0], [1, 1]]}])
+
+
+@pytest.fixture
+def db():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db = SQLAlchemy(app)
+
+    class Room(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        camera_zones = db.Column(db.Text)
+
+    class Device(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String, nullable=False)
+        hardware_id = db.Column(db.String, unique=True, nullable=False)
+        room_id = db.Column(db.Integer)
+        zone = db.Column(db.String(64))
+        is_enabled = db.Column(db.Boolean, nullable=False, default=False)
+        is_manual = db.Column(db.Boolean, nullable=False, default=False)
+        persons_before_enabled = db.Column(db.Integer)
+        delay_before_enabled = db.Column(db.Integer)
+        persons_before_disabled = db.Column(db.Integer)
+        delay_before_disabled = db.Column(db.Integer)
+        last_seen = db.Column(db.DateTime)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Room(id=1, camera_zones=DESK), Room(id=2)])
+        db.session.add(Device(name='Lamp', hardware_id='A1', room_id=1, persons_before_enabled=2))
+        db.session.commit()
+        db.Room, db.Device = Room, Device
+        yield db
+
+
+def upsert(db, items, default_room_id=None):
+    result = upsert_devices(db, db.Device, db.Room, items, default_room_id=default_room_id)
+    db.session.commit()
+    return result
+
+
+def test_default_room_applies_to_new_devices_only(db):
+    result = upsert(db, [{'hardware_id': 'A1', 'name': 'Lamp'}, {'hardware_id': 'B1', 'name': 'Fan'}],
+                    default_room_id=2)
+    assert [entry['status'] for entry in result.report] == ['unchanged', 'created']
+    rooms = dict(db.session.execute(db.select(db.Device.hardware_id, db.Device.room_id)).all())
+    assert rooms == {'A1': 1, 'B1': 2}
+    assert result.updated_ids == [] and result.room_ids == {2}
+
+
+def test_only_changed_devices_are_updated(db):
+    result = upsert(db, [{'hardware_id': 'A1', 'persons_before_enabled': 2, 'is_manual': False}])
+    assert result.report[0]['status'] == 'unchanged' and result.updated_ids == []
+    result = upsert(db, [{'hardware_id': 'A1', 'persons_before_enabled': 3, 'room_id': 2}])
+    assert result.report[0]['status'] == 'updated' and result.room_ids == {1, 2}
+    device = db.session.execute(db.select(db.Device)).scalar_one()
+    assert (device.persons_before_enabled, device.room_id) == (3, 2)
+
+
+def test_zones_are_validated_like_single_devices(db):
+    result = upsert(db, [
+        {'hardware_id': 'A1', 'zone': 'desk'},
+        {'hardware_id': 'B1', 'name': 'Fan', 'room_id': 2, 'zone': '1:desk'},
+        {'hardware_id': 'C1', 'name': 'Heater', 'room_id': 2, 'zone': 'desk'},
+        {'hardware_id': 'D1', 'name': 'TV', 'room_id': 1, 'zone': '1:door'},
+    ])
+    assert [entry['status'] for entry in result.report] == ['updated', 'created', 'error', 'error']
+    zones = dict(db.session.execute(db.select(db.Device.hardware_id, db.Device.zone)).all())
+    assert zones == {'A1': '1:desk', 'B1': '1:desk'}
+    result = upsert(db, [{'hardware_id': 'A1', 'zone': '1:desk'}, {'hardware_id': 'B1', 'zone': None}])
+    assert [entry['status'] for entry in result.report] == ['unchanged', 'updated']
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from loadtest import camera_fps, compare  # noqa: E402
+
+BASELINE = {
+    'endpoints': {'GET /api/device/status': {'requests': 1000, 'rps': 200.0, 'p50_ms': 2.0, 'p99_ms': 10.0}},
+    'inference': {'camera_fps': {'1': 10.0}},
+    'e2e': {'trials': 3, 'on_p50_s': 3.0},
+}
+
+
+def result(p50=2.0, p99=10.0, rps=200.0, fps=10.0, on=3.0):
+    return {
+        'endpoints': {'GET /api/device/status': {'requests': 10, 'rps': rps, 'p50_ms': p50, 'p99_ms': p99}},
+        'inference': {'camera_fps': {'1': fps}},
+        'e2e': {'trials': 3, 'on_p50_s': on},
+    }
+
+
+def test_no_regressions_within_tolerance():
+    assert compare(result(p99=11.9, rps=170.0, on=3.5), BASELINE, tolerance=0.2) == []
+    # Small absolute changes of fast endpoints are noise, whatever the ratio
+    assert compare(result(p50=2.9), BASELINE, tolerance=0.2) == []
+
+
+def test_regressions_are_reported_per_metric():
+    regressions = compare(result(p99=13.0, rps=150.0, fps=5.0, on=5.0), BASELINE, tolerance=0.2)
+    assert regressions == [
+        'e2e.on_p50_s: 3.0 -> 5.0',
+        'endpoints.GET /api/device/status.p99_ms: 10.0 -> 13.0',
+        'endpoints.GET /api/device/status.rps: 200.0 -> 150.0',
+        'inference.camera_fps.1: 10.0 -> 5.0',
+    ]
+
+
+def test_camera_fps_from_cumulative_counts():
+    before = {'inferred_frames': {'1': 100, '2': 0}}
+    after = {'inferred_frames': {'1': 300, '2': 50, '3': 20}}
+    assert camera_fps(before, after, 10.0) == {'1': 20.0, '2': 5.0, '3': 2.0}
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from metrics import Registry, SamplingProfiler, TimedLock
+
+
+def test_histogram_and_counter_render_in_prometheus_format():
+    registry = Registry()
+    reads = registry.histogram('frame_read_seconds', 'Frame reads', ('camera',), buckets=(0.01, 0.1))
+    reads.observe(0.005, camera='1')
+    reads.observe(0.05, camera='1')
+    reads.observe(1.0, camera='1')
+    registry.counter('requests_total', 'Requests', ('endpoint',)).inc(endpoint='/api/x"y')
+    text = registry.render()
+    assert '# TYPE frame_read_seconds histogram' in text
+    assert 'frame_read_seconds_bucket{camera="1",le="0.01"} 1' in text
+    assert 'frame_read_seconds_bucket{camera="1",le="0.1"} 2' in text
+    assert 'frame_read_seconds_bucket{camera="1",le="+Inf"} 3' in text
+    assert 'frame_read_seconds_count{camera="1"} 3' in text
+    assert 'requests_total{endpoint="/api/x\\"y"} 1.0' in text
+    registry.remove(camera='1')
+    assert 'camera="1"' not in registry.render()
+
+
+def test_metric_names_keep_their_type():
+    registry = Registry()
+    registry.counter('things_total', 'Things')
+    with pytest.raises(ValueError):
+        registry.histogram('things_total', 'Things')
+
+
+def test_timed_lock_records_waits():
+    waits = Registry().histogram('lock_wait_seconds', 'Waits', buckets=(0.001,))
+    lock = TimedLock(waits)
+    with lock:
+        pass
+    held = threading.Event()
+
+    def holder():
+        with lock:
+            held.set()
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+    with lock:
+        pass
+    thread.join()
+    assert waits.count() == 3
+    assert 'lock_wait_seconds_bucket{le="0.001"} 2' in '\n'.join(waits.render())
+
+
+def test_profiler_samples_the_named_thread():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_loop, name='profiled')
+    thread.start()
+    profiler = SamplingProfiler()
+    try:
+        profiler.start('profiled', interval=0.001, seconds=5)
+        with pytest.raises(ValueError):
+            profiler.start('profiled')
+        time.sleep(0.2)
+        profiler.stop()
+    finally:
+        stop.set()
+        thread.join()
+    report = profiler.report()
+    assert not report['running'] and report['samples'] > 0
+    assert any(entry['function'].endswith(':busy_loop') for entry in report['total'])
+    with pytest.raises(ValueError):
+        profiler.start('no-such-thread')
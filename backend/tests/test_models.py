@@ -0,0 +1,27 @@
+import pytest
+
+from models import ModelSpec
+
+
+def test_parse_model_specs():
+    assert ModelSpec.parse('yolo11n:openvino:int8', imgsz=320) == ModelSpec('yolo11n', 'openvino', True, 320)
+    assert ModelSpec.parse('yolo11s') == ModelSpec('yolo11s', 'torch', False, 640)
+    with pytest.raises(ValueError):
+        ModelSpec.parse('yolo11n:onnx:int8')
+    with pytest.raises(ValueError):
+        ModelSpec.parse('yolo11n:tensorrt')
+
+
+def test_torch_runs_the_weights():
+    assert ModelSpec('yolo11n').prepare() == 'yolo11n.pt'
+    assert ModelSpec('/srv/custom.pt').prepare() == '/srv/custom.pt'
+
+
+def test_exports_are_cached_per_spec(tmp_path):
+    onnx = ModelSpec('yolo11n', 'onnx', imgsz=320)
+    int8 = ModelSpec('yolo11n', 'openvino', True, 320)
+    assert onnx.artifact(str(tmp_path)) != ModelSpec('yolo11n', 'onnx', imgsz=640).artifact(str(tmp_path))
+    assert int8.artifact(str(tmp_path)) != ModelSpec('yolo11n', 'openvino', imgsz=320).artifact(str(tmp_path))
+    # An earlier export is loaded as is, without importing ultralytics
+    (tmp_path / 'yolo11n-320.onnx').write_bytes(b'')
+    assert onnx.prepare(str(tmp_path)) == str(tmp_path / 'yolo11n-320.onnx')
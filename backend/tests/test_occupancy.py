@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from occupancy import CountSmoother, OccupancyEstimator, OccupancyPolicy, PersonTracker
+
+
+def box(x, y, size=40):
+    return [x, y, x + size, y + 2 * size]
+
+
+def test_tracker_rides_out_missed_detections():
+    tracker = PersonTracker(OccupancyPolicy(min_hits=2, max_misses=2))
+    assert tracker.update([box(0, 0)]) == 0  # Not confirmed yet
+    assert tracker.update([box(10, 5)]) == 1
+    assert tracker.update([]) == 1
+    assert tracker.update([]) == 1
+    assert tracker.update([box(20, 5)]) == 1
+    for _ in range(3):
+        count = tracker.update([])
+    assert count == 0
+
+
+def test_tracker_ignores_one_off_detections_and_keeps_people_apart():
+    tracker = PersonTracker(OccupancyPolicy(min_hits=2, max_misses=1))
+    tracker.update([box(0, 0), box(300, 0)])
+    assert tracker.update([box(5, 0), box(305, 0), box(600, 0)]) == 2
+    assert tracker.update([box(10, 0), box(310, 0)]) == 2
+    assert len(tracker.hits) == 2  # The one-off third box was dropped on its first miss
+
+
+def test_smoother_needs_the_window_to_agree_before_changing():
+    smoother = CountSmoother(window=5.0, hysteresis=0.6)
+    smoother.add(0.0, 0)
+    assert not smoother.update(5.0)
+    assert smoother.confidence == 1.0
+    smoother.add(5.0, 2)
+    smoother.add(6.0, 0)  # A one second blip
+    assert not smoother.update(6.0)
+    assert not smoother.update(8.0)
+    assert smoother.stable == 0
+    smoother.add(10.0, 2)
+    assert not smoother.update(12.0)  # 2 of the last 5 s
+    assert smoother.update(13.0)      # 3 of the last 5 s
+    assert smoother.stable == 2
+    assert smoother.confidence == 0.6
+
+
+def test_policy_validation():
+    with pytest.raises(ValueError):
+        OccupancyPolicy(hysteresis=0.4).validated()
+    with pytest.raises(ValueError):
+        OccupancyPolicy(fusion='mean').validated()
+
+
+class Counts:
+    def add_count_listener(self, listener):
+        pass
+
+    def remove_count_listener(self, listener):
+        pass
+
+    def get_person_count(self, camera_id):
+        return 7 if camera_id == '9' else None
+
+
+@pytest.mark.parametrize('fusion, expected', [('max', 3), ('sum', 5)])
+def test_estimator_fuses_the_cameras_of_a_room(fusion, expected):
+    estimator = OccupancyEstimator(Counts(), OccupancyPolicy(window=0.0, fusion=fusion))
+    changes = []
+    estimator.add_count_listener(lambda room_id, count: changes.append((room_id, count)))
+    estimator.on_count('4', 0)
+    estimator.on_count('4', 3)
+    estimator.on_count('4.1', 2)
+    assert estimator.get_person_count('4') == expected
+    assert estimator.get_occupancy('4')['cameras'] == {'4': 3, '4.1': 2}
+    assert changes[-1] == ('4', expected)
+    # Rooms not heard from yet fall back to the camera's own count
+    assert estimator.get_person_count('9') == 7
+    assert estimator.get_occupancy('9') is None
+
+
+def test_a_room_never_goes_back_to_a_superseded_count():
+    estimator = OccupancyEstimator(Counts(), OccupancyPolicy(window=0.0))
+    estimator.on_count('4', 0)
+    delivering, release = threading.Event(), threading.Event()
+    changes = []
+
+    def slow_listener(room_id, count):
+        if count == 1:
+            delivering.set()
+            release.wait(2.0)
+        changes.append(count)
+
+    estimator.add_count_listener(slow_listener)
+    first = threading.Thread(target=estimator.on_count, args=('4', 1))
+    first.start()
+    assert delivering.wait(2.0)
+    # Two more changes are made while the first is still being delivered
+    later = [threading.Thread(target=estimator.on_count, args=('4', count)) for count in (2, 0)]
+    for thread in later:
+        thread.start()
+        time.sleep(0.05)
+    release.set()
+    for thread in [first] + later:
+        thread.join(2.0)
+    assert changes[0] == 1 and changes[-1] == 0
+    assert estimator.get_person_count('4') == 0
+
+
+def test_failing_listeners_are_logged(caplog):
+    estimator = OccupancyEstimator(Counts(), OccupancyPolicy(window=0.0))
+    estimator.on_count('4', 0)
+    estimator.add_count_listener(lambda room_id, count: 1 / 0)
+    with caplog.at_level(logging.ERROR, logger='occupancy'):
+        estimator.on_count('4', 2)
+    assert 'Occupancy listener failed for room 4' in caplog.text
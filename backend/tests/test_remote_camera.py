@@ -0,0 +1,23 @@
+import time
+
+import numpy as np
+
+from framering import FrameRing
+from remote_camera import RemoteFrames
+
+
+def test_raw_frames_are_read_without_starting_a_reader():
+    ring = FrameRing((24, 32, 3), capacity=3)
+    try:
+        frames = RemoteFrames(lambda camera_id: ring.name if camera_id == '1' else None)
+        assert frames.get_raw_frame('1') is None
+        index = ring.acquire()
+        ring.view(index)[...] = 9
+        ring.commit(index, time.time())
+        # Grabbed, not yet inferred
+        frame = frames.get_raw_frame('1')
+        assert frame is not None and frame.mean() == 9 and not np.shares_memory(frame, ring.frames)
+        assert frames.get_raw_frame('2') is None
+        assert frames._cameras == {}
+    finally:
+        ring.close()
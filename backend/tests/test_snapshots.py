@@ -0,0 +1,89 @@
+import threading
+
+import cv2
+import numpy as np
+
+from snapshots import SnapshotCache
+
+
+def frame(value: int, width: int = 640, height: int = 360) -> np.ndarray:
+    return np.full((height, width, 3), value, np.uint8)
+
+
+class Grabs:
+    def __init__(self, value: int = 100):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return None if self.value is None else frame(self.value)
+
+
+def test_preview_is_scaled_down_and_made_once_per_refresh():
+    cache = SnapshotCache(width=320, refresh=60.0)
+    grab = Grabs()
+    first = cache.get('1', grab)
+    assert cv2.imdecode(np.frombuffer(first.data, np.uint8), cv2.IMREAD_COLOR).shape == (180, 320, 3)
+    grab.value = 200
+    assert cache.get('1', grab) == first
+    assert grab.calls == 1
+
+
+def test_etag_changes_only_with_the_picture():
+    cache = SnapshotCache(refresh=0.0)
+    grab = Grabs()
+    first = cache.get('1', grab)
+    assert cache.get('1', grab).etag == first.etag
+    grab.value = 200
+    assert cache.get('1', grab).etag != first.etag
+    assert grab.calls == 3
+
+
+def test_least_recently_used_previews_are_evicted_beyond_the_budget():
+    cache = SnapshotCache(refresh=60.0)
+    size = len(cache.get('probe', Grabs()).data)
+    cache = SnapshotCache(refresh=60.0, max_bytes=2 * size)
+    for camera_id in ('1', '2'):
+        cache.get(camera_id, Grabs())
+    cache.get('1', Grabs())  # Now the more recently used of the two
+    cache.get('3', Grabs())
+    assert cache.bytes == 2 * size
+    again = Grabs()
+    cache.get('1', again)
+    cache.get('3', again)
+    assert again.calls == 0
+    cache.get('2', again)
+    assert again.calls == 1
+
+
+def test_no_frame_drops_the_preview():
+    cache = SnapshotCache(refresh=0.0)
+    grab = Grabs()
+    assert cache.get('1', grab) is not None
+    grab.value = None
+    assert cache.get('1', grab) is None
+    assert cache.bytes == 0
+
+
+def test_others_get_the_previous_preview_while_one_is_made():
+    cache = SnapshotCache(refresh=0.0)
+    first = cache.get('1', Grabs())
+    grabbing, release = threading.Event(), threading.Event()
+
+    def slow_grab():
+        grabbing.set()
+        release.wait(2.0)
+        return frame(200)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(cache.get('1', slow_grab)))
+    thread.start()
+    assert grabbing.wait(2.0)
+    waiting = Grabs()
+    assert cache.get('1', waiting) == first and waiting.calls == 0
+    release.set()
+    thread.join(2.0)
+    assert results[0].etag != first.etag
+    cache.get('1', waiting)
+    assert waiting.calls == 1
@@ -0,0 +1,54 @@
+import threading
+
+import numpy as np
+
+from streaming import FrameBroadcaster, StreamProfile
+
+PROFILE = StreamProfile(quality=50, max_fps=60.0)
+
+
+def frame(value: int) -> np.ndarray:
+    return np.full((24, 32, 3), value, np.uint8)
+
+
+def test_frames_are_released_only_once_no_encode_reads_them():
+    rendering, finish = threading.Event(), threading.Event()
+
+    def slow_render(f, overlay):
+        rendering.set()
+        finish.wait(2.0)
+        return f
+
+    broadcaster = FrameBroadcaster(renderer=slow_render)
+    released = []
+    broadcaster.publish(frame(1), overlay='boxes', release=lambda: released.append(1))
+    results = []
+    encoder = threading.Thread(target=lambda: results.append(broadcaster.next(PROFILE, 0, timeout=2.0)))
+    encoder.start()
+    assert rendering.wait(2.0)
+
+    # Newer frames arrive while frame 1 is being encoded: it must stay with the encoder
+    broadcaster.publish(frame(2), release=lambda: released.append(2))
+    broadcaster.publish(frame(3), release=lambda: released.append(3))
+    assert released == [2]
+    finish.set()
+    encoder.join(2.0)
+    assert results[0][0] == 1
+    assert released == [2, 1]
+
+    broadcaster.close()
+    assert released == [2, 1, 3]
+
+
+def test_rendered_frame_is_shared_by_profiles():
+    renders = []
+
+    def render(f, overlay):
+        renders.append(overlay)
+        return f.copy()
+
+    broadcaster = FrameBroadcaster(renderer=render)
+    broadcaster.publish(frame(1), overlay='boxes')
+    assert broadcaster.latest(PROFILE) is not None
+    assert broadcaster.latest(PROFILE._replace(quality=90)) is not None
+    assert renders == ['boxes']
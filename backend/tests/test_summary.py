@@ -0,0 +1,16 @@
+from summary import BuildingSummary
+
+
+def test_build_overlapping_an_invalidate_is_not_cached():
+    summary = BuildingSummary(None, None, None, None, occupancy=None, ttl=60.0)
+
+    def stale():
+        summary.invalidate()  # A write commits while the rows are being read
+        return {'buildings': ['stale']}
+
+    builds = [stale, lambda: {'buildings': ['fresh']}, lambda: {'buildings': ['unused']}]
+    summary._build = lambda building_id: builds.pop(0)()
+    assert summary.get()[0] == {'buildings': ['stale']}
+    assert summary.get()[0] == {'buildings': ['fresh']}
+    assert summary.get()[0] == {'buildings': ['fresh']}
+    assert len(builds) == 1
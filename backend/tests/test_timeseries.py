@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from timeseries import TimeSeriesStore
+
+# 2026-01-01 00:00:00 UTC
+T0 = 1767225600.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TimeSeriesStore(str(tmp_path))
+
+
+def test_raw_records_only_changes(store):
+    store.record('room-1', 2, T0)
+    store.record('room-1', 2, T0 + 10)
+    store.record('room-1', 5, T0 + 20)
+    result = store.query('room-1', T0, T0 + 60, 'raw')
+    assert result['t'] == [T0, T0 + 20]
+    assert result['value'] == [2.0, 5.0]
+
+
+def test_rollups_are_time_weighted(store):
+    store.record('room-1', 0, T0)
+    store.record('room-1', 4, T0 + 45)  # 0 for 45s, then 4
+    store.tick(T0 + 60)
+    result = store.query('room-1', T0, T0 + 60, '1m')
+    assert result['t'] == [T0]
+    assert result['mean'] == [1.0]
+    assert (result['min'], result['max'], result['covered']) == ([0.0], [4.0], [60.0])
+
+
+def test_open_bucket_is_included_in_queries(store):
+    store.record('device-1', 1, T0)
+    store.tick(T0 + 30)
+    result = store.query('device-1', T0, T0 + 3600, '1h')
+    assert result['covered'] == [30.0]
+    assert result['mean'] == [1.0]
+
+
+def test_closed_buckets_are_flushed_to_disk(store, tmp_path):
+    store.record('device-1', 1, T0)
+    store.tick(T0 + 120)
+    assert store.flush() >= 3  # Raw sample plus two 1m buckets
+    assert os.path.exists(os.path.join(tmp_path, '1m', '2026-01-01', 'device-1.bin'))
+    reopened = TimeSeriesStore(str(tmp_path))
+    assert reopened.query('device-1', T0, T0 + 120, '1m')['covered'] == [60.0, 60.0]
+
+
+def test_open_buckets_survive_a_restart(tmp_path, monkeypatch):
+    clock = [T0]
+    monkeypatch.setattr('timeseries.time.time', lambda: clock[0])
+    first = TimeSeriesStore(str(tmp_path))
+    first.record('room-1', 1)
+    clock[0] = T0 + 1800
+    first.stop()
+
+    clock[0] = T0 + 1810
+    second = TimeSeriesStore(str(tmp_path))
+    second.record('room-1', 1)
+    second.tick(T0 + 3600)
+    second.flush()
+    result = second.query('room-1', T0, T0 + 3600, '1h')
+    assert result['t'] == [T0]
+    assert result['covered'] == [3590.0]
+
+
+def test_aggregate_sums_series(store):
+    store.record('device-1', 1, T0)
+    store.record('device-2', 1, T0 + 30)
+    store.tick(T0 + 60)
+    result = store.aggregate(['device-1', 'device-2', 'device-3'], T0, T0 + 60, '1m')
+    assert result['t'] == [T0]
+    assert result['integral'] == [90.0]
+    assert result['total'] == [2.0]
+
+
+def test_retention_drops_old_partitions(store, tmp_path):
+    store.record('room-1', 1, T0)
+    store.tick(T0 + 120)
+    store.flush()
+    store.enforce_retention(now=T0 + 8 * 86400)
+    assert not os.path.exists(os.path.join(tmp_path, 'raw', '2026-01-01'))
+    assert os.path.exists(os.path.join(tmp_path, '1m', '2026-01-01'))
+    assert store.query('room-1', T0, T0 + 3600, '15m')['covered'] == [120.0]
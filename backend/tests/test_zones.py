@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+import pytest
+
+from camera import CameraStream
+from decode import CameraSource
+from inference import DetectionConfig, Detections
+from occupancy import OccupancyEstimator, OccupancyPolicy
+from test_automation import NoCameras
+from zones import CameraZones, split_zone, zone_key
+
+# Left half of the picture, and a strip along the bottom of the right half
+ZONES = CameraZones.parse([
+    {'name': 'desk', 'polygon': [[0.0, 0.5], [0.5, 0.5], [0.5, 1.0], [0.0, 1.0]]},
+    {'name': 'door', 'polygon': [[0.5, 0.8], [0.75, 0.8], [0.75, 1.0], [0.5, 1.0]]},
+])
+
+
+def person(x, y_feet, width=10, height=30):
+    return [x - width / 2, y_feet - height, x + width / 2, y_feet]
+
+
+def test_parse_validates_and_round_trips():
+    assert CameraZones.parse(ZONES.to_json()) == ZONES
+    assert CameraZones.parse(None) is None and CameraZones.parse('') is None
+    for bad in ([{'name': 'a:b', 'polygon': [[0, 0], [1, 0], [1, 1]]}],
+                [{'name': 'a', 'polygon': [[0, 0], [1, 0]]}],
+                [{'name': 'a', 'polygon': [[0, 0], [1, 0], [1, 1.5]]}],
+                [{'name': 'a', 'polygon': [[0, 0], [1, 0], [1, 1]]}] * 2,
+                {'name': 'a'}):
+        with pytest.raises(ValueError):
+            CameraZones.parse(bad)
+
+
+def test_counts_people_by_where_they_stand():
+    boxes = [person(50, 190), person(130, 190), person(130, 150), person(60, 80)]
+    anywhere, counts = ZONES.count(boxes, 200, 200)
+    # The third box stands above the door strip; the fourth reaches into the desk zone but stands above it
+    assert counts == {'desk': 1, 'door': 1}
+    assert anywhere == 2
+    overlapping = CameraZones.parse(ZONES.to_json() + [{'name': 'all', 'polygon': [[0, 0], [1, 0], [1, 1], [0, 1]]}])
+    assert overlapping.count(boxes, 200, 200) == (4, {'desk': 1, 'door': 1, 'all': 4})
+    assert ZONES.count(np.zeros((0, 4)), 200, 200) == (0, {'desk': 0, 'door': 0})
+
+
+def test_bounds_cover_the_zones_plus_margin():
+    assert ZONES.bounds(200, 100) == (0, 50, 150, 100)
+    assert ZONES.bounds(200, 100, margin=0.2) == (0, 40, 180, 100)
+    assert split_zone(zone_key('12', 'desk')) == ('12', 'desk') and split_zone('12') == ('12', None)
+
+
+def test_stream_infers_on_the_crop_and_counts_per_zone():
+    counts = {}
+    stream = CameraStream('7', CameraSource('rtsp://cam', zones=ZONES), config=DetectionConfig(zone_margin=0.0),
+                          on_count=counts.__setitem__, occupancy=OccupancyPolicy(min_hits=1))
+    ring = stream._allocate_ring((100, 200, 3))
+    try:
+        index = ring.acquire()
+        with stream.lock:
+            stream.frame_ring_seq = ring.commit(index, time.time())
+            stream.frame_index, stream.frame, stream.frame_seq = index, ring.view(index), 1
+        seq, crop = stream.take_pending()
+        assert crop.shape == (50, 150, 3)
+        # Boxes come back in crop coordinates: one at the desk, one in the door strip, one in neither
+        detections = Detections(np.array([person(40, 45), person(120, 48), person(140, 10)], np.float32),
+                                np.ones(3, np.float32), np.zeros(3, np.int32))
+        stream.publish(crop, detections)
+        assert stream.output.shape == (100, 200, 3)
+        assert stream.detections.xyxy[0].tolist() == person(40, 95)
+        assert counts == {'7': 2, '7:desk': 1, '7:door': 1}
+
+        stream.set_zones(CameraSource('rtsp://cam', zones=CameraZones.parse([ZONES.to_json()[0]])))
+        assert counts['7:door'] == 0 and stream.zone_counts == {'desk': 1}
+    finally:
+        stream.stop()
+
+
+def test_zone_counts_are_smoothed_as_their_own_keys():
+    estimator = OccupancyEstimator(NoCameras(), OccupancyPolicy(window=0))
+    estimator.on_count('3', 2)
+    estimator.on_count('3:desk', 1)
+    assert estimator.room_of('3.1') == '3' and estimator.room_of('3:desk') == '3:desk'
+    occupancy = estimator.get_occupancy('3')
+    assert occupancy['person_count'] == 2
+    assert occupancy['zones'] == {'desk': {'person_count': 1, 'confidence': 1.0}}
+
@@ -0,0 +1,383 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Raw samples: the value a series changed to and when
+RAW_DTYPE = np.dtype([('t', '<f8'), ('v', '<f4')])
+# One closed bucket: seconds covered by data, time integral of the value, extremes
+ROLLUP_DTYPE = np.dtype([('t', '<f8'), ('covered', '<f4'), ('sum', '<f8'), ('min', '<f4'), ('max', '<f4')])
+
+RESOLUTIONS = {'1m': 60, '15m': 900, '1h': 3600}
+# Levels stored as one file per UTC day so retention is a directory delete
+PARTITIONED = ('raw', '1m')
+
+
+def _day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+
+class _Bucket:
+    __slots__ = ('start', 'covered', 'sum', 'min', 'max')
+
+    def __init__(self, start: float, value: float):
+        self.start = start
+        self.covered = 0.0
+        self.sum = 0.0
+        self.min = value
+        self.max = value
+
+    def record(self) -> tuple:
+        return (self.start, self.covered, self.sum, self.min, self.max)
+
+
+class _Series:
+    """Write-side state of one series: its current value and open rollup buckets."""
+
+    __slots__ = ('value', 'cursor', 'buckets')
+
+    def __init__(self):
+        self.value: Optional[float] = None
+        self.cursor = 0.0
+        self.buckets: Dict[str, _Bucket] = {}
+
+
+class TimeSeriesStore:
+    """Append-only store for step-valued series such as room occupancy and device on/off.
+
+    A series only records the value it changes to; between samples the value
+    holds. Raw samples go to fixed-size binary records, one file per series
+    per day. Every sample (and a periodic tick) integrates the held value into
+    1m/15m/1h buckets, so a bucket's mean is time-weighted and, for a 0/1
+    device series, ``sum`` is the seconds the device was on. Closed buckets
+    are appended to the rollup files; the open ones are served from memory and
+    written as partial records on ``stop``, which reads merge with the rest.
+
+    Raw samples and 1m buckets expire after their retention period, 15m and
+    1h buckets are kept. Range queries memory-map the level that fits the
+    requested span and binary-search it, so a year of hourly buckets for a
+    building reads a few hundred kilobytes rather than scanning raw rows.
+    """
+
+    RETENTION_CHECK = 3600.0
+
+    def __init__(self, root: str, raw_retention_days: float = 7, minute_retention_days: float = 30,
+                 flush_interval: float = 5.0):
+        self.root = root
+        self.retention = {'raw': raw_retention_days * 86400, '1m': minute_retention_days * 86400}
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        # Serializes file appends with query reads, so a query never sees a record twice;
+        # writers (count and automation listeners) only ever wait for ``_lock``
+        self._flush_lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+        # (level, series) -> records not yet written
+        self._pending: Dict[Tuple[str, str], list] = {}
+        self._last_retention = 0.0
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._flush_loop, name="timeseries-flush", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=5.0)
+        self.tick()
+        with self._lock:
+            # Persist the elapsed part of every open bucket; what follows after a restart is
+            # written as a second record with the same ``t`` and merged when read
+            for series, state in self._series.items():
+                for name, bucket in state.buckets.items():
+                    if bucket.covered > 0:
+                        self._pending.setdefault((name, series), []).append(bucket.record())
+                        state.buckets[name] = _Bucket(bucket.start, state.value)
+        self.flush()
+
+    # Writers
+
+    def record(self, series: str, value: float, timestamp: Optional[float] = None):
+        """Record that ``series`` changed to ``value``; repeated values are ignored."""
+        timestamp = time.time() if timestamp is None else timestamp
+        value = float(value)
+        with self._lock:
+            state = self._series.get(series)
+            if state is None:
+                state = self._series[series] = _Series()
+            if state.value == value:
+                return
+            if state.value is not None:
+                if timestamp < state.cursor:
+                    timestamp = state.cursor  # Clock went backwards; keep the series ordered
+                self._advance(series, state, timestamp)
+            state.value = value
+            state.cursor = timestamp
+            for name, seconds in RESOLUTIONS.items():
+                bucket = self._bucket(series, state, name, seconds, timestamp)
+                bucket.min = min(bucket.min, value)
+                bucket.max = max(bucket.max, value)
+            self._pending.setdefault(('raw', series), []).append((timestamp, value))
+            self.samples += 1
+
+    def seed(self, values: Dict[str, float]):
+        """Start series that have no value yet (e.g. device states read at startup)."""
+        with self._lock:
+            for series, value in values.items():
+                state = self._series.get(series)
+                if state is None or state.value is None:
+                    self.record(series, value)
+
+    def on_count(self, camera_id: str, person_count: int):
+        """``OccupancyEstimator`` count listener, keyed by room id."""
+        self.record(f"room-{camera_id}", person_count)
+
+    def _advance(self, series: str, state: _Series, until: float):
+        """Integrate the held value from the series cursor up to ``until``."""
+        for name, seconds in RESOLUTIONS.items():
+            t = state.cursor
+            while t < until:
+                bucket = self._bucket(series, state, name, seconds, t)
+                end = min(until, bucket.start + seconds)
+                bucket.covered += end - t
+                bucket.sum += state.value * (end - t)
+                t = end
+        state.cursor = until
+
+    def _bucket(self, series: str, state: _Series, name: str, seconds: int, timestamp: float) -> _Bucket:
+        """Open bucket of ``name`` containing ``timestamp``, closing the previous one if needed."""
+        start = timestamp // seconds * seconds
+        bucket = state.buckets.get(name)
+        if bucket is not None and bucket.start == start:
+            return bucket
+        if bucket is not None and bucket.covered > 0:
+            self._pending.setdefault((name, series), []).append(bucket.record())
+        bucket = state.buckets[name] = _Bucket(start, state.value)
+        return bucket
+
+    def tick(self, now: Optional[float] = None):
+        """Carry every series up to ``now`` so finished buckets get closed and written."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for series, state in self._series.items():
+                if state.value is None or now <= state.cursor:
+                    continue
+                self._advance(series, state, now)
+                for name, seconds in RESOLUTIONS.items():
+                    self._bucket(series, state, name, seconds, now)
+
+    # Persistence
+
+    def _path(self, level: str, series: str, timestamp: float = 0.0) -> str:
+        # Zone series (``room-12:desk``): ':' is not allowed in Windows file names
+        series = series.replace(':', '@')
+        if level in PARTITIONED:
+            return os.path.join(self.root, level, _day(timestamp), f"{series}.bin")
+        return os.path.join(self.root, level, f"{series}.bin")
+
+    def flush(self) -> int:
+        """Append pending records to their files; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            written = 0
+            for (level, series), records in pending.items():
+                dtype = RAW_DTYPE if level == 'raw' else ROLLUP_DTYPE
+                array = np.array(records, dtype=dtype)
+                if level in PARTITIONED:
+                    days = np.array([_day(t) for t in array['t']])
+                    groups = [(array[days == day], float(array['t'][days == day][0])) for day in np.unique(days)]
+                else:
+                    groups = [(array, 0.0)]
+                for group, first in groups:
+                    path = self._path(level, series, first)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, 'ab') as f:
+                        self._align(f, dtype)
+                        f.write(group.tobytes())
+                written += len(array)
+            return written
+
+    @staticmethod
+    def _align(f, dtype: np.dtype):
+        """Drop a torn trailing record left by a crash mid-write."""
+        size = f.seek(0, os.SEEK_END)
+        if size % dtype.itemsize:
+            f.truncate(size - size % dtype.itemsize)
+
+    def enforce_retention(self, now: Optional[float] = None):
+        """Delete day partitions of raw samples and 1m buckets older than their retention."""
+        now = time.time() if now is None else now
+        for level, seconds in self.retention.items():
+            if not seconds:
+                continue
+            cutoff = _day(now - seconds)
+            directory = os.path.join(self.root, level)
+            if not os.path.isdir(directory):
+                continue
+            for day in os.listdir(directory):
+                if day < cutoff:
+                    shutil.rmtree(os.path.join(directory, day), ignore_errors=True)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.tick()
+                self.flush()
+                if time.monotonic() - self._last_retention > self.RETENTION_CHECK:
+                    self._last_retention = time.monotonic()
+                    self.enforce_retention()
+            except Exception as e:
+                print(f"Time-series flush failed: {e}")
+
+    # Queries
+
+    @staticmethod
+    def pick_resolution(start: float, end: float) -> str:
+        span = end - start
+        if span <= 6 * 3600:
+            return '1m'
+        if span <= 14 * 86400:
+            return '15m'
+        return '1h'
+
+    def _read(self, level: str, series: str, start: float, end: float) -> np.ndarray:
+        dtype = RAW_DTYPE if level == 'raw' else ROLLUP_DTYPE
+        if level in PARTITIONED:
+            paths = []
+            day = datetime.fromtimestamp(start, timezone.utc).date()
+            last = datetime.fromtimestamp(end, timezone.utc).date()
+            while day <= last:
+                paths.append(self._path(level, series, datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()))
+                day += timedelta(days=1)
+        else:
+            paths = [self._path(level, series)]
+        chunks = []
+        for path in paths:
+            try:
+                count = os.path.getsize(path) // dtype.itemsize
+            except OSError:
+                continue
+            if not count:
+                continue
+            records = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+            # Only the pages touched by the binary search and the slice are read
+            lo, hi = np.searchsorted(records['t'], [start, end], side='left')
+            if hi > lo:
+                chunks.append(np.array(records[lo:hi]))
+            del records
+        if not chunks:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(chunks)
+
+    def _unwritten(self, level: str, series: str, start: float, end: float) -> np.ndarray:
+        """Records in ``[start, end)`` not on disk yet: pending ones and the open bucket."""
+        dtype = RAW_DTYPE if level == 'raw' else ROLLUP_DTYPE
+        with self._lock:
+            records = [r for r in self._pending.get((level, series), ()) if start <= r[0] < end]
+            state = self._series.get(series)
+            bucket = state.buckets.get(level) if state is not None and level != 'raw' else None
+            if bucket is not None and bucket.covered > 0 and start <= bucket.start < end:
+                records.append(bucket.record())
+        return np.array(records, dtype=dtype)
+
+    @staticmethod
+    def _merge(records: np.ndarray) -> np.ndarray:
+        """Combine rollup records of the same bucket, e.g. the parts written before and after a restart."""
+        if len(records) < 2:
+            return records
+        records = np.sort(records, order='t', kind='stable')
+        starts, index = np.unique(records['t'], return_index=True)
+        if len(starts) == len(records):
+            return records
+        merged = np.zeros(len(starts), dtype=ROLLUP_DTYPE)
+        merged['t'] = starts
+        merged['covered'] = np.add.reduceat(records['covered'], index)
+        merged['sum'] = np.add.reduceat(records['sum'], index)
+        merged['min'] = np.minimum.reduceat(records['min'], index)
+        merged['max'] = np.maximum.reduceat(records['max'], index)
+        return merged
+
+    def query(self, series: str, start: float, end: float, resolution: Optional[str] = None) -> dict:
+        """Columns for ``series`` in ``[start, end)``.
+
+        ``raw`` returns the change points (``t``, ``value``); rollup levels
+        return ``t``, ``mean``, ``min``, ``max`` and ``covered`` per bucket,
+        including the bucket still being filled.
+        """
+        resolution = resolution or self.pick_resolution(start, end)
+        if resolution != 'raw' and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        with self._flush_lock:
+            unwritten = self._unwritten(resolution, series, start, end)
+            records = np.concatenate([self._read(resolution, series, start, end), unwritten])
+        if resolution == 'raw':
+            return {'series': series, 'resolution': 'raw',
+                    't': records['t'].tolist(), 'value': records['v'].tolist()}
+        return dict(self._rollup_columns(self._merge(records)), series=series, resolution=resolution)
+
+    @staticmethod
+    def _rollup_columns(records: np.ndarray) -> dict:
+        covered = records['covered'].astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(covered > 0, records['sum'] / covered, np.nan)
+        return {
+            't': records['t'].tolist(),
+            'mean': [None if np.isnan(m) else round(float(m), 4) for m in mean],
+            'min': records['min'].tolist(),
+            'max': records['max'].tolist(),
+            'covered': covered.tolist(),
+        }
+
+    def aggregate(self, series: Iterable[str], start: float, end: float,
+                  resolution: Optional[str] = None) -> dict:
+        """Bucket-wise totals over several series.
+
+        ``total`` is the sum of the series' time-weighted means (e.g. people in
+        a building); ``integral`` is the sum of the value-seconds (e.g. device
+        on-seconds).
+        """
+        resolution = resolution or self.pick_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        times: List[np.ndarray] = []
+        means: List[np.ndarray] = []
+        sums: List[np.ndarray] = []
+        series = list(series)
+        for name in series:
+            with self._flush_lock:
+                unwritten = self._unwritten(resolution, name, start, end)
+                records = self._merge(np.concatenate([self._read(resolution, name, start, end), unwritten]))
+            if not len(records):
+                continue
+            covered = records['covered'].astype(np.float64)
+            times.append(records['t'])
+            means.append(np.divide(records['sum'], covered, out=np.zeros(len(records)), where=covered > 0))
+            sums.append(records['sum'])
+        if not times:
+            return {'resolution': resolution, 'series': len(series), 't': [], 'total': [], 'integral': []}
+        buckets, inverse = np.unique(np.concatenate(times), return_inverse=True)
+        total = np.bincount(inverse, weights=np.concatenate(means), minlength=len(buckets))
+        integral = np.bincount(inverse, weights=np.concatenate(sums), minlength=len(buckets))
+        return {
+            'resolution': resolution,
+            'series': len(series),
+            't': buckets.tolist(),
+            'total': np.round(total, 4).tolist(),
+            'integral': np.round(integral, 1).tolist(),
+        }
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'samples': self.samples,
+                'pending_records': sum(len(records) for records in self._pending.values()),
+            }
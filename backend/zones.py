@@ -0,0 +1,127 @@
+import json
+import re
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Count keys of zones: ``<camera_id>:<zone>``, e.g. ``12:desk`` for zone "desk" of room 12's camera
+ZONE_SEPARATOR = ':'
+# Zone names end up in count keys, series names and URLs; '.' would read as an extra camera
+_ZONE_NAME = re.compile(r'[A-Za-z0-9_-]{1,32}')
+
+
+def zone_key(camera_id: str, zone: str) -> str:
+    return f"{camera_id}{ZONE_SEPARATOR}{zone}"
+
+
+def split_zone(key: str) -> Tuple[str, Optional[str]]:
+    """``(camera_id, zone)`` of a count key; zone is None for a whole camera."""
+    camera_id, _, zone = key.partition(ZONE_SEPARATOR)
+    return camera_id, zone or None
+
+
+def resolve_zone(value, room_id, zones_of: Callable[[str], Optional['CameraZones']]) -> Optional[str]:
+    """The zone key a device binds to: ``"desk"`` for a zone of its room's camera, ``"12:desk"`` for room 12's.
+
+    ``zones_of(room_id)`` returns a room's zones (None for no zones or no
+    room). None for no zone; raises ValueError for a zone that does not exist.
+    """
+    if not value:
+        return None
+    value = str(value)
+    owner, zone = split_zone(value) if ZONE_SEPARATOR in value else (str(room_id), value)
+    zones = zones_of(owner) if owner.isdigit() else None
+    if zone is None or zones is None or zone not in zones.names:
+        raise ValueError(f"No camera zone {value}")
+    return zone_key(owner, zone)
+
+
+def _inside(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Even-odd test of ``(N, 2)`` points against one ``(M, 2)`` polygon, all points at once."""
+    x, y = points[:, :1], points[:, 1:]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        at = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(crosses & (x < at), axis=1) % 2 == 1
+
+
+class Zone(NamedTuple):
+    """A named area of a camera's picture; ``polygon`` points are fractions (0..1) of its width and height."""
+    name: str
+    polygon: Tuple[Tuple[float, float], ...]
+
+
+class CameraZones(NamedTuple):
+    """The zones of one camera.
+
+    Coordinates are fractions of the frame, so the same zones fit the
+    inference sub-stream, the main stream and any decode size. A person is
+    in a zone when the bottom centre of their box (where they stand) is,
+    so someone leaning over a desk from the corridor does not count.
+    """
+    zones: Tuple[Zone, ...]
+
+    @classmethod
+    def parse(cls, value) -> Optional['CameraZones']:
+        """Zones from ``[{"name": ..., "polygon": [[x, y], ...]}, ...]`` (or its JSON); raises ValueError."""
+        if isinstance(value, str):
+            value = json.loads(value) if value.strip() else None
+        if not value:
+            return None
+        if not isinstance(value, list):
+            raise ValueError('camera_zones must be a list of zones')
+        zones = []
+        for item in value:
+            if not isinstance(item, dict):
+                raise ValueError('Each zone must be an object with a name and a polygon')
+            name, polygon = item.get('name'), item.get('polygon')
+            if not isinstance(name, str) or not _ZONE_NAME.fullmatch(name):
+                raise ValueError('Zone names must be 1-32 letters, digits, "-" or "_"')
+            if any(zone.name == name for zone in zones):
+                raise ValueError(f"Duplicate zone name: {name}")
+            try:
+                points = tuple((float(x), float(y)) for x, y in polygon)
+            except (TypeError, ValueError):
+                raise ValueError(f"Polygon of zone {name} must be a list of [x, y] points") from None
+            if len(points) < 3:
+                raise ValueError(f"Polygon of zone {name} needs at least 3 points")
+            if not all(0.0 <= c <= 1.0 for point in points for c in point):
+                raise ValueError(f"Polygon of zone {name} must use fractions of the frame (0 to 1)")
+            zones.append(Zone(name, points))
+        return cls(tuple(zones))
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(zone.name for zone in self.zones)
+
+    def to_json(self) -> list:
+        return [{'name': zone.name, 'polygon': [list(point) for point in zone.polygon]} for zone in self.zones]
+
+    def bounds(self, width: int, height: int, margin: float = 0.0) -> Tuple[int, int, int, int]:
+        """Pixel box ``(x0, y0, x1, y1)`` around all zones, grown by ``margin`` of its size on each side.
+
+        The margin keeps whole people in the crop: someone standing in a
+        zone near its top edge has their head above it.
+        """
+        xs = [x for zone in self.zones for x, _ in zone.polygon]
+        ys = [y for zone in self.zones for _, y in zone.polygon]
+        left, right, top, bottom = min(xs), max(xs), min(ys), max(ys)
+        grow_x, grow_y = (right - left) * margin, (bottom - top) * margin
+        x0, x1 = int(max(left - grow_x, 0.0) * width), int(np.ceil(min(right + grow_x, 1.0) * width))
+        y0, y1 = int(max(top - grow_y, 0.0) * height), int(np.ceil(min(bottom + grow_y, 1.0) * height))
+        return x0, y0, max(x1, x0 + 1), max(y1, y0 + 1)
+
+    def count(self, boxes: np.ndarray, width: int, height: int) -> Tuple[int, Dict[str, int]]:
+        """People standing in any zone, and in each zone, of ``(N, 4)`` boxes on a ``width`` x ``height`` frame."""
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        feet = np.stack([(boxes[:, 0] + boxes[:, 2]) / (2 * width), boxes[:, 3] / height], axis=1)
+        anywhere = np.zeros(len(boxes), bool)
+        counts = {}
+        for zone in self.zones:
+            inside = _inside(feet, np.asarray(zone.polygon, np.float32))
+            counts[zone.name] = int(np.count_nonzero(inside))
+            anywhere |= inside
+        return int(np.count_nonzero(anywhere)), counts
+
@@ -19,13 +19,16 @@
 #define EEPROM_SIZE 128      // Increased to accommodate both hardware ID and IP
 #define HARDWARE_ID_ADDR 0
 #define IP_ADDRESS_ADDR 64   // Start address for IP in EEPROM
-#define STATUS_CHECK_INTERVAL 5000  // 5 seconds
+#define STATUS_CHECK_INTERVAL 5000  // 5 seconds, used when the backend does not support long polling
+#define LONG_POLL_WAIT 25           // Seconds the backend may hold a status request open
 
 // WiFi and server settings
 char serverUrl[64];  // Will be constructed from IP
 char backendIp[IP_ADDRESS_LENGTH] = "192.168.1.22";  // Default IP
 char hardwareId[HARDWARE_ID_LENGTH + 1] = "";
 unsigned long lastStatusCheck = 0;
+long stateVersion = -1;             // Last state version reported by the backend
+bool longPolling = false;           // True while the backend answers long polls
 
 // WiFiManager instance
 WiFiManager wifiManager;
@@ -149,7 +152,9 @@ void setup() {
 }
 
 void loop() {
-  if (millis() - lastStatusCheck > STATUS_CHECK_INTERVAL) {
+  // Long polls return as soon as the state changes, so re-issue them right away;
+  // after an error or against an older backend fall back to the fixed interval
+  if (longPolling || millis() - lastStatusCheck > STATUS_CHECK_INTERVAL) {
     checkDeviceStatus();
     lastStatusCheck = millis();
   }
@@ -249,6 +254,7 @@ void checkDeviceStatus() {
   Serial.println("\n--- Checking device status ---");
   Serial.print("WiFi status: ");
   Serial.println(WiFi.status() == WL_CONNECTED ? "Connected" : "Disconnected");
+  longPolling = false;  // Set again below once a response carries a version
   
   if (WiFi.status() != WL_CONNECTED) {
     digitalWrite(STATUS_LED, LOW); // Turn off connection LED
@@ -269,14 +275,15 @@ void checkDeviceStatus() {
   }
 
   // Create the URL for the API request
-  String url = String(serverUrl) + "/api/device/status?hardware_id=" + String(hardwareId);
+  String url = String(serverUrl) + "/api/device/status?hardware_id=" + String(hardwareId) +
+               "&wait=" + String(LONG_POLL_WAIT) + "&version=" + String(stateVersion);
   Serial.print("Requesting URL: ");
   Serial.println(url);
   
   // Make the HTTP GET request
   HTTPClient http;
   http.setConnectTimeout(5000);  // 5 second timeout
-  http.setTimeout(5000);        // 5 second timeout
+  http.setTimeout((LONG_POLL_WAIT + 5) * 1000);  // The backend may hold the request for LONG_POLL_WAIT
   
   bool httpBegin = http.begin(url);
   if (!httpBegin) {
@@ -326,6 +333,10 @@ void checkDeviceStatus() {
         if (deviceHwId && strcmp(deviceHwId, hardwareId) == 0) {
           deviceFound = true;
           bool shouldBeEnabled = device["is_enabled"];
+          if (device.containsKey("version")) {
+            stateVersion = device["version"];
+            longPolling = true;
+          }
           bool currentState = (digitalRead(RELAY_PIN) == LOW); // LOW means ON in our inverted logic
           
           Serial.print("Device match! Current state: ");
@@ -127,6 +127,9 @@ const BuildingNavigation = ({ onLogout }) => {
   const [buildingSearchTerm, setBuildingSearchTerm] = useState("")
   const [buildingSortOption, setBuildingSortOption] = useState("az")
 
+  // Added to the room preview URLs to reload them
+  const [previewTick, setPreviewTick] = useState(Date.now())
+
   // Mock energy data for dashboard
   const energyData = {
     totalConsumption: 3230,
@@ -151,6 +154,12 @@ const BuildingNavigation = ({ onLogout }) => {
     fetchBuildings()
   }, [])
 
+  // Reload the room previews; the backend remakes each one every few seconds at most
+  useEffect(() => {
+    const interval = setInterval(() => setPreviewTick(Date.now()), 10000)
+    return () => clearInterval(interval)
+  }, [])
+
   // When buildings load, set selected building and fetch its rooms
   useEffect(() => {
     if (buildings.length > 0) {
@@ -166,33 +175,14 @@ const BuildingNavigation = ({ onLogout }) => {
     }
   }, [buildings]);
 
-  // Fetch rooms for a building
+  // Fetch rooms for a building, with device counts, in a single request
   const fetchRooms = (building) => {
     axios
-      .get(`http://localhost:5000/api/buildings/${building.id}/rooms`)
+      .get(`http://localhost:5000/api/buildings/${building.id}/summary`)
       .then((response) => {
-        // Get device counts for each room
-        const roomsWithDeviceCounts = response.data
-
-        // Create an array of promises to fetch device counts
-        const deviceCountPromises = roomsWithDeviceCounts.map((room) =>
-          axios
-            .get(`http://localhost:5000/api/rooms/${room.id}/devices`)
-            .then((devicesResponse) => ({
-              ...room,
-              devices_count: devicesResponse.data.length,
-            }))
-            .catch((error) => {
-              console.error(`Error fetching devices for room ${room.id}:`, error)
-              return { ...room, devices_count: 0 }
-            }),
-        )
-
-        // Wait for all device count requests to complete
-        Promise.all(deviceCountPromises).then((roomsWithCounts) => {
-          setRooms(roomsWithCounts)
-          setSelectedBuilding(building)
-        })
+        const [summary] = response.data.buildings
+        setRooms(summary ? summary.rooms : [])
+        setSelectedBuilding(building)
       })
       .catch((error) => {
         console.error("Error fetching rooms:", error)
@@ -742,6 +732,17 @@ const BuildingNavigation = ({ onLogout }) => {
                           </div>
                         </div>
                         <div className="room-content">
+                          {room.live_camera && (
+                            <img
+                              className="room-preview"
+                              src={`http://localhost:5000/api/camera/snapshot/${room.id}?t=${previewTick}`}
+                              alt=""
+                              loading="lazy"
+                              onLoad={(e) => { e.currentTarget.style.visibility = "visible" }}
+                              // 204 while the room's camera is closed: no picture, so the preview stays hidden
+                              onError={(e) => { e.currentTarget.style.visibility = "hidden" }}
+                            />
+                          )}
                           <div className="room-detail">
                             <span className="detail-label">Camera:</span>
                             <span className="detail-value">{room.live_camera || "No camera"}</span>
@@ -72,6 +72,7 @@ const DevicesPage = () => {
   const [loading, setLoading] = useState(true)
   const [cameraAvailable, setCameraAvailable] = useState(false)
   const [cameraLoading, setCameraLoading] = useState(true)
+  const [cameraConfigured, setCameraConfigured] = useState(false)
   const [cameraError, setCameraError] = useState(null)
   const [cameraUrl, setCameraUrl] = useState("")
 
@@ -122,20 +123,46 @@ const DevicesPage = () => {
     }
   }, [cameraAvailable, cameraUrl, roomId])
 
-  // Poll devices state every 2 seconds to update toggles in real time
+  // Subscribe to device changes of this room to update toggles in real time
   useEffect(() => {
     if (!roomId) return
     let isMounted = true
-    const interval = setInterval(() => {
+
+    const refetchDevices = () => {
       axios.get(`http://localhost:5000/api/rooms/${roomId}/devices`).then((res) => {
         if (isMounted && Array.isArray(res.data)) {
           setDevices(res.data)
         }
       })
-    }, 2000)
+    }
+
+    const events = new EventSource(`http://localhost:5000/api/events/devices?room_id=${roomId}`)
+    events.onmessage = (message) => {
+      const event = JSON.parse(message.data)
+      if (event.type === "device") {
+        // State flips carry the new values, so patch the toggle in place
+        setDevices((prev) =>
+          prev.map((d) =>
+            d.id === event.id
+              ? {
+                  ...d,
+                  is_enabled: event.is_enabled,
+                  ...(event.is_manual !== undefined && { is_manual: event.is_manual }),
+                }
+              : d,
+          ),
+        )
+      } else {
+        // Devices added/removed, or we fell behind: reload the list once
+        refetchDevices()
+      }
+    }
+    // The browser reconnects on its own; refetch so nothing missed while offline is lost
+    events.onopen = refetchDevices
+
     return () => {
       isMounted = false
-      clearInterval(interval)
+      events.close()
     }
   }, [roomId])
 
@@ -155,16 +182,22 @@ const DevicesPage = () => {
   // Check camera status when room changes
   useEffect(() => {
     let isMounted = true
+    let retry = null
 
     const checkCameraStatus = async () => {
       if (!roomId) return
 
       try {
-        setCameraLoading(true)
+        if (retry === null) setCameraLoading(true)
         const response = await axios.get(`http://localhost:5000/api/camera/status/${roomId}`)
         if (isMounted) {
           setCameraAvailable(response.data.available)
           setCameraUrl(response.data.camera_url || "")
+          setCameraConfigured(Boolean(response.data.has_camera))
+          // Cameras are opened in the background; ask again until this one is live
+          if (response.data.has_camera && !response.data.available) {
+            retry = setTimeout(checkCameraStatus, 2000)
+          }
         }
       } catch (error) {
         console.error("Error checking camera status:", error)
@@ -184,6 +217,7 @@ const DevicesPage = () => {
     // Cleanup function
     return () => {
       isMounted = false
+      clearTimeout(retry)
     }
   }, [roomId])
 
@@ -261,38 +295,23 @@ const DevicesPage = () => {
   // Add a new device
   const addDevice = async () => {
     try {
-      // First, check if device with this hardware ID exists
-      const checkResponse = await axios.get(
-        `http://localhost:5000/api/device/status?hardware_id=${newDevice.hardware_id}`,
-      )
-
-      let device
-
-      if (checkResponse.data && checkResponse.data.length > 0) {
-        // Device exists, update it
-        const existingDevice = checkResponse.data[0]
-        const updateResponse = await axios.put(`http://localhost:5000/api/devices/${existingDevice.id}`, {
-          ...existingDevice,
-          name: newDevice.name || existingDevice.name,
-          room_id: Number.parseInt(roomId),
-          is_enabled: newDevice.is_enabled,
-          persons_before_enabled: Number.parseInt(newDevice.persons_before_enabled) || 1,
-          delay_before_enabled: Number.parseInt(newDevice.delay_before_enabled) || 0,
-          delay_before_disabled: Number.parseInt(newDevice.delay_before_disabled) || 0,
-          is_manual: !!newDevice.is_manual,
-        })
-        device = updateResponse.data.device
-      } else {
-        // Create new device
-        const response = await axios.post(`http://localhost:5000/api/rooms/${roomId}/devices`, {
-          ...newDevice,
-          hardware_id: newDevice.hardware_id, // Keep as string
-          persons_before_enabled: Number.parseInt(newDevice.persons_before_enabled) || 1,
-          delay_before_enabled: Number.parseInt(newDevice.delay_before_enabled) || 0,
-          delay_before_disabled: Number.parseInt(newDevice.delay_before_disabled) || 0,
-          is_manual: !!newDevice.is_manual,
-        })
-        device = response.data
+      // Creates the device, or moves an existing one with this hardware ID into the room
+      const response = await axios.post("http://localhost:5000/api/devices/bulk", {
+        room_id: Number.parseInt(roomId),
+        devices: [
+          {
+            ...newDevice,
+            hardware_id: newDevice.hardware_id, // Keep as string
+            persons_before_enabled: Number.parseInt(newDevice.persons_before_enabled) || 1,
+            delay_before_enabled: Number.parseInt(newDevice.delay_before_enabled) || 0,
+            delay_before_disabled: Number.parseInt(newDevice.delay_before_disabled) || 0,
+            is_manual: !!newDevice.is_manual,
+          },
+        ],
+      })
+      const [result] = response.data.results
+      if (result.status === "error") {
+        throw new Error(result.message)
       }
 
       // Refresh devices list
@@ -463,6 +482,8 @@ const DevicesPage = () => {
                 )}
               </div>
               <div className="card-content">
+                {/* Neither the status nor snapshots open a camera; a feed viewer does, so connect one while waiting */}
+                {cameraConfigured && !cameraAvailable && <img src={cameraFeedUrl} alt="" hidden />}
                 {cameraLoading ? (
                   <div className="camera-loading">
                     <div className="spinner"></div>